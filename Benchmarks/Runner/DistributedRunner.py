@@ -0,0 +1,249 @@
+import asyncio
+import heapq
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import socket
+import time
+
+from OpenLoopEngine import OpenLoopEngine
+from WorkloadStream import open_workload, worker_events
+from LatencyHistogram import HdrHistogram, LatencyReporter, merge_intervals
+from ResultStore import ResultWriter, concat_results
+from RequestMix import RequestMix
+
+# Multi-process and multi-host open-loop Runner.
+# The events of a workload are split deterministically among the workers (event i of the time-ordered workload goes
+# to worker i % workers). Every worker is a process running an OpenLoopEngine; all the workers start at a shared
+# barrier timestamp (Unix time, the hosts are expected to have NTP-synchronized clocks) and keep their own counters.
+# Each worker writes its per-request records sorted by timestamp, then the records are merged in timestamp order in
+# a single result file and the counters are summed.
+# Hosts are coordinated over a TCP control channel of JSON lines: the agents connect to the coordinator, receive the
+# runs to execute and send back their summaries followed by their (merged) records.
+
+RECORD_FORMAT = "{} \t {:.3f} \t {} \t {} \t {}"  # timestamp, latency, status, processed, pending
+
+
+def record_time(line):
+    return int(line.split("\t", 1)[0])
+
+
+class RecordWriter(object):
+    # writes the per-request records of an engine in send-time order with bounded memory: records arrive in
+    # completion order, and a record is written once it is older than the request timeout, since all the requests
+    # sent before then are complete
+    def __init__(self, f, timeout, worker=None):
+        self.f = f
+        self.delay_ms = (timeout + 1) * 1000
+        self.suffix = f" \t {worker}\n" if worker is not None else "\n"
+        self.window = list()
+        self.seq = 0
+
+    def write(self, now_ms, latency_ms, status_code, processed, pending, event=None):
+        heapq.heappush(self.window, (now_ms, self.seq, RECORD_FORMAT.format(now_ms, latency_ms, status_code, processed, pending)))
+        self.seq += 1
+        while self.window[0][0] < now_ms - self.delay_ms:
+            self.f.write(heapq.heappop(self.window)[2] + self.suffix)
+
+    def close(self):
+        while self.window:
+            self.f.write(heapq.heappop(self.window)[2] + self.suffix)
+
+
+def open_records(records_file, result_params, timeout, worker=None):
+    # file and writer of the per-request records: text lines in send-time order or columnar batches
+    if result_params["format"] == "columnar":
+        f = open(records_file, "wb")
+        return f, ResultWriter(f, worker if worker is not None else 0, result_params["batch_size"])
+    f = open(records_file, "w")
+    return f, RecordWriter(f, timeout, worker)
+
+
+def merge_results(files, output_file, result_params):
+    if result_params["format"] == "columnar":
+        concat_results(files, output_file)
+    else:
+        merge_records(files, output_file)
+
+
+def run_worker(worker, workers, workload_file, ms_access_gateway, params, start_at, records_file, summaries):
+    # params: "open_loop", "latency_report", "result_output" and "request_mix" parameters of the Runner
+    # progress lines are printed by the first worker only, the latency histograms of the workers are merged at the end
+    open_loop_params = params["open_loop"]
+    latency_params = params["latency_report"]
+    mix_params = dict(params["request_mix"])
+    if mix_params.get("seed") is not None:
+        mix_params["seed"] += worker
+    reporter = LatencyReporter(latency_params["interval"], verbose=(worker == 0), keep_intervals=True)
+    f, records = open_records(records_file, params["result_output"], open_loop_params["timeout"], worker)
+    with f:
+        engine = OpenLoopEngine(ms_access_gateway, max_in_flight=open_loop_params["max_in_flight"],
+                                connections=open_loop_params["connections"], timeout=open_loop_params["timeout"],
+                                on_result=records.write if latency_params["raw_records"] else None,
+                                verbose=(worker == 0), reporter=reporter, request_mix=RequestMix(mix_params))
+        events = worker_events(open_workload(workload_file, open_loop_params["lookahead"]), worker, workers)
+        run_duration_sec = asyncio.run(engine.run(events, start_at=start_at))
+        records.close()
+    reporter.close()
+    summaries.put({"worker": worker,
+                   "run_duration_sec": run_duration_sec,
+                   "total_requests": engine.processed_requests,
+                   "processed_requests": engine.processed_requests,
+                   "error_requests": engine.error_requests,
+                   "timing_error_requests": engine.timing_error_requests,
+                   "latency_sum_ms": engine.latency_sum_ms,
+                   "lag_stats": engine.lag_stats,
+                   "latency_intervals": [(interval_start, h.encode(), c.encode())
+                                         for interval_start, h, c in reporter.intervals]})
+
+
+def run_local(first_worker, processes, workers, workload_file, ms_access_gateway, params, start_at, records_path):
+    # runs the workers first_worker, ..., first_worker + processes - 1 as processes of this host,
+    # returns their summaries and record files
+    ctx = multiprocessing.get_context("fork")
+    summaries = ctx.Queue()
+    files = [f"{records_path}.w{worker}" for worker in range(first_worker, first_worker + processes)]
+    procs = [ctx.Process(target=run_worker, args=(worker, workers, workload_file, ms_access_gateway, params, start_at,
+                                                  files[i], summaries))
+             for i, worker in enumerate(range(first_worker, first_worker + processes))]
+    for p in procs:
+        p.start()
+    results = list()
+    while len(results) < len(procs):
+        try:
+            results.append(summaries.get(timeout=1))
+        except queue.Empty:
+            if not any(p.is_alive() for p in procs) and summaries.empty():
+                raise RuntimeError(f"{len(procs) - len(results)} Runner workers failed")
+    for p in procs:
+        p.join()
+    return results, files
+
+
+def merge_records(files, output_file):
+    # k-way merge of record files sorted by timestamp
+    inputs = [open(file_name) for file_name in files]
+    try:
+        with open(output_file, "w") as f:
+            f.writelines(heapq.merge(*inputs, key=record_time))
+    finally:
+        for i in inputs:
+            i.close()
+    for file_name in files:
+        os.remove(file_name)
+
+
+def aggregate(summaries, latency_csv=None):
+    # sums of the worker counters, schedule lag merged per second of the workload, latency histograms merged per
+    # interval (saved in latency_csv)
+    total = {"workers": len(summaries),
+             "run_duration_sec": max(s["run_duration_sec"] for s in summaries)}
+    total["latency"] = merge_intervals([[(interval_start, HdrHistogram.decode(h), HdrHistogram.decode(c))
+                                         for interval_start, h, c in s["latency_intervals"]] for s in summaries],
+                                       latency_csv)
+    for key in ["total_requests", "processed_requests", "error_requests", "timing_error_requests", "latency_sum_ms"]:
+        total[key] = sum(s[key] for s in summaries)
+    seconds = dict()
+    for s in summaries:
+        for lag in s["lag_stats"]:
+            merged = seconds.setdefault(lag["second"], {"second": lag["second"], "requests": 0, "mean_lag_ms": 0.0,
+                                                        "p99_lag_ms": 0.0, "max_lag_ms": 0.0, "timing_errors": 0,
+                                                        "peak_in_flight": 0})
+            merged["mean_lag_ms"] += lag["mean_lag_ms"] * lag["requests"]
+            merged["requests"] += lag["requests"]
+            merged["p99_lag_ms"] = max(merged["p99_lag_ms"], lag["p99_lag_ms"])  # upper bound
+            merged["max_lag_ms"] = max(merged["max_lag_ms"], lag["max_lag_ms"])
+            merged["timing_errors"] += lag["timing_errors"]
+            merged["peak_in_flight"] += lag["peak_in_flight"]  # upper bound
+    total["lag_stats"] = list()
+    for second in sorted(seconds.keys()):
+        merged = seconds[second]
+        if merged["requests"] > 0:
+            merged["mean_lag_ms"] /= merged["requests"]
+        total["lag_stats"].append(merged)
+    return total
+
+
+def send_msg(f, msg):
+    f.write((json.dumps(msg) + "\n").encode())
+    f.flush()
+
+
+def recv_msg(f):
+    line = f.readline()
+    if not line:
+        raise ConnectionError("control channel closed")
+    return json.loads(line)
+
+
+class Coordinator(object):
+    def __init__(self, processes=1, hosts=1, port=5600, start_delay=5.0):
+        self.processes = processes
+        self.start_delay = start_delay
+        self.agents = list()  # (socket, file, first worker, processes)
+        self.workers = processes
+        if hosts > 1:
+            server = socket.create_server(("", port))
+            print(f"Waiting for {hosts - 1} Runner agents on port {port}")
+            while len(self.agents) < hosts - 1:
+                conn, address = server.accept()
+                f = conn.makefile("rwb")
+                agent_processes = recv_msg(f)["processes"]
+                self.agents.append((conn, f, self.workers, agent_processes))
+                self.workers += agent_processes
+                print(f"Runner agent {address[0]} connected, {agent_processes} workers")
+            server.close()
+
+    def run(self, workload_file, ms_access_gateway, params, output_file, latency_csv=None):
+        # barrier: every worker of every host starts the workload at start_at
+        start_at = time.time() + self.start_delay
+        for conn, f, first_worker, processes in self.agents:
+            send_msg(f, {"workload": workload_file, "first_worker": first_worker, "workers": self.workers,
+                         "start_at": start_at})
+        summaries, files = run_local(0, self.processes, self.workers, workload_file, ms_access_gateway, params,
+                                     start_at, output_file)
+        for i, (conn, f, first_worker, processes) in enumerate(self.agents):
+            msg = recv_msg(f)
+            summaries.extend(msg["summaries"])
+            files.append(f"{output_file}.h{i + 1}")
+            with open(files[-1], "wb") as out:
+                remaining = msg["records_size"]
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        raise ConnectionError("control channel closed")
+                    out.write(chunk)
+                    remaining -= len(chunk)
+        merge_results(files, output_file, params["result_output"])
+        return aggregate(summaries, latency_csv)
+
+    def stop(self):
+        for conn, f, first_worker, processes in self.agents:
+            send_msg(f, {"stop": True})
+            conn.close()
+
+
+def run_agent(coordinator, processes, ms_access_gateway, params, records_path):
+    # executes the runs of a coordinator (host:port) until it stops
+    host, port = coordinator.rsplit(":", 1)
+    conn = socket.create_connection((host, int(port)))
+    f = conn.makefile("rwb")
+    send_msg(f, {"processes": processes})
+    print(f"Connected to Runner coordinator {coordinator}")
+    while True:
+        msg = recv_msg(f)
+        if msg.get("stop", False):
+            break
+        print(f"Run of workload {msg['workload']}, workers {msg['first_worker']}-{msg['first_worker'] + processes - 1} "
+              f"of {msg['workers']}")
+        summaries, files = run_local(msg["first_worker"], processes, msg["workers"], msg["workload"], ms_access_gateway,
+                                     params, msg["start_at"], records_path)
+        merge_results(files, records_path, params["result_output"])
+        send_msg(f, {"summaries": summaries, "records_size": os.path.getsize(records_path)})
+        with open(records_path, "rb") as records:
+            shutil.copyfileobj(records, f)
+        f.flush()
+        os.remove(records_path)
+    conn.close()
@@ -0,0 +1,197 @@
+import threading
+import time
+
+# Latency recording of the Runner with HDR (high dynamic range) histograms: values are counted in log-linear
+# buckets, 2^sub_bucket_bits linear sub-buckets per power of 2 (7 bits: relative error below 1%), so that a
+# histogram is a few hundred counters whatever the number of requests and the latency range.
+# LatencyReporter keeps a histogram per interval (e.g. per second) and for the whole run, for the service latency
+# (from the actual send time) and for the latency corrected for the coordinated omission (from the intended send
+# time of the request, so that the delays of the requests the client could not send on time are not hidden), prints
+# and appends to a CSV file the percentiles of each interval during the run.
+
+PERCENTILES = [50, 90, 99, 99.9]
+UNIT = 1000  # recorded values are in us, latencies in ms
+
+
+class HdrHistogram(object):
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        self.counts = dict()  # bucket index -> count
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, value):
+        if value < 2 * self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return (shift + 1) * self.sub_buckets + (value >> shift) - self.sub_buckets
+
+    def highest_value(self, index):
+        # highest value of a bucket
+        if index < 2 * self.sub_buckets:
+            return index
+        shift = index // self.sub_buckets - 1
+        return (((index % self.sub_buckets) + self.sub_buckets + 1) << shift) - 1
+
+    def record(self, latency_ms, count=1):
+        value = max(0, int(latency_ms * UNIT))
+        i = self.index(value)
+        self.counts[i] = self.counts.get(i, 0) + count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, count in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def percentiles(self, percentiles=PERCENTILES):
+        # latencies (ms) of the given percentiles
+        result = [0.0] * len(percentiles)
+        if self.count == 0:
+            return result
+        targets = sorted((max(1, int(p / 100.0 * self.count + 0.5)), j) for j, p in enumerate(percentiles))
+        seen = 0
+        t = 0
+        for i in sorted(self.counts.keys()):
+            seen += self.counts[i]
+            while t < len(targets) and seen >= targets[t][0]:
+                result[targets[t][1]] = min(self.highest_value(i), self.max) / UNIT
+                t += 1
+            if t == len(targets):
+                break
+        return result
+
+    def mean(self):
+        return self.total / self.count / UNIT if self.count else 0.0
+
+    def encode(self):
+        # JSON-serializable form, e.g. to be sent by the workers of a distributed run
+        return {"bits": self.sub_bucket_bits, "counts": list(self.counts.items()), "count": self.count,
+                "total": self.total, "min": self.min, "max": self.max}
+
+    @classmethod
+    def decode(cls, data):
+        h = cls(data["bits"])
+        h.counts = dict((int(i), count) for i, count in data["counts"])
+        h.count = data["count"]
+        h.total = data["total"]
+        h.min = data["min"]
+        h.max = data["max"]
+        return h
+
+
+def summary(histogram):
+    percentiles = histogram.percentiles()
+    return {"count": histogram.count, "mean": histogram.mean(), "p50": percentiles[0], "p90": percentiles[1],
+            "p99": percentiles[2], "p99.9": percentiles[3], "max": histogram.max / UNIT}
+
+
+CSV_HEADER = "interval_start,requests,mean_ms,p50_ms,p90_ms,p99_ms,p99.9_ms,max_ms," \
+             "corrected_p50_ms,corrected_p90_ms,corrected_p99_ms,corrected_p99.9_ms,corrected_max_ms"
+
+
+def csv_row(interval_start, histogram, corrected):
+    s = summary(histogram)
+    c = summary(corrected)
+    return f"{interval_start:.3f},{s['count']},{s['mean']:.3f},{s['p50']:.3f},{s['p90']:.3f},{s['p99']:.3f}," \
+           f"{s['p99.9']:.3f},{s['max']:.3f},{c['p50']:.3f},{c['p90']:.3f},{c['p99']:.3f},{c['p99.9']:.3f},{c['max']:.3f}"
+
+
+class LatencyReporter(object):
+    def __init__(self, interval=1.0, csv_file=None, verbose=True, keep_intervals=False):
+        self.interval = interval
+        self.csv = open(csv_file, "w") if csv_file is not None else None
+        if self.csv is not None:
+            self.csv.write(CSV_HEADER + "\n")
+        self.verbose = verbose
+        self.keep_intervals = keep_intervals
+        self.intervals = list()  # (interval start, histogram, corrected histogram) if keep_intervals
+        self.lock = threading.Lock()  # records of the thread-pool runners
+        self.histogram = HdrHistogram()
+        self.corrected = HdrHistogram()
+        self.interval_start = None
+        self.interval_histogram = HdrHistogram()
+        self.interval_corrected = HdrHistogram()
+
+    def record(self, latency_ms, corrected_ms=None, now=None):
+        # corrected_ms: latency from the intended send time, by default the latency
+        if corrected_ms is None:
+            corrected_ms = latency_ms
+        if now is None:
+            now = time.time()
+        with self.lock:
+            if self.interval_start is None:
+                self.interval_start = now - now % self.interval
+            elif now >= self.interval_start + self.interval:
+                self.report()
+                self.interval_start = now - now % self.interval
+            self.interval_histogram.record(latency_ms)
+            self.interval_corrected.record(corrected_ms)
+
+    def report(self):
+        # end of an interval
+        if self.interval_histogram.count == 0:
+            return
+        self.histogram.merge(self.interval_histogram)
+        self.corrected.merge(self.interval_corrected)
+        if self.csv is not None:
+            self.csv.write(csv_row(self.interval_start, self.interval_histogram, self.interval_corrected) + "\n")
+            self.csv.flush()
+        if self.verbose:
+            s = summary(self.interval_histogram)
+            c = summary(self.interval_corrected)
+            print(f"Latency (ms) {time.strftime('%H:%M:%S', time.localtime(self.interval_start))}: "
+                  f"requests {s['count']}, p50 {s['p50']:.3f}, p90 {s['p90']:.3f}, p99 {s['p99']:.3f}, "
+                  f"p99.9 {s['p99.9']:.3f}, max {s['max']:.3f} - corrected p99 {c['p99']:.3f}, max {c['max']:.3f}")
+        if self.keep_intervals:
+            self.intervals.append((self.interval_start, self.interval_histogram, self.interval_corrected))
+        self.interval_histogram = HdrHistogram()
+        self.interval_corrected = HdrHistogram()
+
+    def close(self):
+        # final summaries of the run
+        with self.lock:
+            self.report()
+        if self.csv is not None:
+            self.csv.close()
+        return {"latency": summary(self.histogram), "corrected_latency": summary(self.corrected)}
+
+
+def merge_intervals(interval_lists, csv_file):
+    # per-interval histograms of several reporters (e.g. the workers of a distributed run) merged in a CSV file,
+    # returns the final summaries
+    intervals = dict()
+    histogram = HdrHistogram()
+    corrected = HdrHistogram()
+    for interval_list in interval_lists:
+        for interval_start, h, c in interval_list:
+            merged = intervals.setdefault(interval_start, (HdrHistogram(h.sub_bucket_bits), HdrHistogram(c.sub_bucket_bits)))
+            merged[0].merge(h)
+            merged[1].merge(c)
+            histogram.merge(h)
+            corrected.merge(c)
+    if csv_file is not None:
+        with open(csv_file, "w") as f:
+            f.write(CSV_HEADER + "\n")
+            for interval_start in sorted(intervals.keys()):
+                f.write(csv_row(interval_start, *intervals[interval_start]) + "\n")
+    return {"latency": summary(histogram), "corrected_latency": summary(corrected)}
+
+
+def print_summary(summaries):
+    for name, title in [("latency", "Latency (ms)"), ("corrected_latency", "Corrected latency (ms)")]:
+        s = summaries[name]
+        print(f"{title}: mean {s['mean']:.3f} - p50 {s['p50']:.3f} - p90 {s['p90']:.3f} - p99 {s['p99']:.3f} - "
+              f"p99.9 {s['p99.9']:.3f} - max {s['max']:.3f}")
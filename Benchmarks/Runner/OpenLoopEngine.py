@@ -0,0 +1,160 @@
+import asyncio
+import time
+
+import aiohttp
+
+from RequestMix import RequestMix
+
+# Open-loop engine of the Runner: requests are sent at the times of the workload events, independently of the
+# response times of the application, by a single asyncio dispatcher that sleeps until the next event and starts one
+# task per request on a pooled keep-alive aiohttp session. At most max_in_flight requests are outstanding; an event
+# that finds all the slots busy is a timing error and waits for a free slot (its schedule lag grows). The schedule
+# lag (send time - event time) is summarized per second of the workload.
+
+SPIN_TIME = 0.002  # s
+
+
+def percentile(values, p):
+    # nearest-rank percentile of a sorted list
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+class LagStats(object):
+    # schedule lags (ms) of the events of a second of the workload
+    __slots__ = ("second", "events", "lags", "timing_errors", "peak_in_flight")
+
+    def __init__(self, second):
+        self.second = second
+        self.events = 0
+        self.lags = list()
+        self.timing_errors = 0
+        self.peak_in_flight = 0
+
+    def summary(self):
+        lags = sorted(self.lags)
+        return {"second": self.second,
+                "requests": len(lags),
+                "mean_lag_ms": sum(lags) / len(lags) if lags else 0.0,
+                "p99_lag_ms": percentile(lags, 99),
+                "max_lag_ms": lags[-1] if lags else 0.0,
+                "timing_errors": self.timing_errors,
+                "peak_in_flight": self.peak_in_flight}
+
+
+class OpenLoopEngine(object):
+    def __init__(self, ms_access_gateway, max_in_flight=1000, connections=0, timeout=60, on_result=None, verbose=True,
+                 reporter=None, request_mix=None):
+        self.ms_access_gateway = ms_access_gateway
+        self.max_in_flight = max_in_flight
+        self.connections = connections  # max number of keep-alive connections of the pool, 0 is unbounded
+        self.timeout = timeout
+        self.on_result = on_result  # on_result(send time ms, latency_ms, status_code, processed, pending, event)
+        self.verbose = verbose
+        self.reporter = reporter  # LatencyReporter
+        self.request_mix = request_mix if request_mix is not None else RequestMix()
+        self.processed_requests = 0
+        self.pending_requests = 0
+        self.error_requests = 0
+        self.timing_error_requests = 0
+        self.lag_stats = list()  # per-second summaries
+        self.seconds = dict()  # second of the workload -> LagStats not yet summarized
+        self.latency_sum_ms = 0.0
+
+    def second_stats(self, second):
+        stats = self.seconds.get(second)
+        if stats is None:
+            stats = LagStats(second)
+            self.seconds[second] = stats
+        return stats
+
+    def summarize(self, before_second):
+        # summaries of the past seconds whose events have all been sent
+        for second in sorted(s for s in self.seconds.keys() if s < before_second):
+            stats = self.seconds[second]
+            if len(stats.lags) < stats.events:
+                # some events are still waiting for an in-flight slot
+                continue
+            summary = self.seconds.pop(second).summary()
+            self.lag_stats.append(summary)
+            if self.verbose:
+                print(f"Second {summary['second']}: requests {summary['requests']}, "
+                      f"schedule lag mean {summary['mean_lag_ms']:.3f} ms, p99 {summary['p99_lag_ms']:.3f} ms, "
+                      f"max {summary['max_lag_ms']:.3f} ms, timing errors {summary['timing_errors']}, "
+                      f"pending requests {self.pending_requests}, processed requests {self.processed_requests}")
+
+    async def do_request(self, session, slots, event, scheduled, stats):
+        loop = asyncio.get_running_loop()
+        method, path, body, content_type = self.request_mix.request(event)
+        if slots.locked():
+            # maximum number of in-flight requests reached, the request is delayed
+            self.timing_error_requests += 1
+            stats.timing_errors += 1
+        async with slots:
+            start = loop.time()
+            now_ms = time.time_ns() // 1_000_000
+            stats.lags.append((start - scheduled) * 1000)
+            self.pending_requests += 1
+            stats.peak_in_flight = max(stats.peak_in_flight, self.pending_requests)
+            status_code = 0
+            try:
+                async with session.request(method, self.ms_access_gateway + path, data=body,
+                                           headers={"Content-Type": content_type} if content_type else None) as r:
+                    await r.read()
+                    status_code = r.status
+            except Exception as err:
+                print("Error: %s" % err)
+            latency_ms = (loop.time() - start) * 1000
+            self.pending_requests -= 1
+            self.processed_requests += 1
+            if status_code != 200:
+                self.error_requests += 1
+                if status_code != 0:
+                    print("Response Status Code", status_code)
+            self.latency_sum_ms += latency_ms
+            if self.reporter is not None:
+                # corrected latency: from the time of the event
+                self.reporter.record(latency_ms, (loop.time() - scheduled) * 1000)
+            if self.on_result is not None:
+                self.on_result(now_ms, latency_ms, status_code, self.processed_requests,
+                               self.pending_requests, event)
+
+    async def run(self, events, start_delay=2.0, start_at=None):
+        # events: iterable of {"time": ms, "service": ..., "bid": ...} in time order (read lazily), the workload starts after start_delay
+        # seconds or at the start_at Unix timestamp (barrier shared by several engines)
+        loop = asyncio.get_running_loop()
+        if start_at is not None:
+            start_delay = start_at - time.time()
+        slots = asyncio.Semaphore(self.max_in_flight)
+        connector = aiohttp.TCPConnector(limit=self.connections, force_close=False, enable_cleanup_closed=True)
+        tasks = set()
+        async with aiohttp.ClientSession(connector=connector,
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            t0 = loop.time() + start_delay
+            current_second = 0
+            for event in events:
+                scheduled = t0 + event["time"] / 1000.0
+                delay = scheduled - loop.time()
+                if delay > SPIN_TIME:
+                    await asyncio.sleep(delay - SPIN_TIME)
+                while loop.time() < scheduled:
+                    # the event loop wakes up with millisecond granularity, the last SPIN_TIME seconds are spent
+                    # yielding to the request tasks
+                    await asyncio.sleep(0)
+                second = int(event["time"] // 1000)
+                if second > current_second:
+                    self.summarize(second)
+                    current_second = second
+                stats = self.second_stats(second)
+                stats.events += 1
+                task = loop.create_task(self.do_request(session, slots, event, scheduled, stats))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+            if loop.time() < t0:
+                # empty workload, the run still ends after the start barrier
+                await asyncio.sleep(t0 - loop.time())
+        self.summarize(float("inf"))
+        return loop.time() - t0
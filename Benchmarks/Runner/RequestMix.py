@@ -0,0 +1,87 @@
+import json
+import os
+import random
+import sys
+
+# Request mix of the Runner: the HTTP request sent for a workload event.
+# Stochastic requests are GET {gateway}/{service}?bid={bid}, with the behaviour id (alternative_behaviors of the
+# work model) of the event or drawn from a weighted distribution. Trace-driven requests are POST {gateway}/{service}
+# with a trace (e.g. the Alibaba-derived traces of Examples/Alibaba) as body; the traces of a directory are loaded and
+# encoded once, so that issuing a request only picks a pre-encoded body. A trace_ratio fraction of the requests
+# replays a trace.
+
+TRACE_ENCODINGS = ["json", "binary"]
+
+
+def trace_service(trace, escape="__"):
+    # service of the root of a trace, e.g. s0 for {"s0__47072": [...]}
+    return list(trace)[0].split(escape)[0]
+
+
+def load_traces(traces_dir, encoding="json"):
+    # (service, body, content type) of the trace files of a directory, in name order
+    if encoding not in TRACE_ENCODINGS:
+        raise ValueError(f"Unsupported trace encoding: {encoding}")
+    if encoding == "binary":
+        sys.path.append(f'{os.path.dirname(os.path.abspath(__file__))}/../../ServiceCell')
+        from TraceCodec import TRACE_CONTENT_TYPE, encode_trace
+    traces = list()
+    for file_name in sorted(os.listdir(traces_dir)):
+        if not file_name.endswith(".json") or file_name == "service_graph.json":
+            continue
+        with open(os.path.join(traces_dir, file_name)) as f:
+            trace = json.load(f)
+        if encoding == "binary":
+            traces.append((trace_service(trace), encode_trace(trace), TRACE_CONTENT_TYPE))
+        else:
+            traces.append((trace_service(trace), json.dumps(trace, separators=(",", ":")).encode(), "application/json"))
+    return traces
+
+
+class RequestMix(object):
+    def __init__(self, params=None):
+        # params: {"bids": {bid: weight}, "traces_dir": path, "trace_ratio": 1.0, "trace_order": "random"|"sequential",
+        #          "trace_encoding": "json"|"binary", "seed": None}
+        params = params or dict()
+        self.random = random.Random(params.get("seed"))
+        self.bids = list(params.get("bids", dict()).keys())
+        self.cum_weights = list()
+        total = 0.0
+        for bid in self.bids:
+            total += float(params["bids"][bid])
+            self.cum_weights.append(total)
+        self.traces = list()
+        if params.get("traces_dir"):
+            self.traces = load_traces(params["traces_dir"], params.get("trace_encoding", "json"))
+            if not self.traces:
+                raise ValueError(f"No trace files in {params['traces_dir']}")
+        self.trace_ratio = float(params.get("trace_ratio", 1.0)) if self.traces else 0.0
+        self.sequential = params.get("trace_order", "random") == "sequential"
+        self.next_trace = 0
+        self.paths = dict()  # (service, bid) -> path
+
+    def draw_bid(self):
+        if not self.bids:
+            return None
+        return self.random.choices(self.bids, cum_weights=self.cum_weights)[0]
+
+    def trace(self):
+        if self.sequential:
+            trace = self.traces[self.next_trace]
+            self.next_trace = (self.next_trace + 1) % len(self.traces)
+            return trace
+        return self.traces[self.random.randrange(len(self.traces))]
+
+    def request(self, event):
+        # (method, path, body, content type) of the request of a workload event
+        if self.trace_ratio > 0 and (self.trace_ratio >= 1 or self.random.random() < self.trace_ratio):
+            service, body, content_type = self.trace()
+            return "POST", f"/{service}", body, content_type
+        bid = event.get("bid")
+        if bid is None:
+            bid = self.draw_bid()
+        path = self.paths.get((event["service"], bid))
+        if path is None:
+            path = f"/{event['service']}" if bid is None else f"/{event['service']}?bid={bid}"
+            self.paths[(event["service"], bid)] = path
+        return "GET", path, None, None
@@ -0,0 +1,79 @@
+import os
+import shutil
+import threading
+
+import numpy as np
+
+# Columnar per-request results of the Runner.
+# Records are buffered in a NumPy structured array and appended to the result file as a .npy array every batch_size
+# requests, so that the file is written during the run, a crash loses at most a batch, and the records are never
+# formatted as text. A result file (.npyc) is a sequence of .npy arrays: the files of several workers can simply be
+# concatenated. load_results reads them in a pandas DataFrame sorted by timestamp, e.g. in the AfterWorkloadFunction.
+
+RESULT_DTYPE = np.dtype([("timestamp_ms", "<i8"),  # send time (Unix, ms)
+                         ("latency_ms", "<f4"),
+                         ("status", "<i2"),  # HTTP status, 0 if the request failed
+                         ("in_flight", "<i4"),  # pending requests of the worker at the end of the request
+                         ("worker", "<i2")])
+RESULT_EXTENSION = ".npyc"
+
+
+class ResultWriter(object):
+    def __init__(self, f, worker=0, batch_size=4096):
+        self.f = f  # binary file
+        self.worker = worker
+        self.batch = np.zeros(batch_size, dtype=RESULT_DTYPE)
+        self.size = 0
+        self.lock = threading.Lock()  # records of the thread-pool runners
+
+    def write(self, now_ms, latency_ms, status_code, processed, pending, event=None):
+        with self.lock:
+            self.batch[self.size] = (now_ms, latency_ms, status_code, pending, self.worker)
+            self.size += 1
+            if self.size == len(self.batch):
+                self.flush()
+
+    def flush(self):
+        if self.size > 0:
+            np.save(self.f, self.batch[:self.size])
+            self.f.flush()
+            self.size = 0
+
+    def close(self):
+        with self.lock:
+            self.flush()
+
+
+def read_chunks(path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        while f.tell() < size:
+            try:
+                yield np.load(f)
+            except ValueError:
+                # truncated last chunk (interrupted run)
+                break
+
+
+def load_array(path):
+    chunks = list(read_chunks(path))
+    if not chunks:
+        return np.zeros(0, dtype=RESULT_DTYPE)
+    records = np.concatenate(chunks)
+    return records[np.argsort(records["timestamp_ms"], kind="stable")]
+
+
+def load_results(path):
+    # pandas DataFrame of the records of a result file, sorted by timestamp
+    import pandas as pd
+    return pd.DataFrame(load_array(path))
+
+
+def concat_results(files, output_file):
+    # result files of several workers in a single file
+    with open(output_file, "wb") as out:
+        for file_name in files:
+            with open(file_name, "rb") as f:
+                shutil.copyfileobj(f, out)
+    for file_name in files:
+        os.remove(file_name)
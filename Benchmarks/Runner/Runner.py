@@ -1,9 +1,19 @@
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from itertools import islice
 import sched
 import time
 import threading
 from TimingError import TimingError
+from OpenLoopEngine import OpenLoopEngine
+from DistributedRunner import Coordinator, open_records, run_agent
+from ResultStore import RESULT_EXTENSION
+from WorkloadStream import open_workload
+from LatencyHistogram import LatencyReporter, print_summary
+from SweepRunner import run_sweep
+from RequestMix import RequestMix
+from WorkloadCache import cacheable, cached_workload, generate_workload, link_workload
+import asyncio
 import requests
 import json
 import sys
@@ -72,24 +82,50 @@ def stop_prometheus_collector():
 
 
 class Counter(object):
+    # one count per thread, aggregated when the value is read: the threads of the pool do not contend on a lock
     def __init__(self, start = 0):
-        self.lock = threading.Lock()
-        self.value = start
+        self.lock = threading.Lock()  # taken once per thread, to register its count
+        self.reset(start)
+    def reset(self, start = 0):
+        self.start = start
+        self.local = threading.local()
+        self.counts = list()
+    def count(self):
+        count = getattr(self.local, "count", None)
+        if count is None:
+            count = [0]
+            with self.lock:
+                self.counts.append(count)
+            self.local.count = count
+        return count
     def increase(self):
-        self.lock.acquire()
-        try:
-            self.value = self.value + 1
-        finally:
-            self.lock.release()
+        self.count()[0] += 1
     def decrease(self):
-        self.lock.acquire()
-        try:
-            self.value = self.value - 1
-        finally:
-            self.lock.release()
+        self.count()[0] -= 1
+    @property
+    def value(self):
+        return self.start + sum(count[0] for count in self.counts)
+
+
+def result_path(name):
+    # file of the per-request records
+    return f"{output_path}/{name}{RESULT_EXTENSION if result_params['format'] == 'columnar' else '.txt'}"
+
 
+def new_result_writer(name):
+    # columnar records are written during the run, text records at its end
+    if result_params["format"] != "columnar" or not latency_params["raw_records"]:
+        return None
+    return open_records(result_path(name), result_params, 0)[1]
 
-def do_requests(event, stats, local_latency_stats):
+
+def new_latency_reporter(name):
+    # per-interval latency histograms, printed and saved in <name>_latency.csv during the run
+    csv_file = f"{output_path}/{name}_latency.csv" if latency_params["csv"] else None
+    return LatencyReporter(latency_params["interval"], csv_file)
+
+
+def do_requests(event, stats, submit_time, request):
     global processed_requests, last_print_time_ms, error_requests, pending_requests
     # pprint(workload[event]["services"])
     # for services in event["services"]:
@@ -100,16 +136,24 @@ def do_requests(event, stats, local_latency_stats):
         if runner_type=="greedy":
             pending_requests.increase()
         
-        r = requests.get(f"{ms_access_gateway}/{event['service']}")
+        start = time.perf_counter()
+        method, path, body, content_type = request
+        r = requests.request(method, ms_access_gateway + path, data=body,
+                             headers={"Content-Type": content_type} if content_type else None)
+        end = time.perf_counter()
         pending_requests.decrease()
         
         if r.status_code != 200:
             print("Response Status Code", r.status_code)
             error_requests.increase()
 
-        req_latency_ms = int(r.elapsed.total_seconds()*1000)
-        stats.append(f"{now_ms} \t {req_latency_ms} \t {r.status_code} \t {processed_requests.value} \t {pending_requests.value}")
-        local_latency_stats.append(req_latency_ms)
+        # including the body read (r.elapsed stops at the headers), corrected from the time the request was due
+        req_latency_ms = int((end - start)*1000)
+        latency_reporter.record((end - start)*1000, (end - submit_time)*1000)
+        if result_writer is not None:
+            result_writer.write(now_ms, (end - start)*1000, r.status_code, processed_requests.value, pending_requests.value)
+        elif latency_params["raw_records"]:
+            stats.append(f"{now_ms} \t {req_latency_ms} \t {r.status_code} \t {processed_requests.value} \t {pending_requests.value}")
         
         if now_ms > last_print_time_ms + 1_000:
             print(f"Processed request {processed_requests.value}, latency {req_latency_ms}, pending requests {pending_requests.value} \n")
@@ -119,10 +163,11 @@ def do_requests(event, stats, local_latency_stats):
         print("Error: %s" % err)
 
 
-def job_assignment(v_pool, v_futures, event, stats, local_latency_stats):
+def job_assignment(v_pool, v_futures, event, stats):
     global timing_error_requests, pending_requests
     try:
-        worker = v_pool.submit(do_requests, event, stats, local_latency_stats)
+        # bid or trace of the request drawn in the scheduler thread
+        worker = v_pool.submit(do_requests, event, stats, time.perf_counter(), request_mix.request(event))
         v_futures.append(worker)
         if runner_type!="greedy":
             pending_requests.increase()
@@ -134,8 +179,20 @@ def job_assignment(v_pool, v_futures, event, stats, local_latency_stats):
     except TimingError as err:
         print("Error: %s" % err)
 
+def enter_events(s, events, start, pool, futures, stats, entered):
+    # enter the next chunk of events in the scheduler, the first event of the chunk enters the following one: the
+    # scheduler holds at most two chunks of the workload
+    chunk = list(islice(events, SCHEDULER_CHUNK))
+    for event in chunk:
+        # in milliseconds
+        s.enterabs(start + event["time"]/1000 + 2, 1, job_assignment, argument=(pool, futures, event, stats))
+    entered[0] += len(chunk)
+    if len(chunk) == SCHEDULER_CHUNK:
+        s.enterabs(start + chunk[0]["time"]/1000 + 2, 2, enter_events, argument=(s, events, start, pool, futures, stats, entered))
+
+
 def file_runner(workload=None):
-    global start_time, stats, local_latency_stats
+    global start_time, stats, latency_reporter, result_writer
 
     # 启动Prometheus数据收集进程
     # collector_output_file = f"prometheus_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -150,44 +207,165 @@ def file_runner(workload=None):
     else:
         workload_file = workload
 
-    with open(workload_file) as f:
-        workload = json.load(f)
+    events = iter(open_workload(workload_file, open_loop_params["lookahead"]))  # JSON, NDJSON or binary, read lazily
+    latency_reporter = new_latency_reporter(f"{result_file}_{workload_file.split('/')[-1].split('.')[0]}")
+    result_writer = new_result_writer(f"{result_file}_{workload_file.split('/')[-1].split('.')[0]}")
     s = sched.scheduler(time.time, time.sleep)
     pool = ThreadPoolExecutor(threads)
     futures = list()
+    workload_len = [0]  # events entered so far
 
-    for event in workload:
-        # in seconds
-        # s.enter(event["time"], 1, job_assignment, argument=(pool, futures, event))
-        # in milliseconds
-        s.enter((event["time"]/1000+2), 1, job_assignment, argument=(pool, futures, event, stats, local_latency_stats))
+    enter_events(s, events, time.time(), pool, futures, stats, workload_len)
 
     start_time = time.time()
     print("Start Time:", datetime.now().strftime("%H:%M:%S.%f - %g/%m/%Y"))
     s.run()
 
     wait(futures)
+    if result_writer is not None:
+        result_writer.close()
+        result_writer.f.close()
     run_duration_sec = time.time() - start_time
-    avg_latency = 1.0*sum(local_latency_stats)/len(local_latency_stats)
+    latency_summaries = latency_reporter.close()
+    avg_latency = latency_summaries["latency"]["mean"]
 
     print("###############################################")
     print("###########   Stop Forrest Stop!!   ###########")
     print("###############################################")
-    print("Run Duration (sec): %.6f" % run_duration_sec, "Total Requests: %d - Error Request: %d - Timing Error Requests: %d - Average Latency (ms): %.6f - Request rate (req/sec) %.6f" % (len(workload), error_requests.value, timing_error_requests, avg_latency, 1.0*len(workload)/run_duration_sec))
+    print("Run Duration (sec): %.6f" % run_duration_sec, "Total Requests: %d - Error Request: %d - Timing Error Requests: %d - Average Latency (ms): %.6f - Request rate (req/sec) %.6f" % (workload_len[0], error_requests.value, timing_error_requests, avg_latency, 1.0*workload_len[0]/run_duration_sec))
+    print_summary(latency_summaries)
 
     if run_after_workload is not None:
         args = {"run_duration_sec": run_duration_sec,
                 "last_print_time_ms": last_print_time_ms,
                 "requests_processed": processed_requests.value,
                 "timing_error_number": timing_error_requests,
-                "total_request": len(workload),
+                "total_request": workload_len[0],
                 "error_request": error_requests.value,
-                "runner_results_file": f"{output_path}/{result_file}_{workload_var.split('/')[-1].split('.')[0]}.txt"
+                "runner_results_file": result_path(f"{result_file}_{workload_var.split('/')[-1].split('.')[0]}"),
+                "latency": latency_summaries
+                }
+        run_after_workload(args)
+
+def open_loop_runner(workload=None):
+    global start_time, stats, lag_stats, latency_reporter
+
+    stats = list()
+    print("###############################################")
+    print("############   Run Forrest Run!!   ############")
+    print("###############################################")
+
+    if coordinator is not None:
+        distributed_runner(workload)
+        return
+
+    # events are read lazily and records are written to the result file as the requests complete
+    output_file = result_path(f"{result_file}_{workload.split('/')[-1].split('.')[0]}")
+    latency_reporter = new_latency_reporter(f"{result_file}_{workload.split('/')[-1].split('.')[0]}")
+    f, records = open_records(output_file if latency_params["raw_records"] else os.devnull, result_params,
+                              open_loop_params["timeout"])
+    with f:
+        engine = OpenLoopEngine(ms_access_gateway, max_in_flight=open_loop_params["max_in_flight"],
+                                connections=open_loop_params["connections"], timeout=open_loop_params["timeout"],
+                                on_result=records.write if latency_params["raw_records"] else None,
+                                reporter=latency_reporter, request_mix=request_mix)
+        start_time = time.time()
+        print("Start Time:", datetime.now().strftime("%H:%M:%S.%f - %g/%m/%Y"))
+        run_duration_sec = asyncio.run(engine.run(open_workload(workload, open_loop_params["lookahead"]), start_delay=2.0))
+        records.close()
+    total_requests = engine.processed_requests
+    lag_stats = engine.lag_stats
+    latency_summaries = latency_reporter.close()
+    avg_latency = latency_summaries["latency"]["mean"]
+    max_lag = max((s["max_lag_ms"] for s in lag_stats), default=0)
+
+    print("###############################################")
+    print("###########   Stop Forrest Stop!!   ###########")
+    print("###############################################")
+    print("Run Duration (sec): %.6f" % run_duration_sec, "Total Requests: %d - Error Request: %d - Timing Error Requests: %d - Average Latency (ms): %.6f - Request rate (req/sec) %.6f - Max Schedule Lag (ms): %.3f" % (total_requests, engine.error_requests, engine.timing_error_requests, avg_latency, 1.0*total_requests/run_duration_sec, max_lag))
+    print_summary(latency_summaries)
+
+    if run_after_workload is not None:
+        args = {"run_duration_sec": run_duration_sec,
+                "last_print_time_ms": last_print_time_ms,
+                "requests_processed": engine.processed_requests,
+                "timing_error_number": engine.timing_error_requests,
+                "total_request": total_requests,
+                "error_request": engine.error_requests,
+                "runner_results_file": output_file,
+                "latency": latency_summaries
+                }
+        run_after_workload(args)
+
+def distributed_runner(workload):
+    global lag_stats
+
+    # the workers merge their records in the result file
+    name = f"{result_file}_{workload.split('/')[-1].split('.')[0]}"
+    output_file = result_path(name)
+    print("Start Time:", datetime.now().strftime("%H:%M:%S.%f - %g/%m/%Y"), "- Workers:", coordinator.workers)
+    latency_csv = f"{output_path}/{name}_latency.csv" if latency_params["csv"] else None
+    total = coordinator.run(workload, ms_access_gateway, worker_params, output_file, latency_csv)
+    lag_stats = total["lag_stats"]
+    avg_latency = total["latency"]["latency"]["mean"]
+    max_lag = max((s["max_lag_ms"] for s in lag_stats), default=0)
+
+    print("###############################################")
+    print("###########   Stop Forrest Stop!!   ###########")
+    print("###############################################")
+    print("Run Duration (sec): %.6f" % total["run_duration_sec"], "Total Requests: %d - Error Request: %d - Timing Error Requests: %d - Average Latency (ms): %.6f - Request rate (req/sec) %.6f - Max Schedule Lag (ms): %.3f" % (total["total_requests"], total["error_requests"], total["timing_error_requests"], avg_latency, 1.0*total["total_requests"]/total["run_duration_sec"], max_lag))
+    print_summary(total["latency"])
+
+    if run_after_workload is not None:
+        args = {"run_duration_sec": total["run_duration_sec"],
+                "last_print_time_ms": last_print_time_ms,
+                "requests_processed": total["processed_requests"],
+                "timing_error_number": total["timing_error_requests"],
+                "total_request": total["total_requests"],
+                "error_request": total["error_requests"],
+                "runner_results_file": output_file,
+                "latency": total["latency"]
+                }
+        run_after_workload(args)
+
+def sweep_runner():
+    global runner_parameters
+
+    if 'ingress_service' in runner_parameters.keys():
+        srv=runner_parameters['ingress_service']
+    else:
+        srv = 's0'
+
+    print("###############################################")
+    print("############   Run Forrest Run!!   ############")
+    print("###############################################")
+    print("Start Time:", datetime.now().strftime("%H:%M:%S.%f - %g/%m/%Y"), "- Sweep of", sweep_params["mode"], sweep_params["steps"])
+    start_time = time.time()
+    steps, knee = run_sweep(ms_access_gateway, srv, sweep_params, open_loop_params, f"{output_path}/{result_file}_sweep.csv", request_mix)
+    run_duration_sec = time.time() - start_time
+
+    print("###############################################")
+    print("###########   Stop Forrest Stop!!   ###########")
+    print("###############################################")
+    print("Run Duration (sec): %.6f" % run_duration_sec)
+    print("%12s %16s %10s %10s %10s" % (sweep_params["mode"], "throughput (rps)", "p50 (ms)", "p99 (ms)", "errors"))
+    for i, step in enumerate(steps):
+        print("%12s %16.3f %10.3f %10.3f %10d%s" % (step["load"], step["throughput_rps"], step["p50"], step["p99"], step["errors"], "  <- knee" if i == knee else ""))
+    if knee is not None:
+        print("Knee: %s %s - Throughput (req/sec) %.3f - p99 Latency (ms) %.3f" % (sweep_params["mode"], steps[knee]["load"], steps[knee]["throughput_rps"], steps[knee]["p99"]))
+    else:
+        print("Knee: no knee (flat p99 or no saturation in the steps)")
+
+    if run_after_workload is not None:
+        args = {"run_duration_sec": run_duration_sec,
+                "sweep": steps,
+                "knee": steps[knee] if knee is not None else None,
+                "runner_results_file": f"{output_path}/{result_file}_sweep.csv"
                 }
         run_after_workload(args)
 
 def greedy_runner():
-    global start_time, stats, local_latency_stats, runner_parameters
+    global start_time, stats, latency_reporter, result_writer, runner_parameters
 
     # 启动Prometheus数据收集进程
     # collector_output_file = f"prometheus_data_greedy_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -203,6 +381,8 @@ def greedy_runner():
     print("############   Run Forrest Run!!   ############")
     print("###############################################")
     
+    latency_reporter = new_latency_reporter(result_file)
+    result_writer = new_result_writer(result_file)
     s = sched.scheduler(time.time, time.sleep)
     pool = ThreadPoolExecutor(threads)
     futures = list()
@@ -213,35 +393,41 @@ def greedy_runner():
     for i in range(workload_events):
         if i < slow_start_end :
             event_time =  i * slow_start_delay
-        s.enter(event_time, 1, job_assignment, argument=(pool, futures, event, stats, local_latency_stats))
+        s.enter(event_time, 1, job_assignment, argument=(pool, futures, event, stats))
 
     start_time = time.time()
     print("Start Time:", datetime.now().strftime("%H:%M:%S.%f - %g/%m/%Y"))
     s.run()
 
     wait(futures)
+    if result_writer is not None:
+        result_writer.close()
+        result_writer.f.close()
     run_duration_sec = time.time() - start_time
-    avg_latency = 1.0*sum(local_latency_stats)/len(local_latency_stats)
+    latency_summaries = latency_reporter.close()
+    avg_latency = latency_summaries["latency"]["mean"]
 
     print("###############################################")
     print("###########   Stop Forrest Stop!!   ###########")
     print("###############################################")
     
     print("Run Duration (sec): %.6f" % run_duration_sec, "Total Requests: %d - Error Request: %d - Timing Error Requests: %d - Average Latency (ms): %.6f - Request rate (req/sec) %.6f" % (workload_events, error_requests.value, timing_error_requests, avg_latency, 1.0*workload_events/run_duration_sec))
+    print_summary(latency_summaries)
 
     if run_after_workload is not None:
         args = {"run_duration_sec": run_duration_sec,
                 "last_print_time_ms": last_print_time_ms,
-                "requests_processed": processed_requests,
+                "requests_processed": processed_requests.value,
                 "timing_error_number": timing_error_requests,
                 "total_request": workload_events,
-                "error_request": error_requests,
-                "runner_results_file": f"{output_path}/{result_file}.txt"
+                "error_request": error_requests.value,
+                "runner_results_file": result_path(result_file),
+                "latency": latency_summaries
                 }
         run_after_workload(args)
 
 def periodic_runner():
-    global start_time, stats, local_latency_stats, runner_parameters
+    global start_time, stats, latency_reporter, result_writer, runner_parameters
 
     # 启动Prometheus数据收集进程
     # collector_output_file = f"prometheus_data_periodic_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -262,6 +448,8 @@ def periodic_runner():
     print("############   Run Forrest Run!!   ############")
     print("###############################################")
     
+    latency_reporter = new_latency_reporter(result_file)
+    result_writer = new_result_writer(result_file)
     s = sched.scheduler(time.time, time.sleep)
     pool = ThreadPoolExecutor(threads)
     futures = list()
@@ -269,30 +457,36 @@ def periodic_runner():
     offset=10 # initial delay to allow the insertion of events in the event list
     for i in range(workload_events):
         event_time =  offset + i * 1.0/rate
-        s.enter(event_time, 1, job_assignment, argument=(pool, futures, event, stats, local_latency_stats))
+        s.enter(event_time, 1, job_assignment, argument=(pool, futures, event, stats))
 
     start_time = time.time()
     print("Start Time:", datetime.now().strftime("%H:%M:%S.%f - %g/%m/%Y"))
     s.run()
 
     wait(futures)
+    if result_writer is not None:
+        result_writer.close()
+        result_writer.f.close()
     run_duration_sec = time.time() - start_time
-    avg_latency = 1.0*sum(local_latency_stats)/len(local_latency_stats)
+    latency_summaries = latency_reporter.close()
+    avg_latency = latency_summaries["latency"]["mean"]
 
     print("###############################################")
     print("###########   Stop Forrest Stop!!   ###########")
     print("###############################################")
     
     print("Run Duration (sec): %.6f" % run_duration_sec, "Total Requests: %d - Error Request: %d - Timing Error Requests: %d - Average Latency (ms): %.6f - Request rate (req/sec) %.6f" % (workload_events, error_requests.value, timing_error_requests, avg_latency, workload_events/run_duration_sec))
+    print_summary(latency_summaries)
 
     if run_after_workload is not None:
         args = {"run_duration_sec": run_duration_sec,
                 "last_print_time_ms": last_print_time_ms,
-                "requests_processed": processed_requests,
+                "requests_processed": processed_requests.value,
                 "timing_error_number": timing_error_requests,
                 "total_request": workload_events,
-                "error_request": error_requests,
-                "runner_results_file": f"{output_path}/{result_file}.txt"
+                "error_request": error_requests.value,
+                "runner_results_file": result_path(result_file),
+                "latency": latency_summaries
                 }
         run_after_workload(args)
  
@@ -301,9 +495,12 @@ def periodic_runner():
 
 RUNNER_PATH = os.path.dirname(os.path.abspath(__file__))
 EXPERIMENT_PATH = 'Experiment'
+SCHEDULER_CHUNK = 10000  # events of a workload file entered in the scheduler at once (file runner)
 parser = argparse.ArgumentParser()
 parser.add_argument('-c', '--config-file', action='store', dest='parameters_file',
                     help='The Runner Parameters file', default=f'{EXPERIMENT_PATH}/RunnerParameters.json')
+parser.add_argument('--invalidate-cache', action='store_true', dest='invalidate_cache',
+                    help='Generate the workload of the trace again, ignoring the workload cache')
 
 argcomplete.autocomplete(parser)
 
@@ -337,12 +534,43 @@ try:
     ms_access_gateway = runner_parameters["ms_access_gateway"] # nginx access gateway ip
     workloads = runner_parameters["workload_files_path_list"] 
     threads = runner_parameters["thread_pool_size"] # n. parallel threads
-    trace = runner_parameters["trace"] # trace file
-    trace_output_dir = runner_parameters["output_dir"] # output directory
-    trace_output_file = runner_parameters["output_file"] # output file
-    multiplier = runner_parameters["multiplier"]
+    trace = None
+    if "trace" in runner_parameters.keys():
+        trace = runner_parameters["trace"] # trace file
+        trace_output_dir = runner_parameters["output_dir"] # output directory
+        trace_output_file = runner_parameters["output_file"] # output file
+    workload_gen_params = {"multiplier": 1, "ingress_service": "s0"}
+    if "multiplier" in runner_parameters.keys():
+        workload_gen_params["multiplier"] = runner_parameters["multiplier"]
+    if "ingress_service" in runner_parameters.keys():
+        workload_gen_params["ingress_service"] = runner_parameters["ingress_service"]
+    if "workload_generation" in runner_parameters.keys():
+        workload_gen_params.update(runner_parameters["workload_generation"])  # arrival model of the trace workload
+    cache_params = {"dir": None, "max_entries": 16, "max_size_mb": 2048, "invalidate": False}
+    if "workload_cache" in runner_parameters.keys():
+        cache_params.update(runner_parameters["workload_cache"])  # generated workloads: location and limits
+    if args.invalidate_cache:
+        cache_params["invalidate"] = True
     round = runner_parameters["workload_rounds"]  # number of repetition rounds
     result_file = runner_parameters["result_file"]  # number of repetition rounds
+    open_loop_params = {"max_in_flight": 1000, "connections": 0, "timeout": 60, "lookahead": 1024}
+    if "open_loop" in runner_parameters.keys():
+        open_loop_params.update(runner_parameters["open_loop"])  # open_loop workload_type: in-flight and pool limits
+    result_params = {"format": "text", "batch_size": 4096}
+    if "result_output" in runner_parameters.keys():
+        result_params.update(runner_parameters["result_output"])  # per-request records: "text" or "columnar"
+    sweep_params = {"mode": "concurrency", "steps": [1, 2, 4, 8, 16, 32, 64], "warmup": 5, "duration": 20, "pause": 0}
+    if "sweep" in runner_parameters.keys():
+        sweep_params.update(runner_parameters["sweep"])  # sweep workload_type: load ladder and windows (s)
+    latency_params = {"interval": 1, "csv": True, "raw_records": True}
+    if "latency_report" in runner_parameters.keys():
+        latency_params.update(runner_parameters["latency_report"])  # per-interval latency histograms and raw records
+    mix_params = dict()
+    if "request_mix" in runner_parameters.keys():
+        mix_params.update(runner_parameters["request_mix"])  # weighted bids and trace replay
+    distributed_params = {"processes": 1, "hosts": 1, "role": "coordinator", "port": 5600, "coordinator": None, "start_delay": 5}
+    if "distributed" in runner_parameters.keys():
+        distributed_params.update(runner_parameters["distributed"])  # open_loop workers: local processes and hosts
     if "OutputPath" in params.keys() and len(params["OutputPath"]) > 0:
         output_path = params["OutputPath"]
         if output_path.endswith("/"):
@@ -360,8 +588,18 @@ except Exception as err:
     print("ERROR: in Runner Parameters,", err)
     exit(1)
 
-# Generate workload json first using workloadGen.py
-os.system(f"python3 Experiment/workloadGen.py -t {trace} -o  {trace_output_dir} -f {trace_output_file} -m {multiplier}")
+# Workload of the trace from the cache, generated only if the trace or the generation parameters changed
+if trace is not None:
+    os.makedirs(trace_output_dir, exist_ok=True)
+    if cacheable(workload_gen_params):
+        cached_file = cached_workload(trace, cache_params["dir"] or os.path.join(trace_output_dir, ".workload_cache"),
+                                      workload_gen_params, os.path.splitext(trace_output_file)[1],
+                                      cache_params["max_entries"], cache_params["max_size_mb"], cache_params["invalidate"])
+        link_workload(cached_file, os.path.join(trace_output_dir, trace_output_file))
+    else:
+        # random arrivals without a seed, a new workload at every start
+        print("Workload cache: not used, no seed for the arrival model")
+        generate_workload(trace, trace_output_dir, trace_output_file, workload_gen_params)
 
 
 ## Check if "workloads" is a directory path, if so take all the workload files inside it
@@ -376,31 +614,61 @@ if os.path.isdir(workloads[0]):
 
 
 stats = list()
-local_latency_stats = list()
+latency_reporter = None
+result_writer = None
+# the traces are loaded and encoded once
+request_mix = RequestMix(mix_params)
+worker_params = {"open_loop": open_loop_params, "latency_report": latency_params, "result_output": result_params,
+                 "request_mix": mix_params}
+lag_stats = list()
 start_time = 0.0
+coordinator = None
+
+if runner_type=="open_loop" and distributed_params["role"]=="agent":
+    # workers of another host, the runs are received from the coordinator
+    run_agent(distributed_params["coordinator"], distributed_params["processes"], ms_access_gateway, worker_params,
+              f"{output_path}/{result_file}.agent")
+    exit(0)
+if runner_type=="open_loop" and (distributed_params["processes"] > 1 or distributed_params["hosts"] > 1):
+    coordinator = Coordinator(distributed_params["processes"], distributed_params["hosts"], distributed_params["port"],
+                              distributed_params["start_delay"])
 
 if runner_type=="greedy":
     greedy_runner()
-    with open(f"{output_path}/{result_file}.txt", "w") as f:
-        f.writelines("\n".join(stats))
+    if result_writer is None:
+        with open(f"{output_path}/{result_file}.txt", "w") as f:
+            f.writelines("\n".join(stats))
+
+elif runner_type=="sweep":
+    sweep_runner()
 
 elif runner_type=="periodic": 
     periodic_runner()
-    with open(f"{output_path}/{result_file}.txt", "w") as f:
-        f.writelines("\n".join(stats))
+    if result_writer is None:
+        with open(f"{output_path}/{result_file}.txt", "w") as f:
+            f.writelines("\n".join(stats))
 else:
-    # default runner is "file" type
+    # default runner is "file" type, "open_loop" uses the same workload files
     for cnt, workload_var in enumerate(workloads):
         for x in range(round):
             print("Round: %d -- workload: %s" % (x+1, workload_var))
-            processed_requests.value = 0
+            processed_requests.reset()
             timing_error_requests = 0
-            error_requests.value = 0
-            file_runner(workload_var)
+            error_requests.reset()
+            if runner_type=="open_loop":
+                open_loop_runner(workload_var)
+            else:
+                file_runner(workload_var)
             print("***************************************")
         if cnt != len(workloads) - 1:
             print("Sleep for 100 sec to allow completion of previus requests")
             time.sleep(100)
-        with open(f"{output_path}/{result_file}_{workload_var.split('/')[-1].split('.')[0]}.txt", "w") as f:
-            f.writelines("\n".join(stats))
- 
+        if runner_type!="open_loop" and result_writer is None:
+            with open(f"{output_path}/{result_file}_{workload_var.split('/')[-1].split('.')[0]}.txt", "w") as f:
+                f.writelines("\n".join(stats))
+        if runner_type=="open_loop":
+            # per-second schedule lag of the last round
+            with open(f"{output_path}/{result_file}_{workload_var.split('/')[-1].split('.')[0]}_lag.txt", "w") as f:
+                f.writelines("\n".join(" \t ".join(str(v) for v in s.values()) for s in lag_stats))
+    if coordinator is not None:
+        coordinator.stop()
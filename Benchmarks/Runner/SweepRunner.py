@@ -0,0 +1,150 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from LatencyHistogram import HdrHistogram, summary
+from OpenLoopEngine import OpenLoopEngine
+from RequestMix import RequestMix
+
+# Capacity discovery of the Runner: the load is stepped through a ladder of concurrency levels (closed loop, each
+# of the concurrent clients sends a new request as soon as the previous response is received) or of request rates
+# (open loop, Poisson arrivals), each step is held for a warm-up and a measurement window, and the throughput and
+# latency measured in the windows give the throughput-latency curve of the application.
+# The knee of the curve is the step that maximizes the distance between the normalized throughput and the
+# normalized p99 latency (Kneedle method on a convex curve): the highest throughput before latency grows steeply.
+# A curve whose p99 range is below KNEE_MIN_P99_RANGE of the highest p99, or whose maximum distance is not at an
+# interior step, has no knee (e.g. the ladder did not reach saturation).
+
+SWEEP_MODES = ["concurrency", "rate"]
+KNEE_MIN_P99_RANGE = 0.1  # minimum (max p99 - min p99) / max p99 of a curve with a knee
+SWEEP_CSV_HEADER = "step,load,throughput_rps,requests,errors,mean_ms,p50_ms,p90_ms,p99_ms,p99.9_ms,max_ms"
+
+
+class StepStats(object):
+    # latency of the requests of a step sent in the measurement window (times in s), throughput of the requests
+    # completed in the window
+    def __init__(self, window_start, window_end):
+        self.window_start = window_start
+        self.window_end = window_end
+        self.histogram = HdrHistogram()
+        self.errors = 0
+        self.completed = 0
+
+    def record(self, send_time, latency_ms, status_code):
+        if self.window_start <= send_time < self.window_end:
+            self.histogram.record(latency_ms)
+            if status_code != 200:
+                self.errors += 1
+        if self.window_start <= send_time + latency_ms / 1000 < self.window_end and status_code == 200:
+            self.completed += 1
+
+    def result(self, load):
+        s = summary(self.histogram)
+        s.update({"load": load, "requests": s["count"], "errors": self.errors,
+                  "throughput_rps": self.completed / (self.window_end - self.window_start)})
+        return s
+
+
+async def closed_loop_client(session, ms_access_gateway, service, request_mix, stats, end):
+    loop = asyncio.get_running_loop()
+    event = {"service": service}
+    while True:
+        method, path, body, content_type = request_mix.request(event)
+        start = loop.time()
+        if start >= end:
+            return
+        status_code = 0
+        try:
+            async with session.request(method, ms_access_gateway + path, data=body,
+                                       headers={"Content-Type": content_type} if content_type else None) as r:
+                await r.read()
+                status_code = r.status
+        except Exception as err:
+            print("Error: %s" % err)
+        stats.record(start, (loop.time() - start) * 1000, status_code)
+
+
+async def closed_loop_step(ms_access_gateway, service, request_mix, concurrency, warmup, duration, timeout=60):
+    loop = asyncio.get_running_loop()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        start = loop.time()
+        stats = StepStats(start + warmup, start + warmup + duration)
+        await asyncio.gather(*[closed_loop_client(session, ms_access_gateway, service, request_mix, stats, stats.window_end)
+                               for i in range(concurrency)])
+    return stats.result(concurrency)
+
+
+def poisson_events(service, rate, seconds, seed=None):
+    rnd = random.Random(seed)
+    t = rnd.expovariate(rate)
+    while t < seconds:
+        yield {"time": t * 1000, "service": service}
+        t += rnd.expovariate(rate)
+
+
+def rate_step(ms_access_gateway, service, request_mix, rate, warmup, duration, open_loop_params, seed=None):
+    start_at = time.time() + 1
+    stats = StepStats(start_at + warmup, start_at + warmup + duration)
+
+    def on_result(now_ms, latency_ms, status_code, processed, pending, event):
+        stats.record(now_ms / 1000, latency_ms, status_code)
+
+    engine = OpenLoopEngine(ms_access_gateway, max_in_flight=open_loop_params["max_in_flight"],
+                            connections=open_loop_params["connections"], timeout=open_loop_params["timeout"],
+                            on_result=on_result, verbose=False, request_mix=request_mix)
+    asyncio.run(engine.run(poisson_events(service, rate, warmup + duration, seed), start_at=start_at))
+    result = stats.result(rate)
+    result["timing_errors"] = engine.timing_error_requests
+    return result
+
+
+def find_knee(steps):
+    # index of the knee of the p99 latency - throughput curve, None if there are less than 3 steps, the p99 is flat
+    # or the maximum distance is at the first or last step
+    if len(steps) < 3:
+        return None
+    x = [s["throughput_rps"] for s in steps]
+    y = [s["p99"] for s in steps]
+    if max(y) - min(y) < KNEE_MIN_P99_RANGE * max(y):
+        return None
+    x_range = (max(x) - min(x)) or 1.0
+    y_range = max(y) - min(y)
+    distances = [(x[i] - min(x)) / x_range - (y[i] - min(y)) / y_range for i in range(len(steps))]
+    knee = max(range(len(steps)), key=lambda i: distances[i])
+    if knee == 0 or knee == len(steps) - 1 or distances[knee] <= 0:
+        return None
+    return knee
+
+
+def run_sweep(ms_access_gateway, service, sweep_params, open_loop_params, csv_file=None, request_mix=None):
+    if request_mix is None:
+        request_mix = RequestMix()
+    steps = list()
+    csv = open(csv_file, "w") if csv_file is not None else None
+    if csv is not None:
+        csv.write(SWEEP_CSV_HEADER + "\n")
+    for i, load in enumerate(sweep_params["steps"]):
+        print(f"Step {i + 1}/{len(sweep_params['steps'])}: {sweep_params['mode']} {load}, "
+              f"warm-up {sweep_params['warmup']} s, measurement {sweep_params['duration']} s")
+        if sweep_params["mode"] == "concurrency":
+            result = asyncio.run(closed_loop_step(ms_access_gateway, service, request_mix, int(load), sweep_params["warmup"],
+                                                  sweep_params["duration"], open_loop_params["timeout"]))
+        else:
+            result = rate_step(ms_access_gateway, service, request_mix, float(load), sweep_params["warmup"],
+                               sweep_params["duration"], open_loop_params, seed=i)
+        steps.append(result)
+        print(f"Throughput (req/sec) {result['throughput_rps']:.3f} - errors {result['errors']} - latency (ms) mean "
+              f"{result['mean']:.3f}, p50 {result['p50']:.3f}, p99 {result['p99']:.3f}, max {result['max']:.3f}")
+        if csv is not None:
+            csv.write(f"{i + 1},{load},{result['throughput_rps']:.3f},{result['requests']},{result['errors']},"
+                      f"{result['mean']:.3f},{result['p50']:.3f},{result['p90']:.3f},{result['p99']:.3f},"
+                      f"{result['p99.9']:.3f},{result['max']:.3f}\n")
+            csv.flush()
+        if sweep_params["pause"] > 0 and i < len(sweep_params["steps"]) - 1:
+            time.sleep(sweep_params["pause"])
+    if csv is not None:
+        csv.close()
+    return steps, find_knee(steps)
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+sys.path.append(f'{os.path.dirname(os.path.abspath(__file__))}/../../Experiment')
+from workloadGen import GENERATOR_VERSION, RANDOM_ARRIVAL_MODELS, workloadGen
+
+# Content-addressed cache of the workloads generated from QPS traces (Experiment/workloadGen.py).
+# A workload is keyed by the hash of the contents of the trace file, of the generation parameters (multiplier,
+# ingress service, arrival model, ...), of the output format and of the generator version: a Runner start with an
+# unchanged trace reuses the cached file instead of generating it again. Random arrival models without a seed are not
+# cached, each start generates a new workload. The least recently used entries are removed beyond max_entries files or
+# max_size_mb MB.
+
+GENERATION_DEFAULTS = {"multiplier": 1, "ingress_service": "s0", "arrival": "uniform", "seed": None, "bursts": 1,
+                       "burst_ms": 100, "max_seconds": None}
+
+
+def workload_key(trace, gen_params, extension):
+    h = hashlib.sha256()
+    with open(trace, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    h.update(json.dumps([GENERATOR_VERSION, gen_params, extension], sort_keys=True).encode())
+    return h.hexdigest()[:32]
+
+
+def generation_params(gen_params):
+    params = dict(GENERATION_DEFAULTS)
+    params.update(gen_params)
+    return params
+
+
+def cacheable(gen_params):
+    # the workload of a random arrival model is reproducible only with a seed
+    params = generation_params(gen_params)
+    return params["seed"] is not None or params["arrival"] not in RANDOM_ARRIVAL_MODELS
+
+
+def generate_workload(trace, output_dir, output_file, gen_params, tmp_name=None):
+    # written to a temporary file and renamed, output_file may be a link to a cached workload
+    params = generation_params(gen_params)
+    tmp_name = tmp_name or f".{output_file}.{os.getpid()}.tmp{os.path.splitext(output_file)[1]}"
+    workloadGen(trace, output_dir, tmp_name, params["ingress_service"], params["multiplier"], params["arrival"],
+                params["seed"], params["bursts"], params["burst_ms"], params["max_seconds"])
+    path = os.path.join(output_dir, output_file)
+    os.replace(os.path.join(output_dir, tmp_name), path)
+    return path
+
+
+def cache_entries(cache_dir):
+    # (mtime, size, path) of the cached workloads, least recently used first
+    entries = list()
+    for file_name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, file_name)
+        if not file_name.startswith(".") and os.path.isfile(path):
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+    return sorted(entries)
+
+
+def evict(cache_dir, max_entries, max_size_mb, keep=None):
+    entries = cache_entries(cache_dir)
+    size = sum(e[1] for e in entries)
+    for mtime, entry_size, path in entries:
+        if len(entries) <= max_entries and size <= max_size_mb * 1024 * 1024:
+            break
+        if path == keep:
+            continue
+        os.remove(path)
+        entries = [e for e in entries if e[2] != path]
+        size -= entry_size
+        print(f"Workload cache: removed {os.path.basename(path)}")
+
+
+def link_workload(path, output_file):
+    # output_file as a hard link to the cached workload, a copy if the link is not possible
+    if os.path.exists(output_file) and os.path.samefile(path, output_file):
+        # renaming a link over another link of the same file does nothing
+        return
+    tmp_file = f"{output_file}.{os.getpid()}.tmp"
+    try:
+        os.link(path, tmp_file)
+    except OSError:
+        shutil.copyfile(path, tmp_file)
+    os.replace(tmp_file, output_file)
+
+
+def cached_workload(trace, cache_dir, gen_params, extension=".mubw", max_entries=16, max_size_mb=2048,
+                    invalidate=False):
+    # path of the cached workload of a trace, generated if missing (or if invalidate)
+    params = generation_params(gen_params)
+    os.makedirs(cache_dir, exist_ok=True)
+    key = workload_key(trace, params, extension)
+    path = os.path.join(cache_dir, key + extension)
+    if os.path.exists(path) and not invalidate:
+        os.utime(path)
+        print(f"Workload cache: {trace} -> {path}")
+        return path
+    generate_workload(trace, cache_dir, key + extension, params, f".{key}.{os.getpid()}{extension}")
+    print(f"Workload cache: generated {path}")
+    evict(cache_dir, max_entries, max_size_mb, keep=path)
+    return path
@@ -0,0 +1,169 @@
+import argparse
+import heapq
+import itertools
+import json
+import mmap
+import struct
+
+import numpy as np
+
+# Streaming workload files of the Runner, read lazily so that memory does not grow with the length of the run.
+# Formats:
+#  - JSON array (legacy): [{"time": ms, "service": "s0"}, ...], loaded in memory and sorted
+#  - NDJSON: one event per line, {"time": ms, "service": "s0", "bid": "b1"} ("bid" is optional)
+#  - binary (.mubw): a 24-byte header (magic, version, number of records, offset of the name tables), fixed-size
+#    (time_ms float64, service index uint16, bid index uint16) records, memory-mapped, and the JSON name tables of
+#    services and bids at the end, so that the file can be written in a single pass
+# Events of NDJSON and binary files are expected in time order; a lookahead window reorders events that are
+# slightly out of order.
+
+MAGIC = b"MUBW"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQ")  # magic, version, reserved, number of records, offset of the name tables
+RECORD = struct.Struct("<dHH")  # time (ms), service index, bid index
+NO_BID = 0xFFFF
+RECORD_DTYPE = np.dtype([("time", "<f8"), ("service", "<u2"), ("bid", "<u2")])  # same layout as RECORD
+
+
+class BinaryWorkload(object):
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.count, tables_offset = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a binary workload file: {path}")
+        tables = json.loads(self.mm[tables_offset:])
+        self.services = tables["services"]
+        self.bids = tables["bids"]
+        self.end = HEADER.size + self.count * RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        services = self.services
+        bids = self.bids
+        for time_ms, service, bid in RECORD.iter_unpack(memoryview(self.mm)[HEADER.size:self.end]):
+            if bid == NO_BID:
+                yield {"time": time_ms, "service": services[service]}
+            else:
+                yield {"time": time_ms, "service": services[service], "bid": bids[bid]}
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+
+def read_ndjson(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def ordered(events, lookahead):
+    # events in time order, provided that each event is at most lookahead positions later than its place
+    window = list()
+    for seq, event in enumerate(events):
+        heapq.heappush(window, (event["time"], seq, event))
+        if len(window) > lookahead:
+            yield heapq.heappop(window)[2]
+    while window:
+        yield heapq.heappop(window)[2]
+
+
+def open_workload(path, lookahead=1024):
+    # iterable of the events of a workload file in time order
+    with open(path, "rb") as f:
+        head = f.read(len(MAGIC))
+        while head[:1].isspace():
+            head = head[1:] + f.read(1)
+    if head == MAGIC:
+        events = BinaryWorkload(path)
+    elif head[:1] == b"[":
+        with open(path) as f:
+            events = json.load(f)
+        events.sort(key=lambda event: event["time"])
+        return events
+    else:
+        events = read_ndjson(path)
+    return ordered(events, lookahead) if lookahead > 0 else events
+
+
+def worker_events(events, worker, workers):
+    # deterministic share of a worker: events worker, worker + workers, worker + 2 * workers, ...
+    return itertools.islice(events, worker, None, workers)
+
+
+def write_ndjson(events, path):
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+
+
+def write_binary(events, path):
+    services = dict()
+    bids = dict()
+    count = 0
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        for event in events:
+            service = services.setdefault(event["service"], len(services))
+            bid = bids.setdefault(event["bid"], len(bids)) if event.get("bid") is not None else NO_BID
+            if service >= NO_BID or (bid >= NO_BID and event.get("bid") is not None):
+                raise ValueError("Too many services or bids for the binary workload format")
+            f.write(RECORD.pack(event["time"], service, bid))
+            count += 1
+        tables_offset = f.tell()
+        f.write(json.dumps({"services": list(services.keys()), "bids": list(bids.keys())}).encode())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, 0, count, tables_offset))
+
+
+def write_binary_chunks(chunks, path, services, bids=()):
+    # binary file of chunks of RECORD_DTYPE arrays, whose service and bid columns index the name lists
+    if len(services) >= NO_BID or len(bids) >= NO_BID:
+        raise ValueError("Too many services or bids for the binary workload format")
+    count = 0
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        for records in chunks:
+            f.write(records.astype(RECORD_DTYPE, copy=False).tobytes())
+            count += len(records)
+        tables_offset = f.tell()
+        f.write(json.dumps({"services": list(services), "bids": list(bids)}).encode())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, 0, count, tables_offset))
+
+
+def record_events(records, services, bids=()):
+    # events of a RECORD_DTYPE array
+    for time_ms, service, bid in records.tolist():
+        if bid == NO_BID:
+            yield {"time": time_ms, "service": services[service]}
+        else:
+            yield {"time": time_ms, "service": services[service], "bid": bids[bid]}
+
+
+def write_workload(events, path):
+    # format from the file extension: .mubw binary, .json JSON array, NDJSON otherwise
+    if path.endswith(".mubw"):
+        write_binary(events, path)
+    elif path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(list(events), f)
+    else:
+        write_ndjson(events, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a Runner workload file (JSON, NDJSON or binary)")
+    parser.add_argument('-i', '--input', type=str, dest='input', required=True, help='input workload file')
+    parser.add_argument('-o', '--output', type=str, dest='output', required=True,
+                        help='output workload file (.mubw binary, .json JSON array, NDJSON otherwise)')
+    args = parser.parse_args()
+    write_workload(open_workload(args.input), args.output)
+
+
+if __name__ == '__main__':
+    main()
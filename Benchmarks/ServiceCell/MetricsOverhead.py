@@ -0,0 +1,98 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# prometheus_client reads the multiprocess directory at import time
+os.environ["prometheus_multiproc_dir"] = tempfile.mkdtemp(prefix="mub-metrics-")
+sys.path.append(f'{os.path.dirname(os.path.abspath(__file__))}/../../ServiceCell')
+from prometheus_client import CollectorRegistry, Summary, Histogram, multiprocess, generate_latest
+from RequestMetrics import RequestMetrics, OPTIONAL_LABELS
+
+# Micro-benchmark of the per-request metrics overhead of a service-cell (prometheus_client multiprocess mode):
+# "legacy" is the 8 labels(...).observe(...) calls per request of the original handlers, "direct" and "buffered" are
+# the RequestMetrics modes; the flush time of the buffered mode (done by a background thread) is reported apart
+
+ZONE = "default"
+K8S_APP = "s0"
+ID = "s0"
+buckets = [0.5, 1, 10, 100, 1000, 10000, float("inf")]
+internal_labels = ['zone', 'app_name', 'method', 'endpoint', 'execution']
+external_labels = ['zone', 'app_name', 'method', 'endpoint']
+request_labels = ['zone', 'app_name', 'method', 'endpoint', 'from', 'kubernetes_service']
+
+
+def define_metrics(prefix, request_metrics):
+    registry = CollectorRegistry()
+    metrics = dict()
+    metrics["response_size"] = [Summary(f'{prefix}_response_size', '', request_metrics.labels(request_labels), registry=registry)]
+    for name, labels in [("internal", internal_labels), ("external", external_labels), ("request", request_labels)]:
+        metrics[name] = [Summary(f'{prefix}_{name}', '', request_metrics.labels(labels), registry=registry),
+                         Histogram(f'{prefix}_{name}_bucket', '', request_metrics.labels(labels), registry=registry, buckets=buckets)]
+        request_metrics.register(name, labels, metrics[name], buckets)
+    request_metrics.register("response_size", request_labels, metrics["response_size"])
+    return metrics
+
+
+def legacy_request(metrics, remote_addr, latency):
+    (INTERNAL_PROCESSING, INTERNAL_PROCESSING_BUCKET) = metrics["internal"]
+    (EXTERNAL_PROCESSING, EXTERNAL_PROCESSING_BUCKET) = metrics["external"]
+    (REQUEST_PROCESSING, REQUEST_PROCESSING_BUCKET) = metrics["request"]
+    (RESPONSE_SIZE,) = metrics["response_size"]
+    INTERNAL_PROCESSING.labels(ZONE, K8S_APP, "GET", "/api/v1", "inline").observe(latency)
+    INTERNAL_PROCESSING_BUCKET.labels(ZONE, K8S_APP, "GET", "/api/v1", "inline").observe(latency)
+    RESPONSE_SIZE.labels(ZONE, K8S_APP, "GET", "/api/v1", remote_addr, ID).observe(1000)
+    EXTERNAL_PROCESSING.labels(ZONE, K8S_APP, "GET", "/api/v1").observe(latency)
+    EXTERNAL_PROCESSING_BUCKET.labels(ZONE, K8S_APP, "GET", "/api/v1").observe(latency)
+    REQUEST_PROCESSING.labels(ZONE, K8S_APP, "GET", "/api/v1", remote_addr, ID).observe(latency)
+    REQUEST_PROCESSING_BUCKET.labels(ZONE, K8S_APP, "GET", "/api/v1", remote_addr, ID).observe(latency)
+
+
+def request_metrics_request(request_metrics, remote_addr, latency):
+    request_metrics.observe("internal", (ZONE, K8S_APP, "GET", "/api/v1", "inline"), latency)
+    request_metrics.observe("response_size", (ZONE, K8S_APP, "GET", "/api/v1", remote_addr, ID), 1000)
+    request_metrics.observe("external", (ZONE, K8S_APP, "GET", "/api/v1"), latency)
+    request_metrics.observe("request", (ZONE, K8S_APP, "GET", "/api/v1", remote_addr, ID), latency)
+
+
+def run(name, fn, state, n, clients):
+    random.seed(0)
+    remote_addrs = [f"10.0.{i // 256}.{i % 256}" for i in range(clients)]
+    latencies = [random.expovariate(1 / 20) for i in range(1000)]
+    start = time.perf_counter()
+    for i in range(n):
+        fn(state, remote_addrs[i % clients], latencies[i % 1000])
+    elapsed = time.perf_counter() - start
+    print(f"{name:>18}: {elapsed / n * 1e6:8.2f} us/request")
+    return elapsed / n
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--requests', type=int, default=100000, help='Number of emulated requests')
+parser.add_argument('-c', '--clients', type=int, default=16, help='Number of client addresses (from label)')
+args = parser.parse_args()
+
+legacy_metrics = define_metrics("legacy", RequestMetrics("direct"))
+run("legacy", legacy_request, legacy_metrics, args.requests, args.clients)
+
+direct = RequestMetrics("direct")
+define_metrics("direct", direct)
+run("direct", request_metrics_request, direct, args.requests, args.clients)
+
+no_from = RequestMetrics("direct", optional_labels=[label for label in OPTIONAL_LABELS if label != 'from'])
+define_metrics("no_from", no_from)
+run("direct, no 'from'", request_metrics_request, no_from, args.requests, args.clients)
+
+buffered = RequestMetrics("buffered")
+define_metrics("buffered", buffered)
+run("buffered", request_metrics_request, buffered, args.requests, args.clients)
+start = time.perf_counter()
+series = buffered.flush()
+print(f"{'buffered flush':>18}: {(time.perf_counter() - start) / args.requests * 1e6:8.2f} us/request "
+      f"(background thread, {series} series)")
+
+registry = CollectorRegistry()
+multiprocess.MultiProcessCollector(registry)
+print(f"exposition size: {len(generate_latest(registry))} bytes")
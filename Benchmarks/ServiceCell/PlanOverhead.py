@@ -0,0 +1,102 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(f'{os.path.dirname(os.path.abspath(__file__))}/../../ServiceCell')
+from ExecutionPlan import compile_plans, get_behaviour
+
+# Micro-benchmark of the per-request dispatch overhead of a service-cell, without network and internal-service load:
+# "legacy" re-reads the workmodel for every request (behaviour selection, url f-strings, escape splits),
+# "plan" uses the execution plans precompiled by ExecutionPlan
+
+traceEscapeString = "__"
+
+
+def cpu_loader(params):
+    return ""
+
+
+def make_work_model(n_groups, n_services, n_behaviours):
+    work_model = dict()
+    external_services = list()
+    for g in range(n_groups):
+        services = [f"s{g * n_services + i + 1}" for i in range(n_services)]
+        external_services.append({"seq_len": n_services // 2 + 1, "services": services,
+                                  "probabilities": {service: 0.9 for service in services}})
+        for service in services:
+            work_model[service] = {"url": f"{service}.default.svc.cluster.local", "path": "/api/v1"}
+    alternative_behaviors = {f"b{b}": {"external_services": external_services[:1]} for b in range(n_behaviours)}
+    work_model["s0"] = {"url": "s0.default.svc.cluster.local", "path": "/api/v1",
+                        "internal_service": {"cpu_loader": {"range_complexity": [10, 10], "trials": 1}},
+                        "external_services": external_services, "alternative_behaviors": alternative_behaviors}
+    return work_model
+
+
+def resolve_internal(internal_service):
+    function_name = list(internal_service)[0]
+    return eval(function_name), internal_service[function_name]
+
+
+def legacy_request(work_model, behaviour_id, query_string):
+    my_work_model = work_model["s0"]
+    my_service_graph = my_work_model['external_services']
+    my_internal_service = my_work_model['internal_service']
+    if behaviour_id != 'default' and "alternative_behaviors" in my_work_model.keys():
+        if behaviour_id in my_work_model['alternative_behaviors'].keys():
+            if "internal_service" in my_work_model['alternative_behaviors'][behaviour_id].keys():
+                my_internal_service = my_work_model['alternative_behaviors'][behaviour_id]['internal_service']
+            if "external_services" in my_work_model['alternative_behaviors'][behaviour_id].keys():
+                my_service_graph = my_work_model['alternative_behaviors'][behaviour_id]['external_services']
+    function, params = resolve_internal(my_internal_service)
+    urls = list()
+    for group in my_service_graph:
+        selected_services = random.sample(group['services'], k=group['seq_len'])
+        for service in selected_services:
+            service_no_escape = service.split(traceEscapeString)[0]
+            if "probabilities" in group.keys() and service in group["probabilities"].keys():
+                p = group["probabilities"][service]
+            else:
+                p = 1
+            if random.random() < p:
+                urls.append(f'http://{work_model[service_no_escape]["url"]}{work_model[service_no_escape]["path"]}?{query_string}')
+    return function, params, urls
+
+
+def plan_request(plans, behaviour_id, query_string):
+    plan = get_behaviour(plans, behaviour_id)
+    urls = list()
+    for group in plan.groups:
+        calls = random.sample(group.calls, k=group.seq_len) if group.sample else group.calls
+        for service, url, p in calls:
+            if p >= 1 or random.random() < p:
+                urls.append(f'{url}?{query_string}' if len(query_string) > 0 else url)
+    return plan.internal_function, plan.internal_params, urls
+
+
+def run(name, fn, state, behaviour_ids, query_string, n):
+    random.seed(0)
+    start = time.perf_counter()
+    for i in range(n):
+        fn(state, behaviour_ids[i % len(behaviour_ids)], query_string)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {elapsed / n * 1e6:8.2f} us/request")
+    return elapsed / n
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-g', '--groups', type=int, default=4, help='External-service groups of the service')
+parser.add_argument('-s', '--services', type=int, default=4, help='Services per group')
+parser.add_argument('-b', '--behaviours', type=int, default=8, help='Alternative behaviours of the service')
+parser.add_argument('-n', '--requests', type=int, default=200000, help='Number of emulated requests')
+args = parser.parse_args()
+
+work_model = make_work_model(args.groups, args.services, args.behaviours)
+plans = compile_plans(work_model, "s0", resolve_internal, traceEscapeString)
+behaviour_ids = ['default'] + [f"b{b}" for b in range(args.behaviours)]
+query_string = "bid=default"
+
+legacy = run("legacy", legacy_request, work_model, behaviour_ids, query_string, args.requests)
+plan = run("plan", plan_request, plans, behaviour_ids, query_string, args.requests)
+print(f"speedup: {legacy / plan:.2f}x")
@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(f'{os.path.dirname(os.path.abspath(__file__))}/../../ServiceCell')
+from TraceCodec import encode_trace, decode_trace, subtrace_body
+
+# Micro-benchmark of the trace handling work done by all the service-cells spanned by a trace-driven request,
+# without network: "json" parses the received subtree and re-serializes every child subtree at each hop,
+# "binary" decodes only the direct children and forwards slices of the received body (TraceCodec)
+
+
+def make_trace(depth, fanout, name="s0"):
+    if depth == 0:
+        return {f"{name}__{random.randrange(100000)}": [{}]}
+    children = dict()
+    for i in range(fanout):
+        children.update(make_trace(depth - 1, fanout, f"s{random.randrange(100)}"))
+    return {f"{name}__{random.randrange(100000)}": [children]}
+
+
+def json_hop(body):
+    trace = json.loads(body)
+    name = list(trace)[0]
+    for group in trace[name]:
+        for service, subtrace in group.items():
+            content_type, payload = subtrace_body(service, subtrace)
+            json_hop(payload)
+
+
+def binary_hop(body):
+    trace = decode_trace(body)
+    name = list(trace)[0]
+    for group in trace[name]:
+        for service, subtrace in group.items():
+            content_type, payload = subtrace_body(service, subtrace)
+            binary_hop(payload)
+
+
+def run(name, fn, body, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(body)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>8}: {elapsed / n * 1e3:8.3f} ms/request -- gateway body {len(body)} bytes")
+    return elapsed / n
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-d', '--depth', type=int, default=6, help='Depth of the trace')
+parser.add_argument('-f', '--fanout', type=int, default=3, help='Called services per service')
+parser.add_argument('-n', '--requests', type=int, default=50, help='Number of emulated requests')
+args = parser.parse_args()
+
+random.seed(0)
+trace = make_trace(args.depth, args.fanout)
+json_time = run("json", json_hop, json.dumps(trace), args.requests)
+# the gateway still receives JSON, encoded once by the first service-cell
+binary_time = run("binary", lambda body: binary_hop(encode_trace(json.loads(body))), json.dumps(trace), args.requests)
+print(f"speedup: {json_time / binary_time:.2f}x")
@@ -0,0 +1,52 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(f'{os.path.dirname(os.path.abspath(__file__))}/../../ServiceCell')
+import Tracing
+from Tracing import init_tracing, start_server_span, start_span, start_client_span, end_span
+
+# Micro-benchmark of the per-request tracing overhead of a service-cell (requires opentelemetry-sdk), without network:
+# a server span, an internal-processing span and a client span (with header injection) per external-service call,
+# exported in batches to a file; the time spent by the export thread is included, since it shares the GIL
+
+
+def emulated_request(calls, headers):
+    server_span, span_context, headers = start_server_span("s0", headers)
+    internal_span = start_span("internal_service", span_context)
+    end_span(internal_span)
+    for i in range(calls):
+        span, call_headers = start_client_span(f"s{i + 1}", span_context, headers)
+        end_span(span, 200)
+    end_span(server_span, 200)
+
+
+def run(name, n, calls):
+    headers = {'x-request-id': '0af7651916cd43dd8448eb211c80319c'}
+    start = time.perf_counter()
+    for i in range(n):
+        emulated_request(calls, headers)
+    if Tracing.tracer_provider is not None:
+        # wait for the export of the queued spans
+        Tracing.tracer_provider.force_flush()
+    elapsed = time.perf_counter() - start
+    print(f"{name:>10}: {elapsed / n * 1e6:8.2f} us/request")
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', '--requests', type=int, default=20000, help='Number of emulated requests')
+parser.add_argument('-c', '--calls', type=int, default=4, help='External-service calls per request')
+args = parser.parse_args()
+
+logger = logging.getLogger("TracingOverhead")
+spans_file = f"{tempfile.mkdtemp(prefix='mub-spans-')}/spans"
+run("disabled", args.requests, args.calls)
+for sample_rate in [0.01, 0.1, 1.0]:
+    # a new provider for each sampling rate
+    Tracing.tracer_pid = None
+    init_tracing("s0", {"enabled": True, "sample_rate": sample_rate, "exporter": "file", "file": spans_file}, logger)
+    run(f"{sample_rate * 100:g}%", args.requests, args.calls)
+    Tracing.tracer_provider.shutdown()
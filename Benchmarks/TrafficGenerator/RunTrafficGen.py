@@ -1,9 +1,11 @@
-from TrafficGenerator import get_Traffic, Traffic_PATH
+from TrafficGenerator import traffic_chunks, Traffic_PATH
+from WorkloadStream import record_events, write_binary_chunks
 import json
 from pprint import pprint
 import sys
 import os
 import shutil
+from collections import Counter
 
 import argparse
 import argcomplete
@@ -48,15 +50,33 @@ except Exception as err:
     print("ERROR: in RunTrafficGen,", err)
     exit(1)
 
-Traffic = get_Traffic(Traffic_parameters)
-pprint(Traffic)
-print("# Events: %d" % len(Traffic))
+chunks, services = traffic_chunks(Traffic_parameters)
 # keyboard_input = input("Save work model on file? (y)") or "y"
 keyboard_input = "y"
 
 if keyboard_input == "y":
-    with open(f"{output_path}/{output_file}", "w") as f:
-        f.write(json.dumps(Traffic, indent=2))
+    # events written chunk by chunk: .mubw binary, .json JSON array, NDJSON otherwise
+    events_cnt = Counter()
+
+    def counted_chunks():
+        for records in chunks:
+            events_cnt.update(records["service"].tolist())
+            yield records
+
+    counted = counted_chunks()
+    if output_file.endswith(".mubw"):
+        write_binary_chunks(counted, f"{output_path}/{output_file}", services)
+    elif output_file.endswith(".json"):
+        Traffic = [event for records in counted for event in record_events(records, services)]
+        with open(f"{output_path}/{output_file}", "w") as f:
+            f.write(json.dumps(Traffic, indent=2))
+    else:
+        with open(f"{output_path}/{output_file}", "w") as f:
+            for records in counted:
+                f.writelines(json.dumps(event) + "\n" for event in record_events(records, services))
+    for i, service in enumerate(services):
+        print("# Events %s: %d" % (service, events_cnt[i]))
+    print("# Events: %d" % sum(events_cnt.values()))
 
     #if output_path != Traffic_PATH:
     #    shutil.copy(parameters_file_path, f"{output_path}/")
@@ -1,20 +1,155 @@
-import random
 import os
+import sys
+
+import numpy as np
 
 Traffic_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(f'{Traffic_PATH}/../Runner')
+from WorkloadStream import NO_BID, RECORD_DTYPE
 
-def get_Traffic(Traffic_params):
-    ingress_service = Traffic_params["ingress_service"]
+# Arrival processes of the synthetic traffic, event times in ms (float, sub-millisecond):
+#  - poisson: exponential inter-arrivals at `rate` req/s
+#  - mmpp: Markov-modulated Poisson process, the rate is rates[i] in state i and each state lasts an exponential time
+#    of mean mean_sojourn[i] s before moving to another state (bursty traffic)
+#  - diurnal: Poisson process whose rate follows a sinusoid, rate * (1 + amplitude * sin(2 pi t / period + phase))
+#  - on_off: Poisson at `rate` during the on periods, no requests during the off periods (exponential lengths of mean
+#    mean_on and mean_off s)
+# Events are generated in chunks of NumPy arrays of about CHUNK_EVENTS events, up to the duration if given, and split
+# among the ingress services with the given weights.
+
+ARRIVAL_PROCESSES = ["poisson", "mmpp", "diurnal", "on_off"]
+CHUNK_EVENTS = 1 << 18
+CHUNK_SEGMENTS = 1024
+CHUNK_SECONDS = 600
+
+
+def poisson_chunks(rng, rate, end=None):
+    t0 = 0.0
+    while end is None or t0 < end:
+        times = t0 + np.cumsum(rng.exponential(1000.0 / rate, CHUNK_EVENTS))
+        t0 = times[-1]
+        yield times
+
+
+def mmpp_segments(rng, states, mean_sojourn):
+    # states and lengths (ms) of consecutive sojourns, CHUNK_SEGMENTS at a time
+    state = 0
+    while True:
+        # next state drawn among the other states
+        steps = rng.integers(1, states, CHUNK_SEGMENTS) if states > 1 else np.zeros(CHUNK_SEGMENTS, dtype=np.int64)
+        segment_states = (state + np.concatenate(([0], np.cumsum(steps[:-1])))) % states
+        state = (segment_states[-1] + steps[-1]) % states
+        yield segment_states, rng.exponential(mean_sojourn[segment_states])
+
+
+def mmpp_chunks(rng, rates, mean_sojourn, end=None):
+    rates = np.asarray(rates, dtype=np.float64)
+    mean_sojourn = np.asarray(mean_sojourn, dtype=np.float64) * 1000
+    segments = mmpp_segments(rng, len(rates), mean_sojourn)
+    states, lengths = next(segments)
+    t0 = 0.0
+    while end is None or t0 < end:
+        # sojourns of at most CHUNK_EVENTS expected events, a longer sojourn is split and continues in the next chunk
+        # (the arrivals within a state are memoryless)
+        expected = np.cumsum(rates[states] * lengths / 1000)
+        n = int(np.searchsorted(expected, CHUNK_EVENTS, side="right"))
+        if n == len(states):
+            chunk_states, chunk_lengths = states, lengths
+            states, lengths = next(segments)
+        else:
+            cut = (CHUNK_EVENTS - (expected[n - 1] if n > 0 else 0)) * 1000 / rates[states[n]]
+            chunk_states, chunk_lengths = states[:n + 1], np.append(lengths[:n], cut)
+            states, lengths = states[n:], lengths[n:].copy()
+            lengths[0] -= cut
+        starts = t0 + np.cumsum(chunk_lengths) - chunk_lengths
+        t0 = starts[-1] + chunk_lengths[-1]
+        if end is not None:
+            chunk_lengths = np.clip(end - starts, 0, chunk_lengths)
+        counts = rng.poisson(rates[chunk_states] * chunk_lengths / 1000)
+        times = np.repeat(starts, counts) + rng.random(counts.sum()) * np.repeat(chunk_lengths, counts)
+        times.sort()
+        yield times
+
+
+def diurnal_chunks(rng, rate, amplitude, period, phase, end=None):
+    # thinning of a Poisson process at the peak rate, about CHUNK_EVENTS candidate events per chunk
+    peak = rate * (1 + abs(amplitude))
+    chunk_seconds = min(CHUNK_SECONDS, CHUNK_EVENTS / peak) if peak > 0 else CHUNK_SECONDS
+    t0 = 0.0
+    while end is None or t0 < end:
+        times = np.sort(t0 + rng.random(rng.poisson(peak * chunk_seconds)) * chunk_seconds * 1000)
+        rates = rate * (1 + amplitude * np.sin(2 * np.pi * times / (period * 1000) + phase))
+        t0 += chunk_seconds * 1000
+        yield times[rng.random(len(times)) * peak < rates]
+
+
+def arrival_chunks(rng, process, default_rate, end=None):
+    # sorted event times (ms) of an arrival process, chunk by chunk, up to end (ms) if given
+    kind = process.get("type", "poisson")
+    rate = process.get("rate", default_rate)
+    if kind in ["poisson", "diurnal", "on_off"] and rate is None:
+        raise ValueError("rate or mean_interarrival_time is required")
+    if kind == "poisson":
+        return poisson_chunks(rng, rate, end)
+    if kind == "mmpp":
+        return mmpp_chunks(rng, process["rates"], process["mean_sojourn"], end)
+    if kind == "diurnal":
+        return diurnal_chunks(rng, rate, process.get("amplitude", 0.5), process.get("period", 86400),
+                              process.get("phase", 0), end)
+    if kind == "on_off":
+        return mmpp_chunks(rng, [rate, 0], [process["mean_on"], process["mean_off"]], end)
+    raise ValueError(f"Unsupported arrival process: {kind}")
+
+
+def ingress_weights(ingress_service):
+    # service names and probabilities of a service, a list of services (same weight) or a {service: weight} dict
+    if isinstance(ingress_service, str):
+        return [ingress_service], None
+    if isinstance(ingress_service, dict):
+        weights = np.asarray(list(ingress_service.values()), dtype=np.float64)
+        return list(ingress_service.keys()), weights / weights.sum()
+    return list(ingress_service), None
+
+
+def traffic_chunks(Traffic_params):
+    # RECORD_DTYPE arrays of the events, and the service names of the records
     request_params = Traffic_params["request_parameters"]
-    Traffic_l = list()
-    events_cnt = 0
-    time = 0
+    stop_event = request_params.get("stop_event")
+    duration = request_params.get("duration")  # s
+    if stop_event is None and duration is None:
+        raise ValueError("stop_event or duration is required")
+    services, weights = ingress_weights(Traffic_params["ingress_service"])
+    rng = np.random.default_rng(Traffic_params.get("seed"))
+    default_rate = 1000.0 / request_params["mean_interarrival_time"] if "mean_interarrival_time" in request_params else None
+    times_chunks = arrival_chunks(rng, Traffic_params.get("arrival_process", dict()), default_rate,
+                                  duration * 1000 if duration is not None else None)
 
-    while events_cnt < request_params["stop_event"]:
-        Traffic_l.append({"time": time, "service": ingress_service})
-        next_event = round(random.expovariate(1 / request_params["mean_interarrival_time"]))  # Gli interarrivi sono exp neg, il tempo in millisecondi
-        time += next_event
-        events_cnt += 1
+    def chunks():
+        events_cnt = 0
+        for times in times_chunks:
+            stop = False
+            if duration is not None and len(times) > 0 and times[-1] >= duration * 1000:
+                times = times[:np.searchsorted(times, duration * 1000)]
+                stop = True
+            if stop_event is not None and events_cnt + len(times) >= stop_event:
+                times = times[:stop_event - events_cnt]
+                stop = True
+            records = np.empty(len(times), dtype=RECORD_DTYPE)
+            records["time"] = times
+            records["service"] = rng.choice(len(services), len(times), p=weights) if len(services) > 1 else 0
+            records["bid"] = NO_BID
+            events_cnt += len(records)
+            yield records
+            if stop:
+                return
+
+    return chunks(), services
 
-    return Traffic_l
 
+def get_Traffic(Traffic_params):
+    chunks, services = traffic_chunks(Traffic_params)
+    Traffic_l = list()
+    for records in chunks:
+        Traffic_l.extend({"time": t, "service": services[s]} for t, s in zip(records["time"].tolist(),
+                                                                            records["service"].tolist()))
+    return Traffic_l
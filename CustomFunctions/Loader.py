@@ -5,12 +5,28 @@ from concurrent.futures import ThreadPoolExecutor, wait
 import jsonmerge
 import string
 
+try:
+    # calibrated CPU load engine of the service-cell
+    from CpuBurner import burn, sample_cpu_time
+except ImportError:
+    burn = None
+try:
+    # preallocated response payloads of the service-cell
+    from ResponsePayload import get_payload
+except ImportError:
+    get_payload = None
+
 params_processed = False
 params = dict()
 
 def cpu_loader_job(params):
-    cpu_load = random.randint(params["range_complexity"][0], params["range_complexity"][1])
     trials = int(params["trials"])
+    if "cpu_time_ms" in params and burn is not None:
+        # CPU demand in ms of CPU time per trial
+        for x in range(trials):
+            burn(sample_cpu_time(params["cpu_time_ms"]), params.get("kernel", "python"))
+        return
+    cpu_load = random.randint(params["range_complexity"][0], params["range_complexity"][1])
 
     for x in range(trials):
         pi_greco = list()
@@ -43,6 +59,8 @@ def cpu_loader(params):
 
 def bandwidth_loader(params):
     # print("--------> Network stress start")
+    if get_payload is not None:
+        return get_payload(params["mean_response_size"], params.get("response_content", "incompressible"))
     bandwidth_load = random.expovariate(1 / params["mean_response_size"])
     num_chars = int(max(1, 1000 * bandwidth_load))  # Response in kB
     response_body = ''.join(random.choice(string.ascii_letters) for i in range(num_chars))
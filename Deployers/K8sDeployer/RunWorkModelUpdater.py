@@ -0,0 +1,114 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+import K8sYamlBuilder as K8sYamlBuilder
+
+import argparse
+import argcomplete
+
+# Push a new workmodel.json to the running service-cells (hot update, no redeploy).
+# The workmodel ConfigMap is patched: every pod of every service reloads it once Kubernetes refreshes the mounted
+# file (WorkModelWatcher). With --pods the workmodel is also sent to the /update endpoint of every running pod by using
+# the K8s API (pod IPs must be reachable), which applies it at once.
+
+
+def get_targets(workmodel, namespace):
+    targets = list()
+    from kubernetes import client, config
+    config.load_kube_config()
+    k8s_core_api = client.CoreV1Api()
+    for service in workmodel:
+        service_pods = k8s_core_api.list_namespaced_pod(namespace=namespace, label_selector=f"app={service}").items
+        for pod in service_pods:
+            if pod.status.phase == "Running" and pod.status.pod_ip is not None:
+                targets.append((pod.metadata.name, f"http://{pod.status.pod_ip}:8080/update"))
+    return targets
+
+
+def update_target(target, url, workmodel):
+    try:
+        r = requests.post(url, json=workmodel, timeout=timeout)
+        return target, r.status_code, r.text
+    except Exception as err:
+        return target, None, str(err)
+
+
+def patch_workmodel_configmap(workmodel, namespace):
+    # reloaded by the running pods, and used by restarted or new pods
+    from kubernetes import client, config
+    config.load_kube_config()
+    k8s_core_api = client.CoreV1Api()
+    k8s_core_api.patch_namespaced_config_map(name="workmodel", namespace=namespace,
+                                             body={"data": {"workmodel.json": json.dumps(workmodel, indent=2)}})
+    print("Workmodel ConfigMap patched!")
+
+
+### Main
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-c', '--config-file', action='store', dest='parameters_file',
+                    help='The K8s Parameters file', default=f'{os.path.dirname(os.path.abspath(__file__))}/K8sParameters.json')
+parser.add_argument('-w', '--workmodel', action='store', dest='workmodel_path',
+                    help='The workmodel.json file to push (default: WorkModelPath of the K8s Parameters file)', default=None)
+parser.add_argument('--pods', action='store_true', dest='pods',
+                    help='Also send the workmodel to every pod of every service, which applies it without waiting for '
+                         'the ConfigMap refresh', default=False)
+parser.add_argument('-p', '--parallelism', action='store', dest='parallelism', type=int,
+                    help='Number of parallel update requests', default=32)
+parser.add_argument('-t', '--timeout', action='store', dest='timeout', type=float,
+                    help='Timeout (s) of each update request', default=10)
+
+argcomplete.autocomplete(parser)
+
+try:
+    args = parser.parse_args()
+except ImportError:
+    print("Import error, there are missing dependencies to install.  'apt-get install python3-argcomplete "
+          "&& activate-global-python-argcomplete3' may solve")
+except AttributeError:
+    parser.print_help()
+except Exception as err:
+    print("Error:", err)
+
+try:
+    with open(args.parameters_file) as f:
+        params = json.load(f)
+    k8s_parameters = params["K8sParameters"]
+    workmodel_path = args.workmodel_path if args.workmodel_path is not None else params['WorkModelPath']
+    with open(workmodel_path) as f:
+        workmodel = json.load(f)
+    timeout = args.timeout
+except Exception as err:
+    print("ERROR: in RunWorkModelUpdater,", err)
+    exit(1)
+
+# same url/path customization done by the K8sDeployer
+K8sYamlBuilder.customization_work_model(workmodel, k8s_parameters)
+
+errors = 0
+rejected = 0
+if args.pods:
+    # fast path; an invalid workmodel (e.g. unknown internal functions) rejected by the pods is not put in the ConfigMap
+    targets = get_targets(workmodel, k8s_parameters['namespace'])
+    print(f"Updating {len(targets)} pods...")
+    with ThreadPoolExecutor(args.parallelism) as pool:
+        futures = [pool.submit(update_target, target, url, workmodel) for target, url in targets]
+        for future in as_completed(futures):
+            target, status_code, text = future.result()
+            if status_code != 200:
+                errors += 1
+                if status_code == 400:
+                    rejected += 1
+                print(f"ERROR: update of {target} failed -- {status_code} {text}")
+    print(f"Workmodel updated on {len(targets) - errors}/{len(targets)} pods")
+
+if rejected == 0:
+    patch_workmodel_configmap(workmodel, k8s_parameters['namespace'])
+else:
+    print("ERROR: workmodel rejected by the pods, the ConfigMap is not patched")
+
+if errors > 0:
+    exit(1)
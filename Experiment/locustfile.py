@@ -1,144 +1,222 @@
 import os
 import time
-import json
-import configparser
-from locust import HttpUser, task, between, events, constant_throughput
-from locust.exception import StopUser
 import logging
+
+import gevent
+from locust import task, events, constant
+from locust.contrib.fasthttp import FastHttpUser
+from locust.exception import StopUser
+from locust.runners import MasterRunner, WorkerRunner
 from locust import LoadTestShape
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-trace_file = 'traces/scaled_diurnal.txt'
-multiplier = 1
+# 负载由请求速率驱动: trace的每个数据点是一秒内的请求数(req/s), 每个Locust进程的用户共享一个令牌桶,
+# 用户数只决定并发上限. 分布式模式下master在测试开始时把开始时间和worker数发给workers, 每个worker发送
+# 1/workers的速率; 测试期间连接的worker向master请求开始时间, master把新的worker数发给所有workers.
+# 每个请求的记录(发送时间, 延迟, 状态, 已处理, 进行中)以Runner.py的格式写入结果文件.
 
-# 读取配置文件
-# def load_config(config_file='config.conf'):
-#     """从配置文件中读取配置，返回配置字典"""
-#     config = {}
-#     try:
-#         with open(config_file, 'r') as f:
-#             for line in f:
-#                 line = line.strip()
-#                 if line and not line.startswith('#'):
-#                     key, value = line.split('=', 1)
-#                     config[key.strip()] = value.strip()
-#         logger.info(f"已从{config_file}加载配置")
-#     except Exception as e:
-#         logger.warning(f"读取配置文件出错: {e}，将使用默认配置")
-#     return config
+RECORD_FORMAT = "{} \t {:.3f} \t {} \t {} \t {}"  # timestamp, latency, status, processed, pending (same as Runner)
+START_DELAY = 1.0  # s, workers的同步开始
 
-# # 加载配置
-# config = load_config()
 
+@events.init_command_line_parser.add_listener
+def on_init_command_line_parser(parser):
+    parser.add_argument("--trace-file", type=str, default="traces/scaled_diurnal.txt", help="负载文件, 每行一秒的请求数")
+    parser.add_argument("--trace-stride", type=int, default=2, help="每隔stride个选一个数据")
+    parser.add_argument("--multiplier", type=float, default=1, help="请求速率的倍数")
+    parser.add_argument("--ingress-service", type=str, default="s0", help="入口服务")
+    parser.add_argument("--rate-users", type=int, default=100, help="用户数(所有workers的并发上限)")
+    parser.add_argument("--bucket-size", type=float, default=10, help="令牌桶容量(令牌), 落后时最多补发的请求数")
+    parser.add_argument("--result-file", type=str, default="Experiment/locust_dir/locust_results.txt",
+                        help="每个请求的记录, 分布式模式下每个worker一个文件(.worker<index>)")
 
 
-# 存储统计信息
-stats = []
-local_latency_stats = []
+def load_trace_file(file_path, stride=1, multiplier=1):
+    """读取负载文件，返回每秒请求数列表"""
+    with open(file_path, 'r') as f:
+        trace_data = [float(line.strip()) for line in f if line.strip()]
+    return [x * multiplier for x in trace_data[::stride]]
 
-# 当前用户数
 
-# 读取负载文件
-def load_trace_file(file_path):
-    """读取负载文件，返回每秒请求数列表"""
-    try:
-        with open(file_path, 'r') as f:
-            trace_data = [int(float(line.strip())) for line in f if line.strip()]
-            # 每隔12个选一个数据
-            trace_data = trace_data[::2]
-            trace_data = [int(x * multiplier) for x in trace_data]
-            return trace_data
-    except Exception as e:
-        logger.error(f"读取负载文件出错: {e}")
-        return [1]  # 默认负载
-
-# 负载数据
-# trace_data = load_trace_file(TRACE_FILE)
-# logger.info(f"已加载负载文件，共{len(trace_data)}个数据点")
+class TokenBucket(object):
+    """按照每秒请求数发放令牌, 同一进程的用户共享 (gevent协作调度, 不需要锁)"""
+
+    def __init__(self, rates, start_at, share=1.0, bucket_size=10):
+        self.rates = rates
+        self.start_at = start_at
+        self.share = share
+        self.bucket_size = bucket_size
+        self.next_time = start_at
+
+    def rate(self, t):
+        i = int(t - self.start_at)
+        return self.rates[i] * self.share if 0 <= i < len(self.rates) else None
+
+    def acquire(self):
+        """等待下一个令牌, 返回计划的发送时间; trace结束时返回None"""
+        now = time.time()
+        while True:
+            rate = self.rate(self.next_time)
+            if rate is None:
+                return None
+            if rate > 0:
+                break
+            # 速率为0: 下一秒
+            self.next_time = self.start_at + int(self.next_time - self.start_at) + 1
+        # 令牌最多累积bucket_size个
+        slot = max(self.next_time, now - self.bucket_size / rate)
+        self.next_time = slot + 1.0 / rate
+        if slot > now:
+            gevent.sleep(slot - now)
+        return slot
+
+
+class RequestRecords(object):
+    """每个请求的记录, 写入结果文件"""
+
+    def __init__(self, result_file):
+        os.makedirs(os.path.dirname(result_file) or ".", exist_ok=True)
+        self.f = open(result_file, "w")
+        self.processed = 0
+        self.pending = 0
+        self.latency_sum = 0.0
+
+    def write(self, now_ms, latency_ms, status_code):
+        self.processed += 1
+        self.latency_sum += latency_ms
+        self.f.write(RECORD_FORMAT.format(now_ms, latency_ms, status_code, self.processed, self.pending) + "\n")
+
+    def close(self):
+        self.f.close()
+
+
+bucket = None
+records = None
+trace_start_at = None  # master: 测试的开始时间, 测试停止后为None
+
+
+def result_file_name(environment):
+    result_file = environment.parsed_options.result_file
+    if isinstance(environment.runner, WorkerRunner):
+        result_file = f"{result_file}.worker{environment.runner.worker_index}"
+    return result_file
+
+
+def start_bucket(environment, start_at, workers):
+    global bucket, records
+    options = environment.parsed_options
+    rates = load_trace_file(options.trace_file, options.trace_stride, options.multiplier)
+    bucket = TokenBucket(rates, start_at, 1.0 / workers, options.bucket_size)
+    if records is None:
+        records = RequestRecords(result_file_name(environment))
+    logger.info(f"负载文件: {options.trace_file}, {len(rates)}秒, 速率份额 1/{workers}")
+
+
+def send_trace_split(runner):
+    # master: 开始时间和当前的worker数发给所有workers
+    runner.send_message("trace_split", {"start_at": trace_start_at, "workers": runner.worker_count})
+
+
+def on_trace_split(environment, msg, **kwargs):
+    # worker: master发送的开始时间和worker数
+    start_bucket(environment, msg.data["start_at"], msg.data["workers"])
+
+
+def on_trace_split_request(environment, msg, **kwargs):
+    # master: 测试期间连接的worker, 速率在所有workers之间重新分配
+    # (worker_connect事件在worker注册trace_split之前触发, 所以由worker请求)
+    if trace_start_at is not None:
+        logger.info(f"worker {msg.node_id} 在测试期间连接, 重新分配速率")
+        send_trace_split(environment.runner)
+
+
+@events.init.add_listener
+def on_locust_init(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner):
+        environment.runner.register_message("trace_split", on_trace_split)
+        environment.runner.send_message("trace_split_request")
+    elif isinstance(environment.runner, MasterRunner):
+        environment.runner.register_message("trace_split_request", on_trace_split_request)
 
-class CustomLoadShape(LoadTestShape):
-    """自定义负载形状"""
-    
-    def __init__(self):
-        super().__init__()
-        self.trace_data = load_trace_file(trace_file)
-    
-    def tick(self):
-        run_time = self.get_run_time()
-        run_time = int(run_time)
-        """返回当前时刻的用户数和生成率"""
-        if run_time >= len(self.trace_data):
-            return None
-        
-        target_users = self.trace_data[run_time]
-        
-        return (
-            int(target_users),
-            int(target_users)  # 生成率设置为与用户数相同
-        )
 
 # 测试开始时的事件处理
 @events.test_start.add_listener
 def on_test_start(environment, **kwargs):
     """测试开始时的处理函数"""
+    global trace_start_at
     logger.info("开始负载测试")
-    # logger.info(f"目标主机: {TARGET_HOST}")
-    # logger.info(f"服务路径: {SERVICE_PATH}")
-    # logger.info(f"负载文件: {TRACE_FILE}")
+    start_at = time.time() + START_DELAY
+    if isinstance(environment.runner, MasterRunner):
+        # 在spawn消息之前发给所有workers
+        trace_start_at = start_at
+        send_trace_split(environment.runner)
+    elif not isinstance(environment.runner, WorkerRunner):
+        start_bucket(environment, start_at, 1)
+
+
+@events.request.add_listener
+def on_request(request_type, name, response_time, response_length, response=None, exception=None, start_time=None,
+               **kwargs):
+    if records is None:
+        return
+    status_code = response.status_code if response is not None and exception is None else 0
+    records.write(int((start_time or time.time() - response_time / 1000) * 1000), response_time, status_code)
+
 
 # 测试停止时的事件处理
 @events.test_stop.add_listener
 def on_test_stop(environment, **kwargs):
     """测试结束时的处理函数"""
+    global records, trace_start_at
     logger.info("负载测试结束")
-    
+    trace_start_at = None
+    if records is None:
+        return
     # 计算统计信息
-    if local_latency_stats:
-        avg_latency = sum(local_latency_stats) / len(local_latency_stats)
-        logger.info(f"平均延迟: {avg_latency:.2f}ms")
-        logger.info(f"总请求数: {len(local_latency_stats)}")
-    
-    # 保存统计信息到文件
-    if stats:
-        os.makedirs("Experiment/locust_dir", exist_ok=True)
-        with open("Experiment/locust_dir/locust_results.txt", "w") as f:
-            f.writelines("\n".join(stats))
-        logger.info("已保存结果到 locust_results.txt")
+    if records.processed:
+        logger.info(f"平均延迟: {records.latency_sum / records.processed:.2f}ms")
+        logger.info(f"总请求数: {records.processed}")
+    records.close()
+    logger.info(f"已保存结果到 {records.f.name}")
+    records = None
+
+
+class CustomLoadShape(LoadTestShape):
+    """自定义负载形状: 固定的用户数, 直到负载文件结束"""
+
+    def tick(self):
+        options = self.runner.environment.parsed_options
+        if not hasattr(self, "duration"):
+            self.duration = len(load_trace_file(options.trace_file, options.trace_stride)) + START_DELAY
+        if self.get_run_time() >= self.duration:
+            return None
+        return options.rate_users, options.rate_users
+
 
 # 定义用户行为
-class MuBenchUser(HttpUser):
-    # wait_time = between(0.001, 0.005)  # 由LoadTestShape完全控制生成率
-    wait_time = constant_throughput(1)
-    # fixed_count = 1
-    
-    
-    def on_start(self):
-        """用户启动时的初始化"""
-        pass
-    
+class MuBenchUser(FastHttpUser):
+    wait_time = constant(0)  # 由令牌桶控制请求速率
+
     @task
     def access_service(self):
         """发送请求到服务"""
-        # start_time = time.time()
-        # now_ms = int(start_time * 1000)
-        
+        if bucket is None:
+            # 还没有收到master的开始时间
+            gevent.sleep(0.1)
+            return
+        if bucket.acquire() is None:
+            raise StopUser()
+        # 测试停止后records为None, 还在运行的用户不再记录
+        user_records = records
+        if user_records is not None:
+            user_records.pending += 1
         try:
-            # 发送请求
-            response = self.client.get(f"/s0")
-            
-            # 计算延迟
-            # req_latency_ms = int((time.time() - start_time) * 1000)
-            
-            # 记录统计信息
-            # stats.append(f"{now_ms} \t {req_latency_ms} \t {response.status_code} \t {len(stats) + 1}")
-            # local_latency_stats.append(req_latency_ms)
-            
-            # 定期输出状态
-            # if len(stats) % 100 == 0:
-            #     logger.info(f"已处理请求: {len(stats)}, 延迟: {req_latency_ms}ms")
-                
+            self.client.get(f"/{self.environment.parsed_options.ingress_service}")
         except Exception as e:
-            logger.error(f"请求出错: {e}")
\ No newline at end of file
+            logger.error(f"请求出错: {e}")
+        finally:
+            if user_records is not None:
+                user_records.pending -= 1
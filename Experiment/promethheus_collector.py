@@ -11,20 +11,30 @@ from kubernetes import client, config
 query_step = "30s"
 query_command = f"sum by (s0) (increase(mub_request_processing_latency_milliseconds_sum{{}}[{query_step}])) / sum by (s0) (increase(mub_request_processing_latency_milliseconds_count{{}}[{query_step}]))"
 prometheus_url = "http://localhost:30000"
+# 延迟分位数（由 mub_request_processing_latency_milliseconds_bucket 直方图估算，桶布局见 workmodel 的 histogram_buckets）
+QUANTILES = [0.5, 0.95, 0.99]
+quantile_app = "s0"
+quantile_metric = "mub_request_processing_latency_milliseconds_bucket_bucket"
+
+def quantile_query(quantile, app=quantile_app, step=query_step):
+    # 经典直方图按 le 聚合后计算分位数
+    return f'histogram_quantile({quantile}, sum by (le) (rate({quantile_metric}{{app_name="{app}"}}[{step}])))'
 
 # 全局变量，用于控制数据收集循环
 STOP_COLLECTION = False
 COLLECTION_INTERVAL = 15  # 数据收集间隔，单位为秒
 result_dict = {'latency': [], 'node1': [], 'node2': [], 'node1_pod_num': [], 'node2_pod_num': [], 'timestamp': []}
+for q in QUANTILES:
+    result_dict[f'p{int(q * 100)}'] = []
 output_dir = 'collected_data'
 output_file = f'prometheus_data_{datetime.now(tz=pytz.timezone("Asia/Shanghai")).strftime("%Y%m%d_%H%M")}.csv'  # 默认输出文件名（北京时间）
 
-def query_latency():
+def query_latency(query=None):
     # 执行一次query_command查询
     # 构建API请求URL - 使用query而不是query_range
     query_url = f"{prometheus_url}/api/v1/query"
     params = {
-        'query': query_command
+        'query': query_command if query is None else query
     }
     
     try:
@@ -55,6 +65,14 @@ def query_latency():
         print(f"处理数据时出错: {e}")
         return None
 
+def query_latency_quantiles():
+    # 查询各延迟分位数，返回 {'p50': ..., 'p95': ..., 'p99': ...}
+    result = dict()
+    for q in QUANTILES:
+        value = query_latency(quantile_query(q))
+        result[f'p{int(q * 100)}'] = round(value, 2) if value is not None and not pd.isna(value) else None
+    return result
+
 def query_pod_list(node_name, ns='default'):
     """
     查询指定节点上特定命名空间的Pod名称列表
@@ -115,6 +133,10 @@ def collect_data_loop():
                 counter = 0  # 重置计数器
                 print(f"第{index}次查询的延迟为: {latency:.2f}")
                 result_dict['latency'].append(round(latency, 2))
+                quantiles = query_latency_quantiles()
+                for key, value in quantiles.items():
+                    result_dict[key].append(value)
+                print(f"第{index}次查询的延迟分位数为: {quantiles}")
         else:
             # result_dict['latency'].append(None)
             none_counter += 1
@@ -166,6 +188,9 @@ def save_collected_data(filename=None):
         'node2_pods': result_dict['node2']
     }
     
+    for q in QUANTILES:
+        df_data[f'p{int(q * 100)}'] = result_dict[f'p{int(q * 100)}']
+
     # 确保所有列的长度一致
     max_length = max(len(v) for v in df_data.values())
     for k in df_data:
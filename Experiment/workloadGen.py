@@ -1,60 +1,130 @@
+
 import json
-import time
 import argparse
 import argcomplete
 import os
+import sys
+
+import numpy as np
+
+sys.path.append(f'{os.path.dirname(os.path.abspath(__file__))}/../Benchmarks/Runner')
+from WorkloadStream import NO_BID, RECORD_DTYPE, record_events, write_binary_chunks
+
+# Intra-second arrival models of the requests of a trace second:
+#  - uniform: evenly spaced, the fractional part of the rate is carried to the next seconds
+#  - poisson: Poisson number of requests at uniformly random times (Poisson process)
+#  - bursty: the requests of the second are packed in `bursts` windows of `burst_ms` ms at random times
+ARRIVAL_MODELS = ["uniform", "poisson", "bursty"]
+RANDOM_ARRIVAL_MODELS = ["poisson", "bursty"]
+CHUNK_SECONDS = 3600  # trace seconds generated at once
+GENERATOR_VERSION = 1  # to be increased when the events generated from the same parameters change (workload cache key)
+
+
+def load_qps(trace):
+    # requests per second, one value per line
+    return np.loadtxt(trace, dtype=np.float64, ndmin=1)
+
+
+def request_counts(qps, arrival, rng):
+    if arrival == "poisson":
+        return rng.poisson(qps)
+    carried = np.floor(np.cumsum(qps) + 1e-9)
+    return np.diff(carried, prepend=0).astype(np.int64)
+
+
+def event_times(qps, first_second=0, arrival="uniform", rng=None, bursts=1, burst_ms=100):
+    # event times (ms, sorted) of the trace seconds first_second, first_second + 1, ... with the given rates
+    if arrival not in ARRIVAL_MODELS:
+        raise ValueError(f"Unsupported arrival model: {arrival}")
+    rng = rng or np.random.default_rng()
+    counts = request_counts(np.maximum(qps, 0), arrival, rng)
+    total = int(counts.sum())
+    seconds = np.repeat(np.arange(len(counts)), counts)
+    if arrival == "uniform":
+        rank = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        offsets = rank * (1000.0 / np.repeat(counts, counts))
+    elif arrival == "poisson":
+        offsets = rng.random(total) * 1000.0
+    else:
+        burst_ms = min(burst_ms, 1000.0)
+        starts = rng.random((len(counts), bursts)) * (1000.0 - burst_ms)
+        offsets = starts[seconds, rng.integers(0, bursts, total)] + rng.random(total) * burst_ms
+    times = (seconds + first_second) * 1000.0 + offsets
+    if arrival != "uniform":
+        # offsets are below 1000 ms: sorting the whole chunk sorts each second
+        times.sort()
+    return times
+
+
+def workload_chunks(qps, arrival="uniform", seed=None, bursts=1, burst_ms=100, service_index=0):
+    # RECORD_DTYPE arrays of the events of a trace, CHUNK_SECONDS trace seconds each
+    rng = np.random.default_rng(seed)
+    for first_second in range(0, len(qps), CHUNK_SECONDS):
+        times = event_times(qps[first_second:first_second + CHUNK_SECONDS], first_second, arrival, rng, bursts, burst_ms)
+        records = np.empty(len(times), dtype=RECORD_DTYPE)
+        records["time"] = times
+        records["service"] = service_index
+        records["bid"] = NO_BID
+        yield records
+
 
-def workloadGen(trace, output_dir, output_file=None, ingress_service='s0', multiplier=1):
+def workloadGen(trace, output_dir, output_file=None, ingress_service='s0', multiplier=1, arrival="uniform", seed=None,
+                bursts=1, burst_ms=100, max_seconds=None):
     """
     根据trace生成workload文件
+    output_file: .mubw binary (default), .ndjson NDJSON, .json JSON array
     """
-    # 读取trace文件
     if not output_file:
-        output_file = 'workload.json'
+        output_file = 'workload.mubw'
     if not os.path.exists(output_dir):
         print(f'make dir: {output_dir}')
         os.makedirs(output_dir)
-    qps_data = []
-    with open(trace, 'r') as f:
-        lines = f.readlines()
-        for l in lines:
-            qps_data.append(float(l.strip()))
-    
-    start_time = 0
-    events = list()
-    events_time_lst = list()
-    qps_data = qps_data[:300]
-    for index, qps in enumerate(qps_data):
-        qps = qps * multiplier
-        interval = 1000.0 / qps if qps > 0 else 1000
-        for i in range(int(qps)):
-            events_time = int(start_time + i * interval)
-            if events_time in events_time_lst:
-                continue
-            events.append({
-                "time": events_time,
-                "service": ingress_service})
-        start_time = index * 1000 + 1000
-    print(f"Output dir: {os.path.join(output_dir, output_file)}")
-    with open(os.path.join(output_dir, output_file), 'w') as f:
-        json.dump(events, f)
+    qps = load_qps(trace) * multiplier
+    if max_seconds is not None:
+        qps = qps[:max_seconds]
+    chunks = workload_chunks(qps, arrival, seed, bursts, burst_ms)
+    path = os.path.join(output_dir, output_file)
+    print(f"Output dir: {path}")
+    if path.endswith(".mubw"):
+        write_binary_chunks(chunks, path, [ingress_service])
+    elif path.endswith(".json"):
+        # legacy JSON array
+        with open(path, 'w') as f:
+            json.dump([event for records in chunks for event in record_events(records, [ingress_service])], f)
+    else:
+        with open(path, 'w') as f:
+            for records in chunks:
+                f.writelines(f'{{"time": {t!r}, "service": {json.dumps(ingress_service)}}}\n'
+                             for t in records["time"].tolist())
+    return path
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('-t', '--trace', type=str, help='trace file path', 
+    parser.add_argument('-t', '--trace', type=str, help='trace file path',
                         dest='trace', action='store')
-    parser.add_argument('-o', '--output_dir', type=str, help='output dir path', 
+    parser.add_argument('-o', '--output_dir', type=str, help='output dir path',
                         dest='output_dir', action='store')
-    parser.add_argument('-f', '--output_file', type=str, help='output file name', 
-                        dest='output_file', action='store', default='workload.json')
+    parser.add_argument('-f', '--output_file', type=str, help='output file name (.mubw binary, .ndjson, .json)',
+                        dest='output_file', action='store', default='workload.mubw')
     parser.add_argument('-i', '--ingress_service', type=str, help='ingress service name',
                         dest='ingress_service', action='store', default='s0')
-    parser.add_argument('-m', '--multiplier', type=int, help='multiplier',
+    parser.add_argument('-m', '--multiplier', type=float, help='multiplier',
                         dest='multiplier', action='store', default=1)
+    parser.add_argument('-a', '--arrival', type=str, help='intra-second arrival model',
+                        dest='arrival', action='store', default='uniform', choices=ARRIVAL_MODELS)
+    parser.add_argument('-s', '--seed', type=int, help='random seed of the poisson and bursty models',
+                        dest='seed', action='store', default=None)
+    parser.add_argument('-b', '--bursts', type=int, help='bursts per second of the bursty model',
+                        dest='bursts', action='store', default=1)
+    parser.add_argument('-w', '--burst_ms', type=float, help='burst duration (ms) of the bursty model',
+                        dest='burst_ms', action='store', default=100)
+    parser.add_argument('-d', '--max_seconds', type=int, help='use only the first seconds of the trace',
+                        dest='max_seconds', action='store', default=None)
     argcomplete.autocomplete(parser)
     args = parser.parse_args()
-    workloadGen(args.trace, args.output_dir, args.output_file, args.ingress_service, args.multiplier)
+    workloadGen(args.trace, args.output_dir, args.output_file, args.ingress_service, args.multiplier, args.arrival,
+                args.seed, args.bursts, args.burst_ms, args.max_seconds)
 
 
 if __name__ == '__main__':
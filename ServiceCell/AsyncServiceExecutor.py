@@ -0,0 +1,257 @@
+import asyncio
+import itertools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import aiohttp
+import grpc
+import mub_pb2_grpc as pb2_grpc
+import mub_pb2 as pb2
+
+from InternalServiceExecutor import get_internal_pool, run_in_process
+from TraceCodec import subtrace_body, subtrace_bytes
+from ExecutionPlan import query_behaviour
+from Tracing import start_client_span, end_span
+
+# asyncio execution mode: one event loop, one pooled HTTP client session (or gRPC channel pool) and one
+# internal-service executor per worker
+session = None
+internal_pool = None
+grpc_stubs = dict()  # destination url -> round-robin iterator over the stubs of its channels
+grpc_channels = list()
+grpc_settings = {"port": 51313, "channels": 1}
+pool_destinations = dict()  # host:port -> destination service
+pool_metrics_cache = dict()  # host:port -> pool metrics
+pool_metrics_factory = None
+
+
+def init_internal_executor(threads):
+    global internal_pool
+    # blocking internal functions (e.g. compute_pi, sleep_loader) run by default on a per-worker pool to keep the loop free
+    internal_pool = ThreadPoolExecutor(threads)
+    asyncio.get_event_loop().set_default_executor(internal_pool)
+
+
+def register_destinations(work_model):
+    # service names of the destination hosts, labels of the connection pool metrics; returns the services of the
+    # destinations not registered before
+    new_services = list()
+    for service in work_model:
+        url = urlsplit(f'http://{work_model[service]["url"]}')
+        netloc = f"{url.hostname}:{url.port or 80}"
+        if netloc not in pool_destinations:
+            new_services.append(service)
+        pool_destinations[netloc] = service
+    return new_services
+
+
+def destination_metrics(netloc):
+    metrics = pool_metrics_cache.get(netloc)
+    if metrics is None:
+        metrics = pool_metrics_cache[netloc] = pool_metrics_factory(pool_destinations.get(netloc, netloc))
+    return metrics
+
+
+def pool_trace_config():
+    # connection pool hits (reused keep-alive connections), misses (new connections) and waits of the connector,
+    # as the InstrumentedHTTPConnectionPool of the sync mode
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(client_session, ctx, params):
+        ctx.netloc = f"{params.url.host}:{params.url.port}"
+        ctx.queued = None
+        ctx.wait_ms = 0.0
+
+    async def on_connection_queued_start(client_session, ctx, params):
+        ctx.queued = time.time()
+
+    async def on_connection_queued_end(client_session, ctx, params):
+        if ctx.queued is not None:
+            ctx.wait_ms = (time.time() - ctx.queued) * 1000
+
+    async def on_connection_reuseconn(client_session, ctx, params):
+        metrics = destination_metrics(ctx.netloc)
+        metrics["hit"].inc()
+        metrics["wait"].observe(ctx.wait_ms)
+
+    async def on_connection_create_end(client_session, ctx, params):
+        metrics = destination_metrics(ctx.netloc)
+        metrics["miss"].inc()
+        metrics["wait"].observe(ctx.wait_ms)
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_queued_start.append(on_connection_queued_start)
+    trace_config.on_connection_queued_end.append(on_connection_queued_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+async def init_async_REST(app, threads, pool_params=None, work_model=None, pool_metrics=None):
+    app.logger.info("Init async REST function")
+    global session, request_function_async, pool_metrics_factory
+    request_function_async = request_REST_async
+    init_internal_executor(threads)
+    if pool_params is not None:
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=int(pool_params["pool_size"]) if pool_params["pool_block"] else 0,
+                                         keepalive_timeout=pool_params["keepalive_idle_timeout"], ttl_dns_cache=300)
+    else:
+        connector = aiohttp.TCPConnector(limit=0, ttl_dns_cache=300)
+    trace_configs = list()
+    register_destinations(work_model)
+    if pool_metrics is not None:
+        pool_metrics_factory = pool_metrics
+        trace_configs.append(pool_trace_config())
+    session = aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
+
+
+async def prewarm_request(url, timeout):
+    async with session.head(url, timeout=timeout) as response:
+        return response.status
+
+
+async def prewarm_async_REST(services, work_model, connections, app):
+    # open keep-alive connections towards the external services before the first request hits the worker: concurrent
+    # HEAD requests to /update (answered without running the service), whose connections then stay in the pool
+    if session is None or connections <= 0:
+        return
+    timeout = aiohttp.ClientTimeout(total=5)
+    for service in services:
+        try:
+            url = f'http://{work_model[service]["url"]}/update'
+            results = await asyncio.gather(*[prewarm_request(url, timeout) for i in range(connections)], return_exceptions=True)
+            opened = len([result for result in results if not isinstance(result, BaseException)])
+            app.logger.info("Pre-warmed %d connections to %s" % (opened, service))
+        except Exception as err:
+            app.logger.error("Error in pre-warming connections to %s -- %s" % (service, str(err)))
+
+
+async def close_async_REST(app):
+    app.logger.info("Close async REST function")
+    global session, internal_pool
+    if session is not None:
+        await session.close()
+        session = None
+    if internal_pool is not None:
+        internal_pool.shutdown(wait=False)
+        internal_pool = None
+
+
+async def init_async_gRPC(app, threads, server_port, channels=1):
+    app.logger.info("Init async gRPC function")
+    global request_function_async
+    request_function_async = request_gRPC_async
+    init_internal_executor(threads)
+    grpc_settings["port"] = server_port
+    grpc_settings["channels"] = channels
+
+
+async def close_async_gRPC(app):
+    app.logger.info("Close async gRPC function")
+    global internal_pool
+    for channel in grpc_channels:
+        await channel.close()
+    grpc_channels.clear()
+    grpc_stubs.clear()
+    if internal_pool is not None:
+        internal_pool.shutdown(wait=False)
+        internal_pool = None
+
+
+def get_gRPC_stub_async(url):
+    stubs = grpc_stubs.get(url)
+    if stubs is None:
+        # pool of channels (i.e. HTTP/2 connections) per destination, used round-robin; created at the first call,
+        # so that services added by a workmodel update are reachable too
+        host = urlsplit(url).hostname
+        channels = [grpc.aio.insecure_channel(f'{host}:{grpc_settings["port"]}') for i in range(grpc_settings["channels"])]
+        grpc_channels.extend(channels)
+        stubs = itertools.cycle([pb2_grpc.MicroServiceStub(channel) for channel in channels])
+        grpc_stubs[url] = stubs
+    return next(stubs)
+
+
+async def run_internal_service_async(internal_service_function, internal_service_params_v, strategy="thread"):
+    if strategy == "inline":
+        # runs on the event loop thread, only for very short functions
+        return internal_service_function(internal_service_params_v)
+    loop = asyncio.get_event_loop()
+    if strategy == "process":
+        return await loop.run_in_executor(get_internal_pool(), run_in_process, internal_service_function, internal_service_params_v)
+    return await loop.run_in_executor(None, internal_service_function, internal_service_params_v)
+
+
+async def request_REST_async(service, url, id, trace, query_string, logger, jaeger_context):
+    # url precomputed by the execution plan
+    if len(query_string) > 0:
+        url = f'{url}?{query_string}'
+    if len(trace) > 0:
+        # trace-driven request, binary subtraces are slices of the received trace
+        content_type, trace_payload = subtrace_body(service, trace[id][service])
+        headers = {'Content-type': content_type, 'Accept': 'text/plain'}
+        headers.update(jaeger_context)
+        async with session.post(url, data=trace_payload, headers=headers) as r:
+            body = await r.read()
+            return r.status, body
+    async with session.get(url, headers=jaeger_context) as r:
+        body = await r.read()
+        return r.status, body
+
+
+async def request_gRPC_async(service, url, id, trace, query_string, logger, jaeger_context):
+    message = pb2.Message(message=service, bid=query_behaviour(query_string))
+    if len(trace) > 0:
+        message.trace = subtrace_bytes(service, trace[id][service])
+    r = await get_gRPC_stub_async(url).GetMicroServiceResponse(message, metadata=tuple(jaeger_context.items()))
+    return (200 if r.status_code else 500), r.payload
+
+
+async def external_service_async(group, id, trace, query_string, logger, trace_context, span_context=None):
+    # group is a GroupPlan of ExecutionPlan
+    logger.info("**** Start SERVICES in coroutine: %s", group.calls)
+    if group.sample:
+        # Randomly select seq_len elements from services in the group
+        selected_calls = random.sample(group.calls, k=group.seq_len)
+    else:
+        selected_calls = group.calls
+
+    service_error_dict = dict()
+    service_error_flag = False
+
+    for service, url, p in selected_calls:
+        try:
+            if p >= 1 or random.random() < p:
+                # service called with probability p
+                span, headers = start_client_span(service, span_context, trace_context)
+                status_code = None
+                try:
+                    status_code, body = await request_function_async(service, url, id, trace, query_string, logger, headers)
+                finally:
+                    end_span(span, status_code)
+                logger.info("Service: %s -> Status_code: %s -- len(text): %d", service, status_code, len(body))
+                if status_code != 200:
+                    raise Exception(f"Error in external service: {service} -- status_code: {status_code}")
+        except Exception as err:
+            service_error_dict[service] = err
+            service_error_flag = True
+            logger.error("Error in request external service %s -- %s", service, err)
+
+    logger.info("#### SERVICE Done!")
+    return service_error_flag, service_error_dict
+
+
+async def run_external_service_async(services_group, query_string, trace, logger, trace_context=None, span_context=None):
+    logger.info("** EXTERNAL SERVICES (async)")
+    if trace_context is None:
+        trace_context = dict()
+    service_error_dict = dict()
+    # groups run concurrently as coroutines on the worker event loop, services of a group sequentially
+    results = await asyncio.gather(*[external_service_async(group, id, trace, query_string, logger, trace_context, span_context)
+                                     for id, group in enumerate(services_group)])
+    for error_flag, error_dict in results:
+        if error_flag:
+            service_error_dict.update(error_dict)
+    logger.info("--------> Coroutines Done!")
+    return service_error_dict
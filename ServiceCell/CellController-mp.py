@@ -1,22 +1,33 @@
 from __future__ import print_function
 
 import argparse
+import asyncio
 import json
+import multiprocessing
 import os
 import sys
 import time
 import traceback
-from threading import Thread
-from concurrent import futures
 #from multiprocessing import Array, Manager, Value
 
 import gunicorn.app.base
 from flask import Flask, Response, json, make_response, request
+from werkzeug.wsgi import wrap_file
 import prometheus_client
-from prometheus_client import CollectorRegistry, Summary, multiprocess, Histogram
-
-from ExternalServiceExecutor import init_REST, init_gRPC, run_external_service
-from InternalServiceExecutor import run_internal_service
+from prometheus_client import CollectorRegistry, Summary, multiprocess, Histogram, Gauge, Counter
+
+from ExternalServiceExecutor import init_REST, mount_REST, prewarm_REST, init_gRPC, run_external_service, init_group_executor, ExternalPoolSaturated
+from InternalServiceExecutor import run_internal_function, init_internal_service, warm_internal_pool, get_internal_service_function
+from CpuBurner import calibrate_all
+from ResponsePayload import payload_bytes, payload_file
+from WorkModelWatcher import WorkModelWatcher, write_workmodel, file_mtime
+from RequestLogging import RequestLogging
+from Tracing import init_tracing, start_server_span, start_span, end_span
+from RequestMetrics import RequestMetrics, OPTIONAL_LABELS, make_buckets
+from ExecutionPlan import compile_plans, get_behaviour, trace_groups
+from TraceCodec import TRACE_CONTENT_TYPE, encode_trace, decode_trace
+from AsyncServiceExecutor import init_async_REST, prewarm_async_REST, register_destinations, close_async_REST, init_async_gRPC, close_async_gRPC, run_internal_service_async, run_external_service_async
+from aiohttp import web
 
 import mub_pb2_grpc as pb2_grpc
 import mub_pb2 as pb2
@@ -41,6 +52,9 @@ jaeger_headers_list = [
     'x-cloud-trace-context',
 ]
 
+# WSGI environ keys of the trace context headers
+jaeger_environ_keys = [(jhdr, 'HTTP_' + jhdr.upper().replace('-', '_')) for jhdr in jaeger_headers_list]
+
 # Flask APP
 app = Flask(__name__)
 ID = os.environ["APP"]
@@ -50,162 +64,466 @@ PN = os.environ["PN"] # Number of processes
 TN = os.environ["TN"] # Number of thread per process
 traceEscapeString = "__"
 
+WORKMODEL_FILE = 'MSConfig/workmodel.json'
+WORKMODEL_UPDATE_FILE = os.environ.get("WORKMODEL_UPDATE_FILE", "/app/workmodel-update.json")  # written by /update, shared by the workers of the pod
+WORKMODEL_WATCH_INTERVAL = float(os.environ.get("WORKMODEL_WATCH_INTERVAL", "1"))  # seconds
+
 #globalDict=Manager().dict()
 globalDict=dict()
-def read_config_files():
+def shrink_workmodel(workmodel):
     res = dict()
-    with open('MSConfig/workmodel.json') as f:
+    for service in workmodel:
+        if service==ID:
+            res[service]=workmodel[service]
+        else:
+            res[service]={"url":workmodel[service]["url"],"path":workmodel[service]["path"]}
+    if ID not in res:
+        raise KeyError(f"service {ID} not in workmodel")
+    return res
+
+def read_config_files():
+    with open(WORKMODEL_FILE) as f:
         workmodel = json.load(f)
-        # shrink workmodel
         for service in workmodel:
             app.logger.info(f'service: {service}')
-            if service==ID:
-                res[service]=workmodel[service]
-            else:
-                res[service]={"url":workmodel[service]["url"],"path":workmodel[service]["path"]}
-    return res
-globalDict['work_model'] = read_config_files()    # must be shared among processes for hot update
+        # shrink workmodel
+        return shrink_workmodel(workmodel)
+globalDict['work_model'] = read_config_files()    # hot updates are shared among processes through WORKMODEL_UPDATE_FILE
+# per-behaviour execution plans (internal function, external-service urls), rebuilt on every workmodel update
+globalDict['plans'] = compile_plans(globalDict['work_model'], ID, get_internal_service_function, traceEscapeString)
+workmodel_mtimes = {WORKMODEL_FILE: file_mtime(WORKMODEL_FILE), WORKMODEL_UPDATE_FILE: None}
+async_loop = None  # event loop of the worker in async execution mode
+
+def apply_work_model(workmodel):
+    # atomic swap of the work model used by the requests of this worker
+    res = shrink_workmodel(workmodel)
+    if res[ID]['path'] != globalDict['work_model'][ID]['path']:
+        app.logger.error("Workmodel update: the path of the service cannot be changed without a restart")
+        res[ID]['path'] = globalDict['work_model'][ID]['path']
+    plans = compile_plans(res, ID, get_internal_service_function, traceEscapeString)
+    globalDict['work_model'] = res
+    globalDict['plans'] = plans
+    if request_method == "rest" and execution_mode == "async":
+        new_services = [service for service in register_destinations(res) if service in external_destinations()]
+        if async_loop is not None and len(new_services) > 0:
+            # on the event loop of the worker, also when the update is applied by the watcher thread
+            asyncio.run_coroutine_threadsafe(prewarm_async_REST(new_services, res, int(connection_pool_params["prewarm_connections"]), app), async_loop)
+    elif request_method == "rest":
+        # connection pools of the services added by the update
+        new_services = [service for service in mount_REST(res) if service in external_destinations()]
+        prewarm_REST(new_services, res, int(connection_pool_params["prewarm_connections"]), app)
+
+def start_workmodel_watcher():
+    watcher = WorkModelWatcher([WORKMODEL_FILE, WORKMODEL_UPDATE_FILE], WORKMODEL_WATCH_INTERVAL, apply_work_model, app.logger, dict(workmodel_mtimes))
+    watcher.start()
+    return watcher
 
 if "request_method" in globalDict['work_model'][ID].keys():
     request_method = globalDict['work_model'][ID]["request_method"].lower()
 else:
     request_method = "rest"
 
+# execution mode of the REST server: "sync" (threaded WSGI) or "async" (asyncio event loop per worker)
+if "execution_mode" in globalDict['work_model'][ID].keys():
+    execution_mode = globalDict['work_model'][ID]["execution_mode"].lower()
+else:
+    execution_mode = "sync"
+
+# encoding of the traces forwarded in trace-driven requests: "binary" (TraceCodec) or "json"; both are accepted
+if "trace_encoding" in globalDict['work_model'][ID].keys():
+    trace_encoding = globalDict['work_model'][ID]["trace_encoding"].lower()
+else:
+    trace_encoding = "binary"
+
+# request logging: info lines of a sample (sample_rate) of the requests, written by the request thread ("sync" mode)
+# or by a listener thread of the worker ("async" mode); level, e.g. "INFO", sets the level of the app logger
+logging_params = {"mode": "sync", "level": None, "sample_rate": 1}
+if "logging" in globalDict['work_model'][ID].keys():
+    logging_params.update(globalDict['work_model'][ID]["logging"])
+request_logging = RequestLogging(app.logger, logging_params["mode"], logging_params["level"], float(logging_params["sample_rate"]))
+
+# optional OpenTelemetry spans (Tracing), e.g. {"enabled": true, "sample_rate": 0.01, "exporter": "otlp", "endpoint": "http://otel-collector:4317"}
+tracing_params = {"enabled": False}
+if "tracing" in globalDict['work_model'][ID].keys():
+    tracing_params.update(globalDict['work_model'][ID]["tracing"])
+
+# per-request metrics: "direct" or "buffered" (aggregated per worker and flushed every flush_interval seconds);
+# optional labels not listed in "labels" are dropped, e.g. "from" (client address) to bound the number of series
+metrics_params = {"mode": "direct", "flush_interval": 1, "labels": OPTIONAL_LABELS}
+if "metrics" in globalDict['work_model'][ID].keys():
+    metrics_params.update(globalDict['work_model'][ID]["metrics"])
+
+# layout of the latency histogram buckets (RequestMetrics.make_buckets), from the workmodel or the HISTOGRAM_BUCKETS
+# environment variable (JSON), e.g. {"layout": "log-linear", "min": 0.5, "max": 10000, "steps": 9}
+histogram_buckets_spec = None
+if "HISTOGRAM_BUCKETS" in os.environ:
+    histogram_buckets_spec = json.loads(os.environ["HISTOGRAM_BUCKETS"])
+if "histogram_buckets" in globalDict['work_model'][ID].keys():
+    histogram_buckets_spec = globalDict['work_model'][ID]["histogram_buckets"]
+
+# gRPC mode: channels (HTTP/2 connections) per destination used round-robin by the clients of each process
+grpc_params = {"channels": 2}
+if "grpc" in globalDict['work_model'][ID].keys():
+    grpc_params.update(globalDict['work_model'][ID]["grpc"])
+
+# bounded per-worker pool for external-service groups, by default sized to serve TN concurrent requests
+external_pool_params = {"size": int(TN) * max(1, len(globalDict['work_model'][ID]['external_services'])),
+                        "max_queue": 0,
+                        "saturation_policy": "queue"}  # "queue" or "reject" (503) when the pool is saturated
+if "external_pool" in globalDict['work_model'][ID].keys():
+    external_pool_params.update(globalDict['work_model'][ID]["external_pool"])
+
+# internal-service execution strategy: "inline", "thread" (shared per-worker pool) or "process" (per-worker process pool)
+internal_execution_params = {"strategy": "thread" if execution_mode == "async" or request_method == "grpc" else "inline",
+                             "pool_size": int(TN)}
+if "internal_execution" in globalDict['work_model'][ID].keys():
+    internal_execution_params.update(globalDict['work_model'][ID]["internal_execution"])
+init_internal_service(internal_execution_params["strategy"], internal_execution_params["pool_size"])
+internal_execution = internal_execution_params["strategy"]
+
+# calibration of the CPU load engine, done once per pod before forking the workers
+cpu_calibration = calibrate_all()
+app.logger.info(f'CPU calibration (iterations/ms): {cpu_calibration}')
+
+# per-destination keep-alive connection pools for REST calls to external services
+connection_pool_params = {"pool_size": external_pool_params["size"],
+                          "pool_block": False,  # if true, pool_size is also the max number of connections per destination
+                          "keepalive": 5,  # seconds an idle client connection is kept open by this server
+                          "keepalive_idle_timeout": 4,  # seconds after which an idle client connection is not reused
+                          "prewarm_connections": 1}  # connections opened at worker startup towards each external service
+if "connection_pool" in globalDict['work_model'][ID].keys():
+    connection_pool_params.update(globalDict['work_model'][ID]["connection_pool"])
+
+def external_destinations():
+    # services that this cell may call in stochastic-driven requests, including alternative behaviours
+    my_work_model = globalDict['work_model'][ID]
+    service_graphs = [my_work_model['external_services']]
+    if "alternative_behaviors" in my_work_model.keys():
+        for behaviour in my_work_model['alternative_behaviors'].values():
+            if "external_services" in behaviour.keys():
+                service_graphs.append(behaviour['external_services'])
+    destinations = list()
+    for service_graph in service_graphs:
+        for group in service_graph:
+            for service in group['services']:
+                service_no_escape = service.split(traceEscapeString)[0]
+                if service_no_escape not in destinations:
+                    destinations.append(service_no_escape)
+    return destinations
+
 ########################### PROMETHEUS METRICS
 registry = CollectorRegistry()
 multiprocess.MultiProcessCollector(registry)
 
 CONTENT_TYPE_LATEST = str('text/plain; version=0.0.4; charset=utf-8')
+request_metrics = RequestMetrics(metrics_params["mode"], float(metrics_params["flush_interval"]), metrics_params["labels"], app.logger)
+internal_labels = ['zone', 'app_name', 'method', 'endpoint', 'execution']
+external_labels = ['zone', 'app_name', 'method', 'endpoint']
+request_labels = ['zone', 'app_name', 'method', 'endpoint', 'from', 'kubernetes_service']
 RESPONSE_SIZE = Summary('mub_response_size', 'Response size',
-                        ['zone', 'app_name', 'method', 'endpoint', 'from', 'kubernetes_service'], registry=registry
+                        request_metrics.labels(request_labels), registry=registry
                         )
 
 INTERNAL_PROCESSING = Summary('mub_internal_processing_latency_milliseconds', 'Latency of internal service',
-                           ['zone', 'app_name', 'method', 'endpoint'],registry=registry
+                           request_metrics.labels(internal_labels),registry=registry
                            )
 EXTERNAL_PROCESSING = Summary('mub_external_processing_latency_milliseconds', 'Latency of external services',
-                           ['zone', 'app_name', 'method', 'endpoint'], registry=registry
+                           request_metrics.labels(external_labels), registry=registry
                            )
 REQUEST_PROCESSING = Summary('mub_request_processing_latency_milliseconds', 'Request latency including external and internal service',
-                           ['zone', 'app_name', 'method', 'endpoint', 'from', 'kubernetes_service'],registry=registry
+                           request_metrics.labels(request_labels),registry=registry
                            )
 
-buckets=[0.5, 1, 10, 100 ,1000, 10000, float("inf")] 
+buckets=make_buckets(histogram_buckets_spec)
 INTERNAL_PROCESSING_BUCKET = Histogram('mub_internal_processing_latency_milliseconds_bucket', 'Latency of internal service',
-                           ['zone', 'app_name', 'method', 'endpoint'],registry=registry,buckets=buckets
+                           request_metrics.labels(internal_labels),registry=registry,buckets=buckets
                            )
 EXTERNAL_PROCESSING_BUCKET = Histogram('mub_external_processing_latency_milliseconds_bucket', 'Latency of external services',
-                           ['zone', 'app_name', 'method', 'endpoint'], registry=registry,buckets=buckets
+                           request_metrics.labels(external_labels), registry=registry,buckets=buckets
                            )
 REQUEST_PROCESSING_BUCKET = Histogram('mub_request_processing_latency_milliseconds_bucket', 'Request latency including external and internal service',
-                           ['zone', 'app_name', 'method', 'endpoint', 'from', 'kubernetes_service'],registry=registry,buckets=buckets
+                           request_metrics.labels(request_labels),registry=registry,buckets=buckets
 )
-
+# metrics observed together by the request handlers
+request_metrics.register("response_size", request_labels, [RESPONSE_SIZE])
+request_metrics.register("internal", internal_labels, [INTERNAL_PROCESSING, INTERNAL_PROCESSING_BUCKET], buckets)
+request_metrics.register("external", external_labels, [EXTERNAL_PROCESSING, EXTERNAL_PROCESSING_BUCKET], buckets)
+request_metrics.register("request", request_labels, [REQUEST_PROCESSING, REQUEST_PROCESSING_BUCKET], buckets)
+
+
+def check_trace(trace):
+    # sanity_check
+    assert len(trace.keys())==1, 'bad trace format'
+    assert ID == list(trace)[0].split(traceEscapeString)[0], "bad trace format, ID"
+    trace[ID] = trace[list(trace)[0]] # We insert 1 more key "s0": [value]
+    return trace
+
+def parse_trace(mimetype, data):
+    if mimetype == TRACE_CONTENT_TYPE:
+        trace = decode_trace(data)
+    else:
+        trace = json.loads(data)
+        if trace_encoding == "binary":
+            # JSON trace (e.g. from the gateway) encoded once, its subtraces are then forwarded as slices
+            trace = decode_trace(encode_trace(trace))
+    return check_trace(trace)
+
+EXTERNAL_POOL_SIZE = Gauge('mub_external_pool_size', 'Number of threads of the external-service groups pool',
+                           ['zone', 'app_name'], registry=registry, multiprocess_mode='livesum')
+EXTERNAL_POOL_QUEUE = Gauge('mub_external_pool_queue_depth', 'External-service groups waiting for a pool thread',
+                            ['zone', 'app_name'], registry=registry, multiprocess_mode='livesum')
+EXTERNAL_POOL_ACTIVE = Gauge('mub_external_pool_active_threads', 'Pool threads running an external-service group',
+                             ['zone', 'app_name'], registry=registry, multiprocess_mode='livesum')
+EXTERNAL_POOL_REJECTED = Counter('mub_external_pool_rejected', 'Requests rejected because the external-service groups pool is saturated',
+                                 ['zone', 'app_name'], registry=registry)
+init_group_executor(external_pool_params["size"], external_pool_params["max_queue"], external_pool_params["saturation_policy"],
+                    {"size": EXTERNAL_POOL_SIZE.labels(ZONE, K8S_APP), "queue": EXTERNAL_POOL_QUEUE.labels(ZONE, K8S_APP),
+                     "active": EXTERNAL_POOL_ACTIVE.labels(ZONE, K8S_APP), "rejected": EXTERNAL_POOL_REJECTED.labels(ZONE, K8S_APP)})
+
+CPU_CALIBRATION = Gauge('mub_cpu_calibration_iterations_per_millisecond', 'Throughput of the CPU load engine kernels measured at startup',
+                        ['zone', 'app_name', 'kernel'], registry=registry, multiprocess_mode='max')
+for kernel, rate in cpu_calibration.items():
+    CPU_CALIBRATION.labels(ZONE, K8S_APP, kernel).set(rate)
+
+CONNECTION_POOL_REQUESTS = Counter('mub_connection_pool_requests', 'Connections taken from the per-destination HTTP pools (hit: reused, miss: new)',
+                                   ['zone', 'app_name', 'destination', 'result'], registry=registry)
+CONNECTION_POOL_WAIT = Summary('mub_connection_pool_wait_milliseconds', 'Time spent waiting for a connection of the per-destination HTTP pools',
+                               ['zone', 'app_name', 'destination'], registry=registry)
+def connection_pool_metrics(destination):
+    return {"hit": CONNECTION_POOL_REQUESTS.labels(ZONE, K8S_APP, destination, "hit"),
+            "miss": CONNECTION_POOL_REQUESTS.labels(ZONE, K8S_APP, destination, "miss"),
+            "wait": CONNECTION_POOL_WAIT.labels(ZONE, K8S_APP, destination)}
+
+def post_worker_init(worker):
+    warm_internal_pool()
+    request_metrics.start()
+    request_logging.start()
+    init_tracing(ID, tracing_params, app.logger)
+    start_workmodel_watcher()
+    prewarm_REST(external_destinations(), globalDict['work_model'], int(connection_pool_params["prewarm_connections"]), app)
 
 @app.route(f"{globalDict['work_model'][ID]['path']}", methods=['GET','POST'])
 def start_worker():
     global globalDict
     
+    log = request_logging.request_logger()
+    server_span = None
+    status_code = 500
     try:
         start_request_processing = time.time()
-        app.logger.info('Request Received')
+        log.info('Request Received')
         
         query_string = request.query_string.decode()
         behaviour_id = request.args.get('bid', default = 'default', type = str)
-        
-        # default behaviour
-        my_work_model = globalDict['work_model'][ID]
-        my_service_graph = my_work_model['external_services'] 
-        my_internal_service = my_work_model['internal_service']
-
-        # update internal service behaviour
-        if behaviour_id != 'default' and "alternative_behaviors" in my_work_model.keys():
-                if behaviour_id in my_work_model['alternative_behaviors'].keys():
-                    if "internal_services" in my_work_model['alternative_behaviors'][behaviour_id].keys():
-                        my_internal_service = my_work_model['alternative_behaviors'][behaviour_id]['internal_service']
+        plan = get_behaviour(globalDict['plans'], behaviour_id)
+        my_service_graph = plan.groups
 
-        # trace context propagation
+        # trace context propagation, read straight from the WSGI environ
         jaeger_headers = dict()
-        for jhdr in jaeger_headers_list:
-            val = request.headers.get(jhdr)
+        environ = request.environ
+        for jhdr, environ_key in jaeger_environ_keys:
+            val = environ.get(environ_key)
             if val is not None:
                 jaeger_headers[jhdr] = val
+        server_span, span_context, jaeger_headers = start_server_span(ID, jaeger_headers)
 
         # if POST check the presence of a trace
         trace=dict()
         if request.method == 'POST':
-            trace = request.json
-            # sanity_check
-            assert len(trace.keys())==1, 'bad trace format'
-            assert ID == list(trace)[0].split(traceEscapeString)[0], "bad trace format, ID"
-            trace[ID] = trace[list(trace)[0]] # We insert 1 more key "s0": [value] 
+            trace = parse_trace(request.mimetype, request.get_data())
             
         if len(trace)>0:
-        # trace-driven request
-            n_groups = len(trace[ID])
-            my_service_graph = list()
-            for i in range(0,n_groups):
-                group = trace[ID][i]
-                group_dict = dict()
-                group_dict['seq_len'] = len(group)
-                group_dict['services'] = list(group.keys())
-                my_service_graph.append(group_dict)
-        else:
-            # update external service behaviour
-            if behaviour_id != 'default' and "alternative_behaviors" in my_work_model.keys():
-                if behaviour_id in my_work_model['alternative_behaviors'].keys():
-                    if "external_services" in my_work_model['alternative_behaviors'][behaviour_id].keys():
-                        my_service_graph = my_work_model['alternative_behaviors'][behaviour_id]['external_services']
+            my_service_graph = trace_groups(globalDict['plans'], trace[ID], traceEscapeString)
 
         # Execute the internal service
-        app.logger.info("*************** INTERNAL SERVICE STARTED ***************")
+        log.info("*************** INTERNAL SERVICE STARTED ***************")
         start_local_processing = time.time()
-        body = run_internal_service(my_internal_service)
+        internal_span = start_span("internal_service", span_context)
+        body = run_internal_function(plan.internal_function, plan.internal_params, internal_execution)
+        end_span(internal_span)
         local_processing_latency = time.time() - start_local_processing
-        INTERNAL_PROCESSING.labels(ZONE, K8S_APP, request.method, request.path).observe(local_processing_latency*1000)
-        INTERNAL_PROCESSING_BUCKET.labels(ZONE, K8S_APP, request.method, request.path).observe(local_processing_latency*1000)
-        RESPONSE_SIZE.labels(ZONE, K8S_APP, request.method, request.path, request.remote_addr, ID).observe(len(body))
-        app.logger.info("len(body): %d" % len(body))
-        app.logger.info("############### INTERNAL SERVICE FINISHED! ###############")
+        request_metrics.observe("internal", (ZONE, K8S_APP, request.method, request.path, internal_execution), local_processing_latency*1000)
+        request_metrics.observe("response_size", (ZONE, K8S_APP, request.method, request.path, request.remote_addr, ID), len(body))
+        log.info("len(body): %d", len(body))
+        log.info("############### INTERNAL SERVICE FINISHED! ###############")
 
         # Execute the external services
         start_external_request_processing = time.time()
-        app.logger.info("*************** EXTERNAL SERVICES STARTED ***************")
+        log.info("*************** EXTERNAL SERVICES STARTED ***************")
         
         if len(my_service_graph) > 0:
             if len(trace)>0:
-                service_error_dict = run_external_service(my_service_graph,globalDict['work_model'],query_string,trace[ID],app, jaeger_headers)
+                service_error_dict = run_external_service(my_service_graph,query_string,trace[ID],log, jaeger_headers, span_context)
             else:
-                service_error_dict = run_external_service(my_service_graph,globalDict['work_model'],query_string,dict(),app, jaeger_headers)
+                service_error_dict = run_external_service(my_service_graph,query_string,dict(),log, jaeger_headers, span_context)
             if len(service_error_dict):
-                app.logger.error(service_error_dict)
-                app.logger.error("Error in request external services")
-                app.logger.error(service_error_dict)
+                log.error("Error in request external services")
+                log.error(service_error_dict)
                 return make_response(json.dumps({"message": "Error in external services request"}), 500)
-        app.logger.info("############### EXTERNAL SERVICES FINISHED! ###############")
-
-        response = make_response(body)
-        response.mimetype = "text/plain"
-        EXTERNAL_PROCESSING.labels(ZONE, K8S_APP, request.method, request.path).observe((time.time() - start_external_request_processing)*1000)
-        EXTERNAL_PROCESSING_BUCKET.labels(ZONE, K8S_APP, request.method, request.path).observe((time.time() - start_external_request_processing)*1000)
+        log.info("############### EXTERNAL SERVICES FINISHED! ###############")
+
+        payload = payload_file(body) if gunicorn.version_info >= (21, 0) else None
+        if payload is not None:
+            # payload slice sent by the WSGI server with sendfile (wsgi.file_wrapper), without a copy to bytes;
+            # gunicorn < 21 ignores the file offset in sendfile
+            response = Response(wrap_file(request.environ, payload), mimetype="text/plain", direct_passthrough=True)
+            response.content_length = len(body)
+        else:
+            response = make_response(payload_bytes(body))
+            response.mimetype = "text/plain"
+        request_metrics.observe("external", (ZONE, K8S_APP, request.method, request.path), (time.time() - start_external_request_processing)*1000)
         
-        REQUEST_PROCESSING.labels(ZONE, K8S_APP, request.method, request.path, request.remote_addr, ID).observe((time.time() - start_request_processing)*1000)
-        REQUEST_PROCESSING_BUCKET.labels(ZONE, K8S_APP, request.method, request.path, request.remote_addr, ID).observe((time.time() - start_request_processing)*1000)
+        request_metrics.observe("request", (ZONE, K8S_APP, request.method, request.path, request.remote_addr, ID), (time.time() - start_request_processing)*1000)
 
         # Add trace context propagation headers to the response
         response.headers.update(jaeger_headers)
 
+        status_code = 200
         return response
+    except ExternalPoolSaturated as err:
+        log.error("Error in start_worker %s", err)
+        status_code = 503
+        return make_response(json.dumps({"message": "Service saturated"}), 503)
     except Exception as err:
-        app.logger.error("Error in start_worker", err)
-        # app.logger.error(traceback.format_exc())
+        log.error("Error in start_worker %s", err)
+        # log.error(traceback.format_exc())
         return json.dumps({"message": "Error"}), 500
+    finally:
+        end_span(server_span, status_code)
+
+# Hot update of the workmodel: POST the whole workmodel.json, GET returns the work model of this service
+def update_work_model(workmodel):
+    apply_work_model(workmodel)
+    # the other workers of the pod reload it from the shared file
+    write_workmodel(WORKMODEL_UPDATE_FILE, workmodel)
+
+@app.route('/update', methods=['GET','POST'])
+def update():
+    try:
+        if request.method == 'POST':
+            update_work_model(request.json)
+            app.logger.info("Workmodel updated")
+        return make_response(json.dumps(globalDict['work_model'][ID]), 200)
+    except Exception as err:
+        app.logger.error("Error in update %s" % str(err))
+        return make_response(json.dumps({"message": f"Error in workmodel update: {str(err)}"}), 400)
 
 # Prometheus
 @app.route('/metrics')
 def metrics():
     return Response(prometheus_client.generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
 
+# Asyncio execution mode (aiohttp app served by gunicorn aiohttp workers)
+async def start_worker_async(aio_request):
+    log = request_logging.request_logger()
+    server_span = None
+    status_code = 500
+    try:
+        start_request_processing = time.time()
+        log.info('Request Received')
+
+        query_string = aio_request.query_string
+        behaviour_id = aio_request.query.get('bid', 'default')
+        plan = get_behaviour(globalDict['plans'], behaviour_id)
+        my_service_graph = plan.groups
+
+        # trace context propagation
+        jaeger_headers = dict()
+        for jhdr in jaeger_headers_list:
+            val = aio_request.headers.get(jhdr)
+            if val is not None:
+                jaeger_headers[jhdr] = val
+        server_span, span_context, jaeger_headers = start_server_span(ID, jaeger_headers)
+
+        # if POST check the presence of a trace
+        trace=dict()
+        if aio_request.method == 'POST':
+            trace = parse_trace(aio_request.content_type, await aio_request.read())
+
+        if len(trace)>0:
+            my_service_graph = trace_groups(globalDict['plans'], trace[ID], traceEscapeString)
+
+        # Execute the internal service
+        log.info("*************** INTERNAL SERVICE STARTED ***************")
+        start_local_processing = time.time()
+        internal_span = start_span("internal_service", span_context)
+        body = await run_internal_service_async(plan.internal_function, plan.internal_params, internal_execution)
+        end_span(internal_span)
+        local_processing_latency = time.time() - start_local_processing
+        request_metrics.observe("internal", (ZONE, K8S_APP, aio_request.method, aio_request.path, internal_execution), local_processing_latency*1000)
+        request_metrics.observe("response_size", (ZONE, K8S_APP, aio_request.method, aio_request.path, aio_request.remote, ID), len(body))
+        log.info("len(body): %d", len(body))
+        log.info("############### INTERNAL SERVICE FINISHED! ###############")
+
+        # Execute the external services
+        start_external_request_processing = time.time()
+        log.info("*************** EXTERNAL SERVICES STARTED ***************")
+        if len(my_service_graph) > 0:
+            if len(trace)>0:
+                service_error_dict = await run_external_service_async(my_service_graph,query_string,trace[ID],log, jaeger_headers, span_context)
+            else:
+                service_error_dict = await run_external_service_async(my_service_graph,query_string,dict(),log, jaeger_headers, span_context)
+            if len(service_error_dict):
+                log.error("Error in request external services")
+                log.error(service_error_dict)
+                return web.Response(text=json.dumps({"message": "Error in external services request"}), status=500)
+        log.info("############### EXTERNAL SERVICES FINISHED! ###############")
+
+        request_metrics.observe("external", (ZONE, K8S_APP, aio_request.method, aio_request.path), (time.time() - start_external_request_processing)*1000)
+
+        request_metrics.observe("request", (ZONE, K8S_APP, aio_request.method, aio_request.path, aio_request.remote, ID), (time.time() - start_request_processing)*1000)
+
+        # Add trace context propagation headers to the response
+        status_code = 200
+        if isinstance(body, str):
+            return web.Response(text=body, content_type="text/plain", headers=jaeger_headers)
+        # memoryview payloads are written to the socket without copies
+        return web.Response(body=body, content_type="text/plain", headers=jaeger_headers)
+    except Exception as err:
+        log.error("Error in start_worker_async %s", err)
+        return web.Response(text=json.dumps({"message": "Error"}), status=500)
+    finally:
+        end_span(server_span, status_code)
+
+async def update_async(aio_request):
+    try:
+        if aio_request.method == 'POST':
+            update_work_model(await aio_request.json())
+            app.logger.info("Workmodel updated")
+        return web.Response(text=json.dumps(globalDict['work_model'][ID]), content_type="application/json")
+    except Exception as err:
+        app.logger.error("Error in update %s" % str(err))
+        return web.Response(text=json.dumps({"message": f"Error in workmodel update: {str(err)}"}), status=400)
+
+async def metrics_async(aio_request):
+    return web.Response(body=prometheus_client.generate_latest(registry), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+async def on_async_startup(aio_app):
+    global async_loop
+    async_loop = asyncio.get_event_loop()
+    warm_internal_pool()
+    request_metrics.start()
+    request_logging.start()
+    init_tracing(ID, tracing_params, app.logger)
+    start_workmodel_watcher()
+    await init_async_REST(app, int(internal_execution_params["pool_size"]), connection_pool_params, globalDict['work_model'],
+                          connection_pool_metrics)
+    await prewarm_async_REST(external_destinations(), globalDict['work_model'], int(connection_pool_params["prewarm_connections"]), app)
+
+async def on_async_cleanup(aio_app):
+    await close_async_REST(app)
+
+def create_async_app():
+    aio_app = web.Application()
+    aio_app.router.add_route('GET', globalDict['work_model'][ID]['path'], start_worker_async)
+    aio_app.router.add_route('POST', globalDict['work_model'][ID]['path'], start_worker_async)
+    aio_app.router.add_route('GET', '/metrics', metrics_async)
+    aio_app.router.add_route('GET', '/update', update_async)
+    aio_app.router.add_route('POST', '/update', update_async)
+    aio_app.on_startup.append(on_async_startup)
+    aio_app.on_cleanup.append(on_async_cleanup)
+    return aio_app
+
 # Custom Gunicorn application: https://docs.gunicorn.org/en/stable/custom.html
 class HttpServer(gunicorn.app.base.BaseApplication):
     def __init__(self, app, options=None):
@@ -222,78 +540,140 @@ class HttpServer(gunicorn.app.base.BaseApplication):
     def load(self):
         return self.application
 
-# GRPC (no multi-process)
+# gRPC: one grpc.aio server per process, all bound to gRPC_port with SO_REUSEPORT
 gRPC_port = 51313
-class gRPCThread(Thread, pb2_grpc.MicroServiceServicer):
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=int(TN)))
-
-    def __init__(self):
-        Thread.__init__(self)
-
-    def GetMicroServiceResponse(self, req, context):
-        try:
-            start_request_processing = time.time()
-            app.logger.info.info('Request Received')
-            message = req.message
-            remote_address = context.peer().split(":")[1]
-            app.logger.info(f'I am service: {ID} and I received this message: --> "{message}"')
-
-            # Execute the internal service
-            app.logger.info("*************** INTERNAL SERVICE STARTED ***************")
-            start_local_processing = time.time()
-            body = run_internal_service(my_work_model["internal_service"])
-            local_processing_latency = time.time() - start_local_processing
-            INTERNAL_PROCESSING.labels(ZONE, K8S_APP, "grpc", "grpc").observe(local_processing_latency*1000)
-            RESPONSE_SIZE.labels(ZONE, K8S_APP, "grpc", "grpc", remote_address, ID).observe(len(body))
-            app.logger.info("len(body): %d" % len(body))
-            app.logger.info("############### INTERNAL SERVICE FINISHED! ###############")
-
-            # Execute the external services
-            app.logger.info("*************** EXTERNAL SERVICES STARTED ***************")
-            start_external_request_processing = time.time()
-            if len(my_service_graph) > 0:
-                service_error_dict = run_external_service(my_service_graph, globalDict['work_model'])
-                if len(service_error_dict):
-                    app.logger.error(service_error_dict)
-                    app.logger.error("Error in request external services")
-                    app.logger.error(service_error_dict)
-                    result = {'text': f"Error in external services request", 'status_code': False}
-                    return pb2.MessageResponse(**result)
-            app.logger.info("############### EXTERNAL SERVICES FINISHED! ###############")
-
-            result = {'text': body, 'status_code': True}
-            EXTERNAL_PROCESSING.labels(ZONE, K8S_APP, "grpc", "grpc").observe((time.time() - start_external_request_processing)*1000)
-            REQUEST_PROCESSING.labels(ZONE, K8S_APP, "grpc", "grpc", remote_address, ID).observe(
-                (time.time() - start_request_processing)*1000)
-            return pb2.MessageResponse(**result)
-        except Exception as err:
-            app.logger.error("Error: in GetMicroServiceResponse,", err)
-            result = {'text': f"Error: in GetMicroServiceResponse, {str(err)}", 'status_code': False}
-            return pb2.MessageResponse(**result)
-
-    def run(self):
-        pb2_grpc.add_MicroServiceServicer_to_server(self, self.server)
-        self.server.add_insecure_port(f'[::]:{gRPC_port}')
-        self.server.start()
+async def serve_gRPC_request(req, context):
+    log = request_logging.request_logger()
+    server_span = None
+    status_code = 500
+    try:
+        start_request_processing = time.time()
+        log.info('Request Received')
+        remote_address = context.peer().split(":")[1]
+        behaviour_id = req.bid if len(req.bid) > 0 else 'default'
+        plan = get_behaviour(globalDict['plans'], behaviour_id)
+        my_service_graph = plan.groups
+        query_string = f"bid={behaviour_id}"
+
+        # trace context propagation
+        jaeger_headers = dict()
+        for key, val in context.invocation_metadata():
+            if key in jaeger_headers_list:
+                jaeger_headers[key] = val
+        server_span, span_context, jaeger_headers = start_server_span(ID, jaeger_headers)
+
+        # trace-driven request
+        trace=dict()
+        if len(req.trace) > 0:
+            trace = check_trace(decode_trace(req.trace))
+            my_service_graph = trace_groups(globalDict['plans'], trace[ID], traceEscapeString)
+
+        # Execute the internal service
+        log.info("*************** INTERNAL SERVICE STARTED ***************")
+        start_local_processing = time.time()
+        internal_span = start_span("internal_service", span_context)
+        body = await run_internal_service_async(plan.internal_function, plan.internal_params, internal_execution)
+        end_span(internal_span)
+        local_processing_latency = time.time() - start_local_processing
+        request_metrics.observe("internal", (ZONE, K8S_APP, "grpc", "grpc", internal_execution), local_processing_latency*1000)
+        request_metrics.observe("response_size", (ZONE, K8S_APP, "grpc", "grpc", remote_address, ID), len(body))
+        log.info("len(body): %d", len(body))
+        log.info("############### INTERNAL SERVICE FINISHED! ###############")
+
+        # Execute the external services
+        log.info("*************** EXTERNAL SERVICES STARTED ***************")
+        start_external_request_processing = time.time()
+        if len(my_service_graph) > 0:
+            if len(trace)>0:
+                service_error_dict = await run_external_service_async(my_service_graph,query_string,trace[ID],log, jaeger_headers, span_context)
+            else:
+                service_error_dict = await run_external_service_async(my_service_graph,query_string,dict(),log, jaeger_headers, span_context)
+            if len(service_error_dict):
+                log.error("Error in request external services")
+                log.error(service_error_dict)
+                return pb2.MessageResponse(text="Error in external services request", status_code=False)
+        log.info("############### EXTERNAL SERVICES FINISHED! ###############")
+
+        request_metrics.observe("external", (ZONE, K8S_APP, "grpc", "grpc"), (time.time() - start_external_request_processing)*1000)
+
+        request_metrics.observe("request", (ZONE, K8S_APP, "grpc", "grpc", remote_address, ID), (time.time() - start_request_processing)*1000)
+        status_code = 200
+        # protobuf bytes fields need bytes: the payload is copied once, at C speed, then serialized
+        return pb2.MessageResponse(status_code=True, payload=payload_bytes(body))
+    except Exception as err:
+        log.error("Error in serve_gRPC_request %s", err)
+        return pb2.MessageResponse(text=f"Error: in GetMicroServiceResponse, {str(err)}", status_code=False)
+    finally:
+        end_span(server_span, status_code)
+
+class MicroServiceServicer(pb2_grpc.MicroServiceServicer):
+    async def GetMicroServiceResponse(self, req, context):
+        return await serve_gRPC_request(req, context)
+
+    async def StreamMicroServiceResponse(self, request_iterator, context):
+        async for req in request_iterator:
+            yield await serve_gRPC_request(req, context)
+
+async def serve_gRPC():
+    warm_internal_pool()
+    request_metrics.start()
+    request_logging.start()
+    init_tracing(ID, tracing_params, app.logger)
+    start_workmodel_watcher()
+    await init_async_gRPC(app, int(internal_execution_params["pool_size"]), gRPC_port, int(grpc_params["channels"]))
+    server = grpc.aio.server(options=[("grpc.so_reuseport", 1)])
+    pb2_grpc.add_MicroServiceServicer_to_server(MicroServiceServicer(), server)
+    server.add_insecure_port(f'[::]:{gRPC_port}')
+    await server.start()
+    app.logger.info(f"gRPC server started in process {os.getpid()}")
+    try:
+        await server.wait_for_termination()
+    finally:
+        await close_async_gRPC(app)
+
+def gRPC_worker():
+    asyncio.run(serve_gRPC())
+
+def start_gRPC_workers(workers):
+    # workers are forked before any gRPC object is created in this process, since gRPC is not fork-safe
+    processes = list()
+    for i in range(workers):
+        process = multiprocessing.get_context("fork").Process(target=gRPC_worker)
+        process.start()
+        processes.append(process)
+    return processes
 
 if __name__ == '__main__':
-    if request_method == "rest":
-        init_REST(app)
+    if request_method == "rest" and execution_mode == "async":
+        # Start Gunicorn HTTP REST Server (multi-process, one asyncio event loop per process)
+        options_gunicorn = {
+            'bind': '%s:%s' % ('0.0.0.0', 8080),
+            'workers': PN,
+            'config': "/app/gunicorn.conf.py",
+            'worker_class': 'aiohttp.GunicornWebWorker',
+            'keepalive': connection_pool_params["keepalive"]
+        }
+        HttpServer(create_async_app(), options_gunicorn).run()
+    elif request_method == "rest":
+        init_REST(app, connection_pool_params, globalDict['work_model'], connection_pool_metrics)
         # Start Gunicorn HTTP REST Server (multi-process)
         options_gunicorn = {
             'bind': '%s:%s' % ('0.0.0.0', 8080),
             'workers': PN,
             'config': "/app/gunicorn.conf.py",
-            'threads':TN
+            'threads':TN,
+            'keepalive': connection_pool_params["keepalive"],
+            'post_worker_init': post_worker_init
         }
         HttpServer(app, options_gunicorn).run()
     elif request_method == "grpc":
-        my_work_model = globalDict['work_model'][ID]
-        my_service_graph = my_work_model['external_services']
-        init_gRPC(my_service_graph, globalDict['work_model'], gRPC_port,app)
-        # Start the gRPC server
-        grpc_thread = gRPCThread()
-        grpc_thread.run()
+        # Start the gRPC servers (multi-process)
+        grpc_workers = start_gRPC_workers(int(PN))
+        init_gRPC(gRPC_port, app, int(grpc_params["channels"]))
+        request_metrics.start()
+        request_logging.start()
+        init_tracing(ID, tracing_params, app.logger)
+        start_workmodel_watcher()
         # Flask HTTP REST server started for Prometheus metrics and for the entry point (s0) that anyway receives REST requests from API gateway
         app.run(host='0.0.0.0', port=8080, threaded=True)
     else:
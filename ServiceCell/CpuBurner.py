@@ -0,0 +1,102 @@
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Calibrated CPU load engine: the throughput of a fixed kernel is measured once at pod startup (iterations per
+# millisecond of thread CPU time), then a CPU demand expressed in milliseconds is converted into kernel iterations
+
+CALIBRATION_MS = 200  # CPU time spent calibrating each kernel
+CALIBRATION_ROUNDS = 5  # the median round is kept, to filter out preemption and frequency ramp-up
+NUMPY_VECTOR_SIZE = 4096
+
+calibration = dict()  # kernel -> iterations per ms of CPU time
+numpy_vectors = None
+
+
+def python_kernel(iterations):
+    # integer LCG, pure Python: holds the GIL
+    x = 1
+    for i in range(iterations):
+        x = (x * 1103515245 + 12345) & 0x7fffffff
+    return x
+
+
+def numpy_kernel(iterations):
+    # vectorized ufuncs on a fixed-size array: numpy releases the GIL inside each loop
+    global numpy_vectors
+    if numpy_vectors is None:
+        numpy_vectors = (np.random.random(NUMPY_VECTOR_SIZE), np.empty(NUMPY_VECTOR_SIZE))
+    a, b = numpy_vectors
+    for i in range(iterations):
+        np.sin(a, out=b)
+        np.sqrt(b * b + 1.0, out=b)
+    return b[0]
+
+
+KERNELS = {"python": python_kernel}
+if np is not None:
+    KERNELS["numpy"] = numpy_kernel
+
+
+def calibrate(kernel="python"):
+    if kernel not in KERNELS:
+        raise ValueError(f"Unsupported cpu kernel: {kernel}")
+    kernel_function = KERNELS[kernel]
+    # find a chunk of iterations that takes about 1/10 of the calibration time
+    iterations = 16
+    while True:
+        start = time.thread_time()
+        kernel_function(iterations)
+        elapsed_ms = (time.thread_time() - start) * 1000
+        if elapsed_ms >= CALIBRATION_MS / 10:
+            break
+        iterations *= 2
+    rates = list()
+    for r in range(CALIBRATION_ROUNDS):
+        start = time.thread_time()
+        kernel_function(iterations)
+        elapsed_ms = (time.thread_time() - start) * 1000
+        rates.append(iterations / max(elapsed_ms, 1e-3))
+    calibration[kernel] = sorted(rates)[len(rates) // 2]
+    return calibration[kernel]
+
+
+def calibrate_all():
+    for kernel in KERNELS:
+        calibrate(kernel)
+    return calibration
+
+
+def sample_cpu_time(spec):
+    # CPU demand in ms, either a number or {"distribution": ..., distribution parameters}
+    if isinstance(spec, (int, float)):
+        return float(spec)
+    distribution = spec.get("distribution", "constant")
+    if distribution == "constant":
+        value = spec["value"] if "value" in spec else spec["mean"]
+    elif distribution == "uniform":
+        value = random.uniform(spec["min"], spec["max"])
+    elif distribution == "exponential":
+        value = random.expovariate(1 / spec["mean"])
+    elif distribution == "normal":
+        value = random.gauss(spec["mean"], spec["std"])
+    elif distribution == "lognormal":
+        value = random.lognormvariate(spec["mu"], spec["sigma"])
+    else:
+        raise ValueError(f"Unsupported cpu time distribution: {distribution}")
+    if "max" in spec and distribution != "uniform":
+        value = min(value, spec["max"])
+    return max(0.0, float(value))
+
+
+def burn(cpu_time_ms, kernel="python"):
+    if kernel not in calibration:
+        calibrate(kernel)
+    iterations = int(round(cpu_time_ms * calibration[kernel]))
+    if iterations > 0:
+        KERNELS[kernel](iterations)
+    return iterations
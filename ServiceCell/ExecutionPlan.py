@@ -0,0 +1,63 @@
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+# Execution plans precomputed at startup (and on hot update) for the default and the alternative behaviours of a
+# service, so that serving a request only needs a dict lookup by behaviour id (bid)
+
+# calls: tuple of (service, url, probability) -- sample: True if seq_len services must be randomly selected
+GroupPlan = namedtuple("GroupPlan", ["calls", "seq_len", "sample"])
+BehaviourPlan = namedtuple("BehaviourPlan", ["internal_function", "internal_params", "groups"])
+# behaviours: bid -> BehaviourPlan -- destinations: service name -> url
+ServicePlans = namedtuple("ServicePlans", ["behaviours", "destinations"])
+
+
+def compile_group(group, destinations, escape="__"):
+    if "probabilities" in group.keys():
+        probabilities = group["probabilities"]
+    else:
+        probabilities = dict()
+    calls = tuple((service, destinations[service.split(escape)[0]], probabilities.get(service, 1))
+                  for service in group["services"])
+    return GroupPlan(calls, group["seq_len"], group["seq_len"] < len(calls))
+
+
+def compile_behaviour(internal_service, external_services, destinations, resolve_internal=None, escape="__"):
+    if resolve_internal is not None:
+        internal_function, internal_params = resolve_internal(internal_service)
+    else:
+        internal_function, internal_params = list(internal_service)[0], list(internal_service.values())[0]
+    groups = tuple(compile_group(group, destinations, escape) for group in external_services)
+    return BehaviourPlan(internal_function, internal_params, groups)
+
+
+def compile_plans(work_model, service_id, resolve_internal=None, escape="__"):
+    destinations = {service: f'http://{work_model[service]["url"]}{work_model[service]["path"]}' for service in work_model}
+    my_work_model = work_model[service_id]
+    behaviours = dict()
+    behaviours['default'] = compile_behaviour(my_work_model['internal_service'], my_work_model['external_services'],
+                                              destinations, resolve_internal, escape)
+    if "alternative_behaviors" in my_work_model.keys():
+        for bid, behaviour in my_work_model['alternative_behaviors'].items():
+            behaviours[bid] = compile_behaviour(behaviour.get('internal_service', my_work_model['internal_service']),
+                                                behaviour.get('external_services', my_work_model['external_services']),
+                                                destinations, resolve_internal, escape)
+    return ServicePlans(behaviours, destinations)
+
+
+def get_behaviour(plans, behaviour_id):
+    # unknown behaviour ids fall back to the default behaviour
+    return plans.behaviours.get(behaviour_id, plans.behaviours['default'])
+
+
+@lru_cache(maxsize=1024)
+def query_behaviour(query_string):
+    # behaviour id (bid) of a query string, e.g. forwarded to gRPC services
+    return parse_qs(query_string).get('bid', ['default'])[0]
+
+
+def trace_groups(plans, service_trace, escape="__"):
+    # groups of a trace-driven request, i.e. a list of {service: subtrace} dicts called sequentially
+    return [GroupPlan(tuple((service, plans.destinations[service.split(escape)[0]], 1) for service in group),
+                      len(group), False)
+            for group in service_trace]
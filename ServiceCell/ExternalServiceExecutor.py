@@ -1,135 +1,280 @@
 import random
 from readline import append_history_file
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+import os
+import threading
 import time
 import grpc
 import mub_pb2_grpc as pb2_grpc
 import mub_pb2 as pb2
+import itertools
 import json
+from collections import OrderedDict
 from pprint import pprint
+from urllib.parse import urlsplit
+from TraceCodec import subtrace_body, subtrace_bytes
+from ExecutionPlan import query_behaviour
+from Tracing import start_client_span, end_span
 
 
-service_stub = dict()
+service_stub = dict()  # destination url -> round-robin iterator over the stubs of its channels
+grpc_settings = {"port": 51313, "channels": 1}
 s = requests.Session()
+rest_pool_settings = {"params": None, "metrics": None, "mounted": dict()}  # per-destination pools: service -> url prefix
 
-def init_REST(app):
+group_executor = None
+group_executor_lock = threading.Lock()
+group_executor_settings = {"size": 16, "max_queue": 0, "saturation_policy": "queue", "metrics": None}
+
+
+class ExternalPoolSaturated(Exception):
+    pass
+
+
+class GroupExecutor(object):
+    # Long-lived bounded pool that runs the external-service groups of all requests served by a worker process
+    def __init__(self, size, max_queue=0, saturation_policy="queue", metrics=None):
+        self.size = int(size)
+        self.max_queue = int(max_queue)  # groups that may wait for a thread with the reject policy, 0: none wait (the queue policy is unbounded)
+        self.reject = saturation_policy == "reject"
+        self.metrics = metrics  # dict of pre-bound prometheus children: size, queue, active, rejected
+        self.pool = ThreadPoolExecutor(self.size)
+        self.lock = threading.Lock()
+        self.pending = 0  # groups submitted and not yet completed
+        self.pid = os.getpid()
+        if self.metrics is not None:
+            self.metrics["size"].inc(self.size)
+
+    def submit(self, fn, groups_args):
+        n = len(groups_args)
+        with self.lock:
+            if self.reject and self.pending + n > self.size + self.max_queue:
+                if self.metrics is not None:
+                    self.metrics["rejected"].inc()
+                raise ExternalPoolSaturated(f"external pool saturated: {self.pending} pending groups, size {self.size}, max_queue {self.max_queue}")
+            self.pending += n
+        if self.metrics is not None:
+            self.metrics["queue"].inc(n)
+        return [self.pool.submit(self.run, fn, args) for args in groups_args]
+
+    def run(self, fn, args):
+        if self.metrics is not None:
+            self.metrics["queue"].dec()
+            self.metrics["active"].inc()
+        try:
+            return fn(*args)
+        finally:
+            if self.metrics is not None:
+                self.metrics["active"].dec()
+            with self.lock:
+                self.pending -= 1
+
+
+def init_group_executor(size, max_queue=0, saturation_policy="queue", metrics=None):
+    global group_executor_settings
+    group_executor_settings = {"size": size, "max_queue": max_queue, "saturation_policy": saturation_policy, "metrics": metrics}
+
+
+def get_group_executor():
+    # the pool is created lazily in each (forked) worker process and then reused by every request
+    global group_executor
+    if group_executor is None or group_executor.pid != os.getpid():
+        with group_executor_lock:
+            if group_executor is None or group_executor.pid != os.getpid():
+                group_executor = GroupExecutor(**group_executor_settings)
+    return group_executor
+
+class InstrumentedHTTPConnectionPool(HTTPConnectionPool):
+    # HTTP connection pool of a destination that closes connections idle for too long and counts pool hits, misses and waits
+    idle_timeout = None
+    metrics = None
+
+    def _get_conn(self, timeout=None):
+        start = time.time()
+        conn = super()._get_conn(timeout)
+        if conn.sock is not None and self.idle_timeout and start - getattr(conn, "mub_last_used", start) > self.idle_timeout:
+            # keep-alive connection likely already closed by the server, do not risk a failed reuse
+            conn.close()
+        if self.metrics is not None:
+            self.metrics["wait"].observe((time.time() - start)*1000)
+            if conn.sock is None:
+                self.metrics["miss"].inc()
+            else:
+                self.metrics["hit"].inc()
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            conn.mub_last_used = time.time()
+        super()._put_conn(conn)
+
+    def prewarm(self, connections):
+        conns = [HTTPConnectionPool._get_conn(self) for i in range(min(connections, self.pool.maxsize))]
+        opened = 0
+        for conn in conns:
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                    opened += 1
+            except Exception:
+                pass
+            self._put_conn(conn)
+        return opened
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    # requests adapter mounted per destination, with its own pool size and instrumented connection pool
+    def __init__(self, pool_size, pool_block=False, idle_timeout=None, metrics=None):
+        self.pool_cls = type("DestinationHTTPConnectionPool", (InstrumentedHTTPConnectionPool,),
+                             {"idle_timeout": idle_timeout, "metrics": metrics})
+        super().__init__(pool_connections=1, pool_maxsize=pool_size, pool_block=pool_block)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": self.pool_cls, "https": HTTPSConnectionPool}
+
+
+def init_REST(app, pool_params=None, work_model=None, pool_metrics=None):
     app.logger.info("Init REST function")
     global request_function
     request_function = request_REST
+    if pool_params is None:
+        return
+    rest_pool_settings.update({"params": pool_params, "metrics": pool_metrics})
+    mount_REST(work_model)
+
+def mount_REST(work_model):
+    # one connection pool per destination service; returns the services mounted now, e.g. added by a workmodel update
+    pool_params = rest_pool_settings["params"]
+    if pool_params is None:
+        return list()
+    # the adapters are swapped at once, requests in flight keep iterating the previous ones
+    adapters = OrderedDict(s.adapters)
+    mounted = list()
+    for service in work_model:
+        prefix = f'http://{work_model[service]["url"]}/'
+        if rest_pool_settings["mounted"].get(service) == prefix:
+            continue
+        params = dict(pool_params)
+        if "destinations" in pool_params.keys() and service in pool_params["destinations"].keys():
+            params.update(pool_params["destinations"][service])
+        metrics = rest_pool_settings["metrics"](service) if rest_pool_settings["metrics"] is not None else None
+        adapters[prefix] = PooledHTTPAdapter(int(params["pool_size"]), params["pool_block"],
+                                             params["keepalive_idle_timeout"], metrics)
+        # longest prefixes first, as in Session.mount
+        for key in [k for k in adapters if len(k) < len(prefix)]:
+            adapters[key] = adapters.pop(key)
+        rest_pool_settings["mounted"][service] = prefix
+        mounted.append(service)
+    s.adapters = adapters
+    return mounted
+
+def prewarm_REST(services, work_model, connections, app):
+    # open keep-alive connections towards the external services before the first request hits the worker
+    for service in services:
+        try:
+            url = f'http://{work_model[service]["url"]}{work_model[service]["path"]}'
+            pool = s.get_adapter(url).get_connection(url)
+            if isinstance(pool, InstrumentedHTTPConnectionPool):
+                opened = pool.prewarm(connections)
+                app.logger.info("Pre-warmed %d connections to %s" % (opened, service))
+        except Exception as err:
+            app.logger.error("Error in pre-warming connections to %s -- %s" % (service, str(err)))
 
-def init_gRPC(my_service_graph, workmodel, server_port, app):
+def init_gRPC(server_port, app, channels=1):
     app.logger.info("Init gRPC function")
-    global service_stub, request_function
+    global request_function
     request_function = request_gRPC
+    grpc_settings["port"] = server_port
+    grpc_settings["channels"] = channels
 
-    for group in my_service_graph:
-        for service in group["services"]:
-            host = f'{workmodel[service]["url"]}'
-            # instantiate a channel
-            channel = grpc.insecure_channel(
-                '{}:{}'.format(host, server_port))
-            # bind the client and the server
-            service_stub[service] = pb2_grpc.MicroServiceStub(channel)
+def get_gRPC_stub(url):
+    stubs = service_stub.get(url)
+    if stubs is None:
+        # pool of channels (i.e. HTTP/2 connections) per destination, used round-robin; created at the first call,
+        # so that services added by a workmodel update are reachable too
+        host = urlsplit(url).hostname
+        stubs = itertools.cycle([pb2_grpc.MicroServiceStub(grpc.insecure_channel(f'{host}:{grpc_settings["port"]}'))
+                                 for i in range(grpc_settings["channels"])])
+        stubs = service_stub.setdefault(url, stubs)
+    return next(stubs)
 
-def request_REST(service,id,work_model,s,trace,query_string, app, jaeger_context):
+def request_REST(service,url,id,s,trace,query_string, logger, jaeger_context):
+    # url precomputed by the execution plan
     try:
-        service_no_escape = service.split("__")[0]
-        if len(trace)==0 and len(query_string)==0:
-            # default 
-            return s.get(f'http://{work_model[service_no_escape]["url"]}{work_model[service_no_escape]["path"]}', headers=jaeger_context)
-        elif len(trace)>0:
-            # trace-driven request
-            headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-            headers.update(jaeger_context)
-            json_dict = dict()
-            json_dict[service] = trace[id][service]
-            json_payload = json.dumps(json_dict)
-            if  len(query_string)==0:
-                return s.post(f'http://{work_model[service_no_escape]["url"]}{work_model[service_no_escape]["path"]}',data=json_payload,headers=headers)
-            else:
-                return s.post(f'http://{work_model[service_no_escape]["url"]}{work_model[service_no_escape]["path"]}?{query_string}',data=json_payload,headers=headers)
-        elif  len(query_string)>0:
+        if len(query_string)>0:
             # request with enclosed behaviour information
-            return s.get(f'http://{work_model[service_no_escape]["url"]}{work_model[service_no_escape]["path"]}?{query_string}', headers=jaeger_context)  
+            url = f'{url}?{query_string}'
+        if len(trace)==0:
+            r = s.get(url, headers=jaeger_context)
         else:
-            r = requests.Response()
-            r.status_code = 505
-            return r
+            # trace-driven request, binary subtraces are slices of the received trace
+            content_type, trace_payload = subtrace_body(service, trace[id][service])
+            headers = {'Content-type': content_type, 'Accept': 'text/plain'}
+            headers.update(jaeger_context)
+            r = s.post(url,data=trace_payload,headers=headers)
+        return r.status_code, r.content
     except Exception as err:
-        app.logger.error("Error in request external service %s -- %s" % (service, str(err)))
-        r = requests.Response()
-        r.status_code = 505
-        return r
+        logger.error("Error in request external service %s -- %s", service, err)
+        return 505, b""
 
-def request_gRPC(service,id,work_model,s,trace,query_string,app, trace_context=None):
-    message = pb2.Message(message=f"Hello service: {service}")
-    # app.logger.info(f'{message}')
-    response = service_stub[service].GetMicroServiceResponse(message)
-    return response
+def request_gRPC(service,url,id,s,trace,query_string,logger, trace_context=None):
+    message = pb2.Message(message=service, bid=query_behaviour(query_string))
+    if len(trace)>0:
+        message.trace = subtrace_bytes(service, trace[id][service])
+    metadata = tuple(trace_context.items()) if trace_context else None
+    response = get_gRPC_stub(url).GetMicroServiceResponse(message, metadata=metadata)
+    return (200 if response.status_code else 500), response.payload
 
 
-def external_service(group,id,work_model,trace,query_string, app, trace_context):
-    app.logger.info("**** Start SERVICES in thread: %s" % str(group))
+def external_service(group,id,trace,query_string, logger, trace_context, span_context=None):
+    # group is a GroupPlan of ExecutionPlan
+    logger.info("**** Start SERVICES in thread: %s", group.calls)
     global request_function
-    if group["seq_len"] < len(group["services"]):
+    if group.sample:
         # Randomly select seq_len elements from services in the group
-        selected_services = random.sample(group["services"], k=group["seq_len"])
+        selected_calls = random.sample(group.calls, k=group.seq_len)
     else:
-        selected_services = group["services"]
+        selected_calls = group.calls
 
-    # read probabilities of services of the group, if exist
-    if "probabilities" in  group.keys():
-        probabilities = group["probabilities"]
-    else:
-        probabilities = dict()
-    
     service_error_dict = dict()
     service_error_flag = False
 
-    for service in selected_services:
-        # sleep_time = random.randint(2, 5)
-        # app.logger.info("**** Service: %s -- Sleep for %d" % (service, sleep_time))
-        # time.sleep(sleep_time)
+    for service, url, p in selected_calls:
         try:
-            # "url": "http://s0.default.svc.cluster.local",
-            # "path": "/api/v1",
-            if service in probabilities.keys():
-                p = probabilities[service]
-            else:
-                p = 1
-            if random.random() < p :
+            if p >= 1 or random.random() < p :
                 # service called with probability p
-                r = request_function(service,id,work_model,s,trace,query_string, app, trace_context)
-                app.logger.info("Service: %s -> Status_code: %s -- len(text): %d" % (service, r.status_code, len(r.text)))
-                if type(r.status_code) == bool and not r.status_code:
-                    raise Exception(f"Error in external service: {service} -- (gRPC) status_code: {r.status_code}")
-                elif type(r.status_code) == int and r.status_code != 200:
-                    raise Exception(f"Error in external service: {service} -- (REST) status_code: {r.status_code}")
+                span, headers = start_client_span(service, span_context, trace_context)
+                status_code = None
+                try:
+                    status_code, body = request_function(service,url,id,s,trace,query_string, logger, headers)
+                finally:
+                    end_span(span, status_code)
+                logger.info("Service: %s -> Status_code: %s -- len(text): %d", service, status_code, len(body))
+                if status_code != 200:
+                    raise Exception(f"Error in external service: {service} -- status_code: {status_code}")
 
         except Exception as err:
             service_error_dict[service] = err
             service_error_flag = True
-            app.logger.error("Error in request external service %s -- %s" % (service, str(err)))
+            logger.error("Error in request external service %s -- %s", service, err)
 
-    app.logger.info("#### SERVICE Done!")
+    logger.info("#### SERVICE Done!")
     return service_error_flag, service_error_dict
 
 
-def run_external_service(services_group, work_model, query_string, trace, app, trace_context=None):
+def run_external_service(services_group, query_string, trace, logger, trace_context=None, span_context=None):
     
-    app.logger.info("** EXTERNAL SERVICES")
+    logger.info("** EXTERNAL SERVICES")
     service_error_dict = dict()
-    number_of_groups = len(services_group)
-    pool = ThreadPoolExecutor(number_of_groups)
-    futures = list()
-    id = 0
-    for group in services_group:
-        futures.append(pool.submit(external_service, group, id, work_model, trace, query_string, app, trace_context))
-        id = id + 1
+    groups_args = [(group, id, trace, query_string, logger, trace_context, span_context) for id, group in enumerate(services_group)]
+    futures = get_group_executor().submit(external_service, groups_args)
     wait(futures)
     for x in as_completed(futures):
         if x.result()[0]:
             service_error_dict.update(x.result()[1])
-    app.logger.info("--------> Threads Done!")
-    return service_error_dict
\ No newline at end of file
+    logger.info("--------> Threads Done!")
+    return service_error_dict
@@ -1,44 +1,26 @@
 from readline import append_history_file
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
 import threading
 import os
 import glob
+import importlib
 import random
 import jsonmerge
-
-internal_service_function = None
-internal_service_params_v = None
-
-# Dinamyc import of all function in InternalServiceFunctions folder
-for path in glob.glob('MSConfig/InternalServiceFunctions/[!_]*.py'):
-    name, ext = os.path.splitext(os.path.basename(path))
-    exec(f"from MSConfig.InternalServiceFunctions.{name} import *")
-
-
-class InternalServiceExecutor(threading.Thread):
-    def __init__(self, internal_service_function, params, response):
-        threading.Thread.__init__(self)
-        self.params = params
-        self.internal_service_function = internal_service_function
-        self.response = response
-
-    def run(self):
-        self.response.set_body(self.internal_service_function(self.params))
-        # self.response.set_body(eval(self.internal_service_function))
-
-
-class ThreadReturnedValue:
-    def __init__(self):
-        self.body = None
-
-    def get_body(self):
-        return self.body
-
-    def set_body(self, body):
-        self.body = body
-
+from CpuBurner import burn, sample_cpu_time
+from ResponsePayload import get_payload, payload_bytes
+
+# internal-service execution strategies: "inline" (request thread), "thread" (shared per-worker thread pool),
+# "process" (per-worker process pool, for CPU-bound functions that must escape the GIL)
+EXECUTION_STRATEGIES = ["inline", "thread", "process"]
+# functions a workmodel can name as internal_service (register_internal_service_functions); names are never evaluated
+internal_service_functions = dict()
+internal_pool = None
+internal_pool_lock = threading.Lock()
+internal_pool_settings = {"strategy": "inline", "pool_size": 1}
 
 def compute_pi(params):
-    default_params = {"range_complexity": [50, 100], "mean_response_size": 10} 
+    default_params = {"range_complexity": [50, 100], "mean_response_size": 10, "response_content": "compressible"}
     params = jsonmerge.merge(default_params,params)
     if "mean_bandwidth" in params:
         # for backward compatibility
@@ -62,29 +44,87 @@ def compute_pi(params):
             q, r, t, k, m, x = q*k, (2*q+r)*x, t*x, k+1, (q*(7*k+2)+r*x)//(t*x), x+2
   
 
-    bandwidth_load = random.expovariate(1 / params["mean_response_size"])
-    num_chars = max(1, 1000 * bandwidth_load)  # Response in kB
-    response_body = 'm' * int(num_chars)
+    return get_payload(params["mean_response_size"], params["response_content"])  # Response in kB
+
+
+def cpu_burn(params):
+    # CPU demand given in ms of CPU time, converted to work by the kernel calibrated at startup
+    default_params = {"cpu_time_ms": 10, "kernel": "python", "mean_response_size": 10, "response_content": "compressible"}
+    params = jsonmerge.merge(default_params,params)
+    burn(sample_cpu_time(params["cpu_time_ms"]), params["kernel"])
+
+    return get_payload(params["mean_response_size"], params["response_content"])  # Response in kB
+
+
+def custom_functions(module):
+    # functions listed in __all__ of a custom module, or else its public functions (not the imported ones)
+    if hasattr(module, "__all__"):
+        return {name: getattr(module, name) for name in module.__all__ if callable(getattr(module, name))}
+    return {name: value for name, value in vars(module).items()
+            if not name.startswith("_") and callable(value) and getattr(value, "__module__", None) == module.__name__}
 
-    return response_body
 
+def register_internal_service_functions():
+    # Dinamyc import of all function in InternalServiceFunctions folder, the built-in functions have precedence
+    for path in sorted(glob.glob('MSConfig/InternalServiceFunctions/[!_]*.py')):
+        name, ext = os.path.splitext(os.path.basename(path))
+        internal_service_functions.update(custom_functions(importlib.import_module(f"MSConfig.InternalServiceFunctions.{name}")))
+    internal_service_functions.update({"compute_pi": compute_pi, "cpu_burn": cpu_burn})
 
-def set_internal_service_function(internal_service_params):
-    global internal_service_function, internal_service_params_v
+
+def init_internal_service(strategy="inline", pool_size=1):
+    global internal_pool_settings
+    if strategy not in EXECUTION_STRATEGIES:
+        raise ValueError(f"Unsupported internal service execution strategy: {strategy}")
+    internal_pool_settings = {"strategy": strategy, "pool_size": int(pool_size)}
+
+
+def get_internal_pool():
+    # the pool is created lazily in each (forked) worker process and then reused by every request
+    global internal_pool
+    if internal_pool is None or internal_pool.mub_pid != os.getpid():
+        with internal_pool_lock:
+            if internal_pool is None or internal_pool.mub_pid != os.getpid():
+                if internal_pool_settings["strategy"] == "process":
+                    internal_pool = ProcessPoolExecutor(internal_pool_settings["pool_size"], mp_context=multiprocessing.get_context("fork"))
+                else:
+                    internal_pool = ThreadPoolExecutor(internal_pool_settings["pool_size"])
+                internal_pool.mub_pid = os.getpid()
+    return internal_pool
+
+
+def warm_internal_pool():
+    # start the pool processes before the worker serves requests, i.e. before forking a multi-threaded process
+    if internal_pool_settings["strategy"] == "process":
+        get_internal_pool().submit(os.getpid).result()
+
+
+def get_internal_service_function(internal_service_params):
     function_name = list(internal_service_params)[0]
-    internal_service_params_v = list(internal_service_params.values())[0]
-    internal_service_function = eval(function_name)
-
-def run_internal_service(internal_service_params):
-    global internal_service_function, internal_service_params_v
-    if internal_service_function == None:
-        set_internal_service_function(internal_service_params)
-    #function_name = list(internal_service_params)[0]
-    #internal_service_params_v = list(internal_service_params.values())[0]
-    # response = list()
-    # response = dict()
-    response = ThreadReturnedValue()
-    thread = InternalServiceExecutor(internal_service_function, internal_service_params_v, response)
-    thread.start()
-    thread.join()
-    return response.get_body()
\ No newline at end of file
+    if function_name not in internal_service_functions:
+        raise ValueError(f"Unknown internal service function: {function_name}")
+    return internal_service_functions[function_name], internal_service_params[function_name]
+
+
+def run_in_process(internal_service_function, internal_service_params_v):
+    # memoryview payloads cannot be pickled back to the worker
+    return payload_bytes(internal_service_function(internal_service_params_v))
+
+
+def run_internal_service(internal_service_params, strategy=None):
+    internal_service_function, internal_service_params_v = get_internal_service_function(internal_service_params)
+    return run_internal_function(internal_service_function, internal_service_params_v, strategy)
+
+
+def run_internal_function(internal_service_function, internal_service_params_v, strategy=None):
+    # function already resolved, e.g. by an execution plan
+    if strategy is None:
+        strategy = internal_pool_settings["strategy"]
+    if strategy == "inline":
+        return internal_service_function(internal_service_params_v)
+    if strategy == "process":
+        return get_internal_pool().submit(run_in_process, internal_service_function, internal_service_params_v).result()
+    return get_internal_pool().submit(internal_service_function, internal_service_params_v).result()
+
+
+register_internal_service_functions()
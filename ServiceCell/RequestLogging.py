@@ -0,0 +1,69 @@
+import atexit
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+# Logging of the request handlers of a service-cell.
+# Info lines are written for a sample of the requests (sample_rate), decided once per request so that the lines of a
+# sampled request are complete; errors are always written. In "async" mode the records are put on a queue and
+# formatted and written by a listener thread of the worker, instead of the thread serving the request.
+
+LOGGING_MODES = ["sync", "async"]
+
+
+class RequestLogger(object):
+    # logger of a single request
+    __slots__ = ("logger", "enabled")
+
+    def __init__(self, logger, enabled):
+        self.logger = logger
+        self.enabled = enabled
+
+    def info(self, msg, *args):
+        if self.enabled:
+            self.logger.info(msg, *args)
+
+    def error(self, msg, *args):
+        self.logger.error(msg, *args)
+
+
+class DeferredQueueHandler(QueueHandler):
+    # records stay in this process, so they are formatted by the listener thread and not by the caller
+    def prepare(self, record):
+        return record
+
+
+class RequestLogging(object):
+    def __init__(self, logger, mode="sync", level=None, sample_rate=1.0):
+        if mode not in LOGGING_MODES:
+            raise ValueError(f"Unsupported logging mode: {mode}")
+        if level is not None:
+            logger.setLevel(level.upper())
+        self.logger = logger
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.handlers = list(logger.handlers)
+        self.listener = None
+        self.listener_pid = None
+        self.sampled = RequestLogger(logger, True)
+        self.unsampled = RequestLogger(logger, False)
+
+    def request_logger(self):
+        if not self.logger.isEnabledFor(logging.INFO):
+            return self.unsampled
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            return self.sampled
+        return self.unsampled
+
+    def start(self):
+        # to be called in each (forked) worker process
+        if self.mode != "async" or self.listener_pid == os.getpid():
+            return
+        self.listener_pid = os.getpid()
+        records = queue.SimpleQueue()
+        self.logger.handlers = [DeferredQueueHandler(records)]
+        self.listener = QueueListener(records, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
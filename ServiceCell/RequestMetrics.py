@@ -0,0 +1,183 @@
+import atexit
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Per-request Prometheus metrics of a service-cell.
+# "direct" mode observes the metrics in the thread serving the request, through label children bound once per label set.
+# "buffered" mode only appends (metric group, label values, value) to a per-worker deque (append is atomic, no lock);
+# a flusher thread drains it every flush_interval seconds, aggregates the observations per label set in fixed-size
+# bucket counters and writes count, sum and buckets to the multiprocess store with one increment per series.
+# The increments use internal value objects of the metric children of prometheus-client==0.9.0 (requirements.txt):
+# buffered mode falls back to direct mode if they are not found (BUFFERED_SUPPORTED).
+
+METRICS_MODES = ["direct", "buffered"]
+OPTIONAL_LABELS = ['method', 'endpoint', 'from', 'kubernetes_service', 'execution']  # 'zone' and 'app_name' are always kept
+
+DEFAULT_BUCKETS = [0.5, 1, 10, 100, 1000, 10000, float("inf")]  # ms
+BUCKET_LAYOUTS = ["fixed", "exponential", "log-linear", "native"]
+
+
+def round_bound(value):
+    # 4 significant digits, so that bounds print (and are matched by le) without float noise
+    return float('%.4g' % value)
+
+
+def make_buckets(spec=None):
+    # latency histogram buckets (ms) from a layout specification, e.g.
+    # {"layout": "fixed", "buckets": [...]}
+    # {"layout": "exponential", "min": 1, "factor": 1.5, "max": 10000}
+    # {"layout": "log-linear", "min": 1, "max": 10000, "steps": 9}: steps linear buckets per decade (1,2,..,9 x 10^k)
+    # {"layout": "native", "min": 1, "max": 10000, "schema": 2}: bounds 2^(i * 2^-schema) of the Prometheus
+    # native (sparse) histograms with the given schema, so that classic and native series are comparable
+    if spec is None:
+        return list(DEFAULT_BUCKETS)
+    layout = spec.get("layout", "fixed")
+    if layout == "fixed":
+        bounds = [float(b) for b in spec.get("buckets", DEFAULT_BUCKETS)]
+    elif layout == "exponential":
+        bounds = list()
+        bound = float(spec["min"])
+        while bound < spec["max"]:
+            bounds.append(round_bound(bound))
+            bound *= spec["factor"]
+        bounds.append(round_bound(spec["max"]))
+    elif layout == "log-linear":
+        steps = int(spec.get("steps", 9))
+        bounds = list()
+        decade = 10 ** math.floor(math.log10(spec["min"]))
+        while decade < spec["max"]:
+            for i in range(steps):
+                bound = round_bound(decade * (1 + 9 * i / steps))
+                if spec["min"] <= bound < spec["max"]:
+                    bounds.append(bound)
+            decade *= 10
+        bounds.append(round_bound(spec["max"]))
+    elif layout == "native":
+        base = 2 ** (2 ** -int(spec.get("schema", 2)))
+        first = math.floor(math.log(spec["min"], base))
+        last = math.ceil(math.log(spec["max"], base))
+        bounds = [round_bound(base ** i) for i in range(first, last + 1)]
+    else:
+        raise ValueError(f"Unsupported histogram bucket layout: {layout}")
+    bounds = sorted(set(bounds))
+    if bounds[-1] != float("inf"):
+        bounds.append(float("inf"))
+    return bounds
+
+
+def client_internals():
+    # whether Summary and Histogram children keep their count, sum and buckets in values with inc(), as in
+    # prometheus_client 0.9
+    try:
+        from prometheus_client import Histogram, Summary
+        summary = Summary("mub_internals_check", "", registry=None)
+        histogram = Histogram("mub_internals_check", "", registry=None, buckets=[1])
+        values = [summary._count, summary._sum, histogram._sum] + list(histogram._buckets)
+        return all(callable(getattr(value, "inc", None)) for value in values)
+    except Exception:
+        return False
+
+
+BUFFERED_SUPPORTED = client_internals()
+
+
+def kept_labels(labels, optional_labels):
+    return [label for label in labels if label not in OPTIONAL_LABELS or label in optional_labels]
+
+
+class RequestMetrics(object):
+    def __init__(self, mode="direct", flush_interval=1.0, optional_labels=OPTIONAL_LABELS, logger=None):
+        if mode not in METRICS_MODES:
+            raise ValueError(f"Unsupported metrics mode: {mode}")
+        if mode == "buffered" and not BUFFERED_SUPPORTED:
+            if logger is not None:
+                logger.error("Buffered metrics not supported by this prometheus_client version, direct mode is used")
+            mode = "direct"
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self.optional_labels = optional_labels
+        self.logger = logger
+        self.groups = dict()  # group name -> (metrics, indexes of the kept label values, histogram buckets)
+        self.children = dict()  # (group name, kept label values) -> label children of the group metrics
+        self.queue = deque()
+        self.flusher_pid = None
+
+    def labels(self, labels):
+        # label names of a metric, to be used in its definition
+        return kept_labels(labels, self.optional_labels)
+
+    def register(self, name, labels, metrics, buckets=None):
+        # metrics (Summaries and Histograms with the given buckets) observed together with the same value,
+        # labels: full list of label names
+        indexes = tuple(i for i, label in enumerate(labels) if label in kept_labels(labels, self.optional_labels))
+        if buckets is not None and buckets[-1] != float("inf"):
+            buckets = list(buckets) + [float("inf")]
+        self.groups[name] = (metrics, indexes, buckets)
+
+    def series(self, name, label_values):
+        return name, tuple(label_values[i] for i in self.groups[name][1])
+
+    def get_children(self, series):
+        children = self.children.get(series)
+        if children is None:
+            children = tuple(metric.labels(*series[1]) for metric in self.groups[series[0]][0])
+            self.children[series] = children
+        return children
+
+    def observe(self, name, label_values, value):
+        if self.mode == "buffered":
+            self.queue.append((name, label_values, value))
+            return
+        for child in self.get_children(self.series(name, label_values)):
+            child.observe(value)
+
+    def start(self):
+        # to be called in each (forked) worker process
+        if self.mode != "buffered" or self.flusher_pid == os.getpid():
+            return
+        self.flusher_pid = os.getpid()
+        self.children = dict()
+        threading.Thread(target=self.run, daemon=True).start()
+        atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as err:
+                if self.logger is not None:
+                    self.logger.error("Error in metrics flush -- %s" % str(err))
+
+    def flush(self):
+        aggregates = dict()  # (group name, kept label values) -> [count, sum, bucket counts]
+        while True:
+            try:
+                name, label_values, value = self.queue.popleft()
+            except IndexError:
+                break
+            series = self.series(name, label_values)
+            aggregate = aggregates.get(series)
+            buckets = self.groups[name][2]
+            if aggregate is None:
+                aggregate = [0, 0.0, [0] * len(buckets) if buckets is not None else None]
+                aggregates[series] = aggregate
+            aggregate[0] += 1
+            aggregate[1] += value
+            if buckets is not None:
+                aggregate[2][bisect_left(buckets, value)] += 1
+        for series, (count, total, bucket_counts) in aggregates.items():
+            for child in self.get_children(series):
+                # same updates as Summary.observe and Histogram.observe (prometheus_client 0.9), one per series
+                child._sum.inc(total)
+                if hasattr(child, '_buckets'):
+                    for i, bucket_count in enumerate(bucket_counts):
+                        if bucket_count > 0:
+                            child._buckets[i].inc(bucket_count)
+                else:
+                    child._count.inc(count)
+        return len(aggregates)
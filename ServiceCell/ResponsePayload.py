@@ -0,0 +1,109 @@
+import mmap
+import os
+import random
+import string
+import tempfile
+
+import numpy as np
+
+# Response bodies are slices of a preallocated per-worker buffer instead of strings built for every request.
+# "compressible" content is a single repeated character, "incompressible" content is random ascii letters.
+# Buffers are memory maps of (unlinked) files, so that WSGI responses can send a slice with sendfile (PayloadFile),
+# without copying it to a bytes object.
+CONTENT_MODES = ["compressible", "incompressible"]
+BUFFER_SIZE = 1 << 20  # initial buffer size (bytes), grown on demand for larger responses
+
+buffers = dict()  # content mode -> buffer of the current process
+buffers_pid = None
+buffer_files = dict()  # id of a buffer -> (buffer, descriptor of its file, address of its first byte)
+PAYLOAD_DIR = os.environ.get("PAYLOAD_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+
+def make_buffer(mode, size):
+    if mode == "compressible":
+        return b'm' * size
+    elif mode == "incompressible":
+        return ''.join(random.choices(string.ascii_letters, k=size)).encode('ascii')
+    raise ValueError(f"Unsupported response content mode: {mode}")
+
+
+def get_buffer(mode, size):
+    global buffers, buffers_pid
+    if buffers_pid != os.getpid():
+        # new (forked) worker: do not share the random content with the parent
+        buffers = dict()
+        buffers_pid = os.getpid()
+    buffer = buffers.get(mode)
+    if buffer is None or len(buffer) < size:
+        buffer = file_buffer(make_buffer(mode, max(BUFFER_SIZE, 2 * size)))
+        buffers[mode] = buffer
+    return buffer
+
+
+def file_buffer(content):
+    # read-only memory map of a file with the content; the file is unlinked and reopened through /proc/self/fd
+    fd, path = tempfile.mkstemp(prefix="mub-payload-", dir=PAYLOAD_DIR)
+    os.unlink(path)
+    view = memoryview(content)
+    while len(view) > 0:
+        view = view[os.write(fd, view):]
+    buffer = mmap.mmap(fd, len(content), access=mmap.ACCESS_READ)
+    # previous buffers stay referenced, payloads of requests in flight may still slice them
+    buffer_files[id(buffer)] = (buffer, fd, np.frombuffer(buffer, dtype=np.uint8).ctypes.data)
+    return buffer
+
+
+def get_payload(mean_response_size, mode="compressible"):
+    # size is a sample of an exp neg random variable with mean mean_response_size kB
+    bandwidth_load = random.expovariate(1 / mean_response_size)
+    num_chars = int(max(1, 1000 * bandwidth_load))
+    buffer = get_buffer(mode, num_chars)
+    if mode == "compressible":
+        offset = 0
+    else:
+        offset = random.randrange(len(buffer) - num_chars + 1)
+    return memoryview(buffer)[offset:offset + num_chars]
+
+
+def payload_bytes(body):
+    # protobuf messages and pickling need bytes, a memoryview slice is copied once at C speed
+    if isinstance(body, memoryview):
+        return body.tobytes()
+    return body
+
+
+class PayloadFile(object):
+    # file object of a payload slice, sent by gunicorn with sendfile when wrapped by wsgi.file_wrapper; read() is
+    # the fallback (e.g. TLS) and copies
+    def __init__(self, fd, offset, length):
+        self.fd = os.open(f"/proc/self/fd/{fd}", os.O_RDONLY)  # own file offset, concurrent responses do not share it
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        self.remaining = length
+
+    def fileno(self):
+        return self.fd
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = os.read(self.fd, size) if size > 0 else b""
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def payload_file(body):
+    # PayloadFile of a payload returned by get_payload, None for other bodies
+    if not isinstance(body, memoryview) or len(body) == 0:
+        return None
+    entry = buffer_files.get(id(body.obj))
+    if entry is None or entry[0] is not body.obj:
+        return None
+    try:
+        return PayloadFile(entry[1], np.frombuffer(body, dtype=np.uint8).ctypes.data - entry[2], len(body))
+    except OSError:
+        return None
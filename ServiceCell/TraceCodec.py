@@ -0,0 +1,83 @@
+import json
+import struct
+
+# Compact binary encoding of trace-driven requests. A node is encoded in preorder as
+#   u16 name length | name (utf-8) | u16 number of groups | for each group: u16 number of services |
+#   for each service: u32 length of the child node | child node
+# so that the subtrace of every called service is a contiguous slice of the received body, forwarded without
+# decoding and re-encoding it. Only the direct children of a node are visited when a request is received.
+
+TRACE_CONTENT_TYPE = "application/x-mub-trace"
+U16 = struct.Struct("!H")
+U32 = struct.Struct("!I")
+
+
+def encode_node(name, groups, out):
+    name_bytes = name.encode('utf-8')
+    out += U16.pack(len(name_bytes))
+    out += name_bytes
+    out += U16.pack(len(groups))
+    for group in groups:
+        out += U16.pack(len(group))
+        for service, subtrace in group.items():
+            child_offset = len(out)
+            out += U32.pack(0)
+            encode_node(service, subtrace, out)
+            U32.pack_into(out, child_offset, len(out) - child_offset - U32.size)
+    return out
+
+
+def encode_trace(trace):
+    # JSON trace {service: [groups]} -> bytes
+    assert len(trace.keys()) == 1, 'bad trace format'
+    name = list(trace)[0]
+    return bytes(encode_node(name, trace[name], bytearray()))
+
+
+def read_name(buffer, offset):
+    name_len, = U16.unpack_from(buffer, offset)
+    offset += U16.size
+    return str(buffer[offset:offset + name_len], 'utf-8'), offset + name_len
+
+
+def decode_trace(data):
+    # bytes -> {service: [groups]}, where a group is a dict {called service: memoryview of its subtrace}
+    buffer = memoryview(data)
+    name, offset = read_name(buffer, 0)
+    n_groups, = U16.unpack_from(buffer, offset)
+    offset += U16.size
+    groups = list()
+    for g in range(n_groups):
+        n_services, = U16.unpack_from(buffer, offset)
+        offset += U16.size
+        group = dict()
+        for i in range(n_services):
+            child_len, = U32.unpack_from(buffer, offset)
+            offset += U32.size
+            service, _ = read_name(buffer, offset)
+            group[service] = buffer[offset:offset + child_len]
+            offset += child_len
+        groups.append(group)
+    return {name: groups}
+
+
+def trace_to_json(data):
+    # full (recursive) decoding, e.g. for debugging
+    trace = decode_trace(data)
+    name = list(trace)[0]
+    return {name: [{service: trace_to_json(subtrace)[service] for service, subtrace in group.items()}
+                   for group in trace[name]]}
+
+
+def subtrace_bytes(service, subtrace):
+    # binary subtrace of the called service, e.g. for gRPC messages
+    if isinstance(subtrace, memoryview):
+        return subtrace.tobytes()
+    return encode_trace({service: subtrace})
+
+
+def subtrace_body(service, subtrace):
+    # content type and body of the request that carries the subtrace of the called service
+    if isinstance(subtrace, memoryview):
+        return TRACE_CONTENT_TYPE, subtrace.tobytes()
+    return 'application/json', json.dumps({service: subtrace})
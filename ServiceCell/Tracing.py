@@ -0,0 +1,104 @@
+import os
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+
+# Optional OpenTelemetry spans of a service-cell: a server span per request, an internal-processing span and a client
+# span per external-service call. Sampling is head-based (ratio of the new traces, the sampled flag of the caller is
+# followed) and spans are exported in batches by a background thread of the worker (BatchSpanProcessor).
+
+EXPORTERS = ["otlp", "jaeger", "file"]
+
+tracer = None
+tracer_provider = None
+tracer_pid = None
+
+
+def make_exporter(params):
+    exporter = params.get("exporter", "otlp")
+    if exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=params.get("endpoint", "http://localhost:4317"), insecure=True)
+    elif exporter == "jaeger":
+        from opentelemetry.exporter.jaeger.thrift import JaegerExporter
+        return JaegerExporter(agent_host_name=params.get("agent_host", "localhost"), agent_port=int(params.get("agent_port", 6831)))
+    elif exporter == "file":
+        # one JSON span per line, one file per worker process
+        out = open(f'{params.get("file", "/tmp/mub-spans")}.{os.getpid()}.jsonl', "a")
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + os.linesep)
+    raise ValueError(f"Unsupported span exporter: {exporter}")
+
+
+def init_tracing(service, params, logger):
+    # to be called in each (forked) worker process, since the export thread does not survive a fork
+    global tracer, tracer_provider, tracer_pid
+    if not params.get("enabled", False) or tracer_pid == os.getpid():
+        return tracer is not None
+    tracer_pid = os.getpid()
+    if trace is None:
+        logger.error("Tracing disabled: the opentelemetry-sdk package is not installed")
+        return False
+    try:
+        exporter = make_exporter(params)
+    except Exception as err:
+        # e.g. the package of the exporter is not installed: the service-cell runs without tracing
+        logger.error(f"Tracing disabled: {params.get('exporter', 'otlp')} exporter not available, {err}")
+        return False
+    tracer_provider = TracerProvider(resource=Resource.create({"service.name": service}),
+                                     sampler=ParentBased(TraceIdRatioBased(float(params.get("sample_rate", 0.01)))))
+    tracer_provider.add_span_processor(BatchSpanProcessor(exporter,
+                                                          max_queue_size=int(params.get("max_queue_size", 2048)),
+                                                          schedule_delay_millis=float(params.get("schedule_delay_ms", 1000)),
+                                                          max_export_batch_size=int(params.get("max_export_batch_size", 512))))
+    tracer = tracer_provider.get_tracer("mubench.servicecell")
+    logger.info(f'Tracing enabled, exporter: {params.get("exporter", "otlp")}')
+    return True
+
+
+def start_server_span(name, headers):
+    # server span of a request, child of the caller span propagated in headers; returns the span, the context of
+    # its child spans and the headers to propagate. Child spans of requests not sampled are not created at all: the
+    # context of the server span (not sampled) is injected once in the headers propagated to the called services
+    if tracer is None:
+        return None, None, headers
+    span = tracer.start_span(name, context=propagate.extract(headers), kind=SpanKind.SERVER)
+    span_context = trace.set_span_in_context(span)
+    if span.is_recording():
+        return span, span_context, headers
+    headers = dict(headers)
+    propagate.inject(headers, context=span_context)
+    return span, None, headers
+
+
+def start_span(name, span_context):
+    if tracer is None or span_context is None:
+        return None
+    return tracer.start_span(name, context=span_context, kind=SpanKind.INTERNAL)
+
+
+def start_client_span(service, span_context, headers):
+    # client span of an external-service call; returns the span and the headers that propagate it
+    if tracer is None or span_context is None:
+        return None, headers
+    span = tracer.start_span(service, context=span_context, kind=SpanKind.CLIENT)
+    # injected also when not sampled, so that the called services follow the sampling decision of the trace
+    headers = dict(headers) if headers else dict()
+    propagate.inject(headers, context=trace.set_span_in_context(span))
+    return span, headers
+
+
+def end_span(span, status_code=None):
+    if span is None:
+        return
+    if status_code is not None and span.is_recording():
+        span.set_attribute("http.status_code", status_code)
+        if status_code != 200:
+            span.set_status(Status(StatusCode.ERROR))
+    span.end()
@@ -0,0 +1,54 @@
+import json
+import os
+import threading
+import time
+
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def write_workmodel(path, workmodel):
+    # write + rename, so that watchers never read a partially written file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(workmodel, f)
+    os.replace(tmp_path, path)
+
+
+class WorkModelWatcher(threading.Thread):
+    # Polls the workmodel files (e.g. the ConfigMap and the file written by /update) of the pod and calls
+    # on_change with the content of the most recently modified one whenever any of them changes
+    def __init__(self, paths, interval, on_change, logger, mtimes=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.paths = paths
+        self.interval = interval
+        self.on_change = on_change
+        self.logger = logger
+        self.mtimes = mtimes if mtimes is not None else {path: file_mtime(path) for path in paths}
+
+    def check(self):
+        mtimes = {path: file_mtime(path) for path in self.paths}
+        if mtimes == self.mtimes:
+            return False
+        self.mtimes = mtimes
+        existing = [path for path in self.paths if mtimes[path] is not None]
+        if len(existing) == 0:
+            return False
+        newest = max(existing, key=lambda path: mtimes[path])
+        with open(newest) as f:
+            workmodel = json.load(f)
+        self.on_change(workmodel)
+        self.logger.info(f"Workmodel reloaded from {newest}")
+        return True
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as err:
+                self.logger.error("Error in workmodel reload -- %s" % str(err))
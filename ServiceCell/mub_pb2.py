@@ -3,6 +3,7 @@
 # source: mub.proto
 """Generated protocol buffer code."""
 from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
 from google.protobuf import message as _message
 from google.protobuf import reflection as _reflection
 from google.protobuf import symbol_database as _symbol_database
@@ -13,92 +14,12 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor.FileDescriptor(
-  name='mub.proto',
-  package='microservice',
-  syntax='proto3',
-  serialized_options=None,
-  create_key=_descriptor._internal_create_key,
-  serialized_pb=b'\n\tmub.proto\x12\x0cmicroservice\"\x1a\n\x07Message\x12\x0f\n\x07message\x18\x01 \x01(\t\"4\n\x0fMessageResponse\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x13\n\x0bstatus_code\x18\x02 \x01(\x08\x32\x61\n\x0cMicroService\x12Q\n\x17GetMicroServiceResponse\x12\x15.microservice.Message\x1a\x1d.microservice.MessageResponse\"\x00\x62\x06proto3'
-)
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\tmub.proto\x12\x0cmicroservice\"6\n\x07Message\x12\x0f\n\x07message\x18\x01 \x01(\t\x12\x0b\n\x03\x62id\x18\x02 \x01(\t\x12\r\n\x05trace\x18\x03 \x01(\x0c\"E\n\x0fMessageResponse\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x13\n\x0bstatus_code\x18\x02 \x01(\x08\x12\x0f\n\x07payload\x18\x03 \x01(\x0c\x32\xbb\x01\n\x0cMicroService\x12Q\n\x17GetMicroServiceResponse\x12\x15.microservice.Message\x1a\x1d.microservice.MessageResponse\"\x00\x12X\n\x1aStreamMicroServiceResponse\x12\x15.microservice.Message\x1a\x1d.microservice.MessageResponse\"\x00(\x01\x30\x01\x62\x06proto3')
 
 
 
-
-_MESSAGE = _descriptor.Descriptor(
-  name='Message',
-  full_name='microservice.Message',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='message', full_name='microservice.Message.message', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=27,
-  serialized_end=53,
-)
-
-
-_MESSAGERESPONSE = _descriptor.Descriptor(
-  name='MessageResponse',
-  full_name='microservice.MessageResponse',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  create_key=_descriptor._internal_create_key,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='text', full_name='microservice.MessageResponse.text', index=0,
-      number=1, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"".decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-    _descriptor.FieldDescriptor(
-      name='status_code', full_name='microservice.MessageResponse.status_code', index=1,
-      number=2, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto3',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=55,
-  serialized_end=107,
-)
-
-DESCRIPTOR.message_types_by_name['Message'] = _MESSAGE
-DESCRIPTOR.message_types_by_name['MessageResponse'] = _MESSAGERESPONSE
-_sym_db.RegisterFileDescriptor(DESCRIPTOR)
-
+_MESSAGE = DESCRIPTOR.message_types_by_name['Message']
+_MESSAGERESPONSE = DESCRIPTOR.message_types_by_name['MessageResponse']
 Message = _reflection.GeneratedProtocolMessageType('Message', (_message.Message,), {
   'DESCRIPTOR' : _MESSAGE,
   '__module__' : 'mub_pb2'
@@ -113,31 +34,14 @@ MessageResponse = _reflection.GeneratedProtocolMessageType('MessageResponse', (_
   })
 _sym_db.RegisterMessage(MessageResponse)
 
+_MICROSERVICE = DESCRIPTOR.services_by_name['MicroService']
+if _descriptor._USE_C_DESCRIPTORS == False:
 
-
-_MICROSERVICE = _descriptor.ServiceDescriptor(
-  name='MicroService',
-  full_name='microservice.MicroService',
-  file=DESCRIPTOR,
-  index=0,
-  serialized_options=None,
-  create_key=_descriptor._internal_create_key,
-  serialized_start=109,
-  serialized_end=206,
-  methods=[
-  _descriptor.MethodDescriptor(
-    name='GetMicroServiceResponse',
-    full_name='microservice.MicroService.GetMicroServiceResponse',
-    index=0,
-    containing_service=None,
-    input_type=_MESSAGE,
-    output_type=_MESSAGERESPONSE,
-    serialized_options=None,
-    create_key=_descriptor._internal_create_key,
-  ),
-])
-_sym_db.RegisterServiceDescriptor(_MICROSERVICE)
-
-DESCRIPTOR.services_by_name['MicroService'] = _MICROSERVICE
-
+  DESCRIPTOR._options = None
+  _MESSAGE._serialized_start=27
+  _MESSAGE._serialized_end=81
+  _MESSAGERESPONSE._serialized_start=83
+  _MESSAGERESPONSE._serialized_end=152
+  _MICROSERVICE._serialized_start=155
+  _MICROSERVICE._serialized_end=342
 # @@protoc_insertion_point(module_scope)
@@ -19,6 +19,11 @@ class MicroServiceStub(object):
                 request_serializer=mub__pb2.Message.SerializeToString,
                 response_deserializer=mub__pb2.MessageResponse.FromString,
                 )
+        self.StreamMicroServiceResponse = channel.stream_stream(
+                '/microservice.MicroService/StreamMicroServiceResponse',
+                request_serializer=mub__pb2.Message.SerializeToString,
+                response_deserializer=mub__pb2.MessageResponse.FromString,
+                )
 
 
 class MicroServiceServicer(object):
@@ -33,6 +38,13 @@ class MicroServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamMicroServiceResponse(self, request_iterator, context):
+        """Bidirectional stream of requests and responses on a single call.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_MicroServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -41,6 +53,11 @@ def add_MicroServiceServicer_to_server(servicer, server):
                     request_deserializer=mub__pb2.Message.FromString,
                     response_serializer=mub__pb2.MessageResponse.SerializeToString,
             ),
+            'StreamMicroServiceResponse': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamMicroServiceResponse,
+                    request_deserializer=mub__pb2.Message.FromString,
+                    response_serializer=mub__pb2.MessageResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'microservice.MicroService', rpc_method_handlers)
@@ -67,3 +84,20 @@ class MicroService(object):
             mub__pb2.MessageResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamMicroServiceResponse(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/microservice.MicroService/StreamMicroServiceResponse',
+            mub__pb2.Message.SerializeToString,
+            mub__pb2.MessageResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)